@@ -1,3 +1,13 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import NotificationPreference
+
+
+class NotificationPreferenceAdmin(admin.ModelAdmin):
+    list_display = ['user', 'announcement_delivery', 'last_digest_at']
+    list_filter = ['announcement_delivery']
+    list_select_related = ['user']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+
+admin.site.register(NotificationPreference, NotificationPreferenceAdmin)
@@ -1,6 +1,13 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import UserCreationForm, PasswordResetForm
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.template import loader
+from django.utils import timezone
+
+from core.mail import enqueue, get_setting as mail_setting
+
+from .models import NotificationPreference
 
 class RegisterForm(UserCreationForm):
     email = forms.EmailField(label='E-mail')
@@ -31,4 +38,45 @@ class EditAccountForm(forms.ModelForm):
 
     class Meta:
         model = User
-        fields = ['username', 'email', 'first_name', 'last_name']
\ No newline at end of file
+        fields = ['username', 'email', 'first_name', 'last_name']
+
+
+class NotificationPreferenceForm(forms.ModelForm):
+
+    def save(self, commit=True):
+        preference = super().save(commit=False)
+        # Ao passar para o resumo, os anúncios anteriores já foram enviados um a um
+        if 'announcement_delivery' in self.changed_data:
+            preference.last_digest_at = timezone.now()
+        if commit:
+            preference.save()
+        return preference
+
+    class Meta:
+        model = NotificationPreference
+        fields = ['announcement_delivery']
+        widgets = {'announcement_delivery': forms.RadioSelect}
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Envia o e-mail de redefinição de senha pela fila de saída."""
+
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        if not mail_setting('ENABLED'):
+            return super().send_mail(
+                subject_template_name, email_template_name, context,
+                from_email, to_email, html_email_template_name
+            )
+        subject = ''.join(loader.render_to_string(subject_template_name, context).splitlines())
+        body_html = ''
+        if html_email_template_name is not None:
+            body_html = loader.render_to_string(html_email_template_name, context)
+        enqueue([{
+            'subject': subject,
+            'body_text': loader.render_to_string(email_template_name, context),
+            'body_html': body_html,
+            'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+            'recipients': [to_email],
+            'template_name': email_template_name,
+        }])
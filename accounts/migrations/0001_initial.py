@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-19 09:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationPreference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('announcement_delivery', models.CharField(choices=[('immediate', 'Um e-mail por anúncio'), ('digest', 'Resumo diário')], default='immediate', max_length=10, verbose_name='Entrega dos anúncios')),
+                ('last_digest_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Último resumo em')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='notification_preference', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Preferência de Notificação',
+                'verbose_name_plural': 'Preferências de Notificação',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notificationpreference',
+            index=models.Index(fields=['announcement_delivery', 'user'], name='notification_delivery_idx'),
+        ),
+    ]
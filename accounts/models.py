@@ -1,3 +1,37 @@
 from django.db import models
+from django.conf import settings
+from django.utils import timezone
 
-# Create your models here.
+
+class NotificationPreference(models.Model):
+    """
+    Preferência de entrega dos avisos de anúncios: um e-mail por anúncio ou um
+    resumo periódico (comando ``send_announcement_digest``).
+    """
+
+    IMMEDIATE = 'immediate'
+    DIGEST = 'digest'
+    DELIVERY_CHOICES = (
+        (IMMEDIATE, 'Um e-mail por anúncio'),
+        (DIGEST, 'Resumo diário'),
+    )
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, verbose_name='Usuário',
+        related_name='notification_preference', on_delete=models.CASCADE
+    )
+    announcement_delivery = models.CharField(
+        'Entrega dos anúncios', max_length=10, choices=DELIVERY_CHOICES, default=IMMEDIATE
+    )
+    # Anúncios criados depois deste instante ainda não foram resumidos
+    last_digest_at = models.DateTimeField('Último resumo em', default=timezone.now)
+
+    def __str__(self):
+        return f'{self.user} - {self.get_announcement_delivery_display()}'
+
+    class Meta:
+        verbose_name = 'Preferência de Notificação'
+        verbose_name_plural = 'Preferências de Notificação'
+        indexes = [
+            models.Index(fields=['announcement_delivery', 'user'], name='notification_delivery_idx'),
+        ]
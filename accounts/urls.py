@@ -12,5 +12,6 @@ urlpatterns = [
     path('cadastre-se/', accounts_views.register, name='register'),
     path('editar/', accounts_views.edit, name='edit'),
     path('editar-senha/', accounts_views.edit_password, name='edit_password'),
+    path('notificacoes/', accounts_views.notifications, name='notifications'),
     
 ]
\ No newline at end of file
@@ -4,7 +4,8 @@ from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 
-from .forms import RegisterForm, EditAccountForm
+from .forms import RegisterForm, EditAccountForm, NotificationPreferenceForm
+from .models import NotificationPreference
 
 @login_required
 def dashboard(request):
@@ -61,3 +62,21 @@ def edit_password(request):
         form = PasswordChangeForm(user=request.user)
     context['form'] = form
     return render(request, template_name, context)
+
+
+@login_required
+def notifications(request):
+    template_name = 'accounts/notifications.html'
+    context = {}
+    preference = NotificationPreference.objects.filter(user=request.user).first()
+    if preference is None:
+        preference = NotificationPreference(user=request.user)
+    if request.method == 'POST':
+        form = NotificationPreferenceForm(request.POST, instance=preference)
+        if form.is_valid():
+            form.save()
+            context['success'] = True
+    else:
+        form = NotificationPreferenceForm(instance=preference)
+    context['form'] = form
+    return render(request, template_name, context)
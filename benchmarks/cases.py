@@ -0,0 +1,115 @@
+"""
+Casos de benchmark para ProgressManager, CertificateManager e as views mais
+acessadas. Cada caso recebe o índice da iteração e executa uma operação.
+"""
+import random
+
+from django.test import Client
+from django.urls import reverse
+
+from cursos.models import Enrollment, LessonProgress, Lesson, Certificate
+from cursos.progress import ProgressManager, CertificateManager
+
+
+class BenchmarkCases:
+    """
+    Prepara amostras do banco (matrículas, aulas pendentes, certificados) e
+    expõe cada benchmark como um método ``bench_<nome>``.
+    """
+
+    def __init__(self, seed=42, sample_size=200):
+        self.rng = random.Random(seed)
+        enrollments = list(
+            Enrollment.objects.filter(status=1).select_related('user', 'course')
+            .order_by('pk')[:sample_size * 5]
+        )
+        self.rng.shuffle(enrollments)
+        self.enrollments = enrollments[:sample_size]
+        self.users = list({enrollment.user_id: enrollment.user for enrollment in self.enrollments}.values())
+        self.pending = self._pending_lessons()
+        self.certificates = list(
+            Certificate.objects.select_related('user', 'course').order_by('pk')[:sample_size]
+        )
+        # Login fora da medição: cada usuário da amostra já tem seu Client
+        self.clients = {}
+        for user in self.users:
+            self._client(user)
+
+    def _pending_lessons(self):
+        """Pares (usuário, aula) ainda não concluídos, para marcar como completos."""
+        pending = []
+        for enrollment in self.enrollments:
+            done = set(LessonProgress.objects.filter(
+                user=enrollment.user, lesson__course=enrollment.course, completed=True
+            ).values_list('lesson_id', flat=True))
+            for lesson in Lesson.objects.filter(course=enrollment.course).select_related('course'):
+                if lesson.pk not in done:
+                    pending.append((enrollment.user, lesson))
+        self.rng.shuffle(pending)
+        return pending
+
+    def available(self):
+        """Nomes dos benchmarks que têm dados suficientes para rodar."""
+        names = []
+        for name in dir(self):
+            if not name.startswith('bench_'):
+                continue
+            if name == 'bench_mark_lesson_complete' and not self.pending:
+                continue
+            if name == 'bench_generate_certificate_pdf' and not self.certificates:
+                continue
+            if not self.enrollments:
+                continue
+            names.append(name[len('bench_'):])
+        return sorted(names)
+
+    def _pick(self, items, i):
+        return items[i % len(items)]
+
+    def _client(self, user):
+        client = self.clients.get(user.pk)
+        if client is None:
+            client = Client()
+            client.force_login(user)
+            self.clients[user.pk] = client
+        return client
+
+    def _get(self, i, url):
+        user = self._pick(self.enrollments, i).user
+        response = self._client(user).get(url)
+        if response.status_code != 200:
+            raise AssertionError('%s retornou %d' % (url, response.status_code))
+
+    # ProgressManager
+
+    def bench_mark_lesson_complete(self, i):
+        user, lesson = self._pick(self.pending, i)
+        ProgressManager.mark_lesson_complete(user, lesson)
+
+    def bench_get_course_progress(self, i):
+        enrollment = self._pick(self.enrollments, i)
+        ProgressManager.get_course_progress(enrollment.user, enrollment.course)
+
+    def bench_get_user_courses_progress(self, i):
+        ProgressManager.get_user_courses_progress(self._pick(self.users, i))
+
+    # CertificateManager
+
+    def bench_generate_certificate_pdf(self, i):
+        CertificateManager.generate_certificate_pdf(self._pick(self.certificates, i))
+
+    # Views
+
+    def bench_view_index(self, i):
+        self._get(i, reverse('cursos:index'))
+
+    def bench_view_details(self, i):
+        course = self._pick(self.enrollments, i).course
+        self._get(i, reverse('cursos:details', kwargs={'slug': course.slug}))
+
+    def bench_view_lessons(self, i):
+        course = self._pick(self.enrollments, i).course
+        self._get(i, reverse('cursos:lessons', kwargs={'slug': course.slug}))
+
+    def bench_view_dashboard(self, i):
+        self._get(i, reverse('cursos:dashboard'))
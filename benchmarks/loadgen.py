@@ -0,0 +1,282 @@
+"""
+Gerador de carga HTTP baseado em asyncio, sem dependências externas.
+
+Cada usuário virtual faz login com um aluno sintético e repete sessões
+realistas contra um servidor local (runserver, gunicorn, uvicorn...):
+lista de aulas, aula, marcar aula como completa e download do certificado.
+"""
+import asyncio
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from .runner import percentile
+
+# Limites (em ms) dos buckets do histograma de latência
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class RateLimiter:
+    """
+    Espaça as requisições de todos os usuários virtuais para respeitar uma
+    taxa global (requisições por segundo). ``rate=None`` não limita.
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(self.next_slot, now) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class HttpResponse:
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class HttpClient:
+    """
+    Cliente HTTP/1.1 mínimo com keep-alive e cookies, suficiente para
+    conversar com o Django (Content-Length ou chunked).
+    """
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.cookies = {}
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, data=None, headers=None):
+        body = urlencode(data).encode() if data is not None else b''
+        lines = [
+            '%s %s HTTP/1.1' % (method, path),
+            'Host: %s:%d' % (self.host, self.port),
+            'Connection: keep-alive',
+            'Content-Length: %d' % len(body),
+        ]
+        if data is not None:
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join('%s=%s' % item for item in self.cookies.items()))
+        for name, value in (headers or {}).items():
+            lines.append('%s: %s' % (name, value))
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self.writer.write(payload)
+                await self.writer.drain()
+                return await asyncio.wait_for(self._read_response(), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Conexão keep-alive fechada pelo servidor: tenta uma nova
+                await self.close()
+                if attempt:
+                    raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'set-cookie':
+                cookie = SimpleCookie()
+                cookie.load(value)
+                for key, morsel in cookie.items():
+                    self.cookies[key] = morsel.value
+            headers[name] = value
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b'\r\n')
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return HttpResponse(status, headers, body)
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def add(self, latency, status, ok):
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not ok:
+            self.errors += 1
+
+    def summary(self, elapsed):
+        count = len(self.latencies)
+        histogram = {}
+        for bound in HISTOGRAM_BUCKETS:
+            histogram['<=%dms' % bound] = sum(
+                1 for latency in self.latencies if latency * 1000 <= bound
+            )
+        histogram['+Inf'] = count
+        return {
+            'requests': count,
+            'errors': self.errors,
+            'error_rate': round(self.errors / count, 4) if count else 0.0,
+            'throughput_rps': round(count / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(self.latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(self.latencies, 99) * 1000, 2),
+            # Códigos HTTP (int) e 'conexao' juntos: ordena pelo texto
+            'statuses': {
+                str(status): total
+                for status, total in sorted(self.statuses.items(), key=lambda item: str(item[0]))
+            },
+            'histogram': histogram,
+        }
+
+
+class LoadGenerator:
+    """
+    Executa ``plans`` (um por usuário virtual) até acabar ``duration``
+    segundos. Cada plano é um dict com ``username`` e a lista de ``steps``
+    (nome, método, url, status esperados) montada pelo comando.
+    """
+
+    def __init__(self, base_url, login_url, password, plans, duration, rate=None, think_time=0.0,
+                 login_first=False):
+        self.base_url = base_url
+        self.login_url = login_url
+        self.password = password
+        self.plans = plans
+        self.duration = duration
+        self.limiter = RateLimiter(rate)
+        self.think_time = think_time
+        # Com login_first todos os usuários entram antes de o relógio começar e
+        # os logins ficam fora da vazão medida
+        self.login_first = login_first
+        self.stats = {}
+        self.login_stats = {}
+        self.start = self.deadline = None
+        self.pending_logins = 0
+        self.started = None
+
+    def record(self, name, latency, status, ok):
+        self.stats.setdefault(name, EndpointStats()).add(latency, status, ok)
+
+    async def timed(self, client, name, method, path, expected, data=None, headers=None):
+        await self.limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, data=data, headers=headers)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            self.record(name, time.perf_counter() - start, 'conexao', False)
+            await client.close()
+            return None
+        self.record(name, time.perf_counter() - start, response.status, response.status in expected)
+        return response
+
+    async def login(self, client, username):
+        await self.timed(client, 'login_form', 'GET', self.login_url, (200,))
+        response = await self.timed(
+            client, 'login', 'POST', self.login_url, (302,),
+            data={
+                'username': username,
+                'password': self.password,
+                'csrfmiddlewaretoken': client.cookies.get('csrftoken', ''),
+            },
+        )
+        return response is not None and response.status == 302
+
+    def start_clock(self):
+        self.start = time.monotonic()
+        self.deadline = self.start + self.duration
+
+    async def virtual_user(self, plan):
+        client = HttpClient(self.base_url)
+        try:
+            logged_in = await self.login(client, plan['username'])
+            if self.login_first:
+                self.pending_logins -= 1
+                if not self.pending_logins:
+                    self.login_stats = {
+                        name: self.stats.pop(name) for name in ('login_form', 'login') if name in self.stats
+                    }
+                    self.start_clock()
+                    self.started.set()
+                await self.started.wait()
+            if not logged_in:
+                return
+            step = 0
+            while time.monotonic() < self.deadline:
+                name, method, path, expected = plan['steps'][step % len(plan['steps'])]
+                headers = {'X-CSRFToken': client.cookies.get('csrftoken', '')} if method == 'POST' else None
+                await self.timed(client, name, method, path, expected, headers=headers)
+                step += 1
+                if self.think_time:
+                    await asyncio.sleep(self.think_time)
+        finally:
+            await client.close()
+
+    async def run(self):
+        if self.login_first:
+            self.pending_logins = len(self.plans)
+            self.started = asyncio.Event()
+        else:
+            self.start_clock()
+        await asyncio.gather(*(self.virtual_user(plan) for plan in self.plans))
+        elapsed = time.monotonic() - self.start
+        endpoints = {name: stats.summary(elapsed) for name, stats in sorted(self.stats.items())}
+        total = sum(endpoint['requests'] for endpoint in endpoints.values())
+        errors = sum(endpoint['errors'] for endpoint in endpoints.values())
+        return {
+            'elapsed_s': round(elapsed, 2),
+            'virtual_users': len(self.plans),
+            'requests': total,
+            'errors': errors,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'endpoints': endpoints,
+            'logins': {
+                name: stats.summary(elapsed) for name, stats in sorted(self.login_stats.items())
+            },
+        }
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from benchmarks.loadgen import LoadGenerator
+from benchmarks.management.commands.loadtest import Command as LoadTestCommand
+from cursos.dataset import DEFAULT_PASSWORD
+
+WSGI_COMMAND = (
+    '{python} -m gunicorn simplemooc.wsgi:application --bind 127.0.0.1:{port} '
+    '--workers {workers} --threads {threads} --worker-class gthread'
+)
+ASGI_COMMAND = (
+    '{python} -m uvicorn simplemooc.asgi:application --port {port} '
+    '--workers {workers} --log-level warning'
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara a vazão das APIs de progresso servidas por WSGI (gunicorn, views '
+        'síncronas) e por ASGI (uvicorn, views assíncronas) com a mesma carga concorrente'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Usuários virtuais simultâneos')
+        parser.add_argument('--duration', type=float, default=20, help='Duração de cada rodada (s)')
+        parser.add_argument('--workers', type=int, default=1, help='Processos de cada servidor')
+        parser.add_argument('--threads', type=int, default=8, help='Threads por processo WSGI')
+        parser.add_argument('--prefix', default='sintetico')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument('--scenario', default='progress', choices=['session', 'progress'])
+        parser.add_argument(
+            '--wsgi-cmd', default=WSGI_COMMAND,
+            help='Comando do servidor WSGI ({python}, {port}, {workers}, {threads})'
+        )
+        parser.add_argument('--asgi-cmd', default=ASGI_COMMAND, help='Comando do servidor ASGI')
+        parser.add_argument('--startup-timeout', type=float, default=30)
+        parser.add_argument('--json', action='store_true', help='Saída em JSON')
+
+    def run_server(self, name, command, env, plans, options):
+        port = free_port()
+        args = shlex.split(command.format(
+            python=sys.executable, port=port,
+            workers=options['workers'], threads=options['threads'],
+        ))
+        self.stderr.write('%s: %s' % (name, ' '.join(args)))
+        process = subprocess.Popen(args, env=dict(os.environ, **env))
+        try:
+            if not wait_for_port(port, process, options['startup_timeout']):
+                raise CommandError('%s não respondeu na porta %d' % (name, port))
+            generator = LoadGenerator(
+                base_url='http://127.0.0.1:%d' % port,
+                login_url=reverse('accounts:login'),
+                password=options['password'],
+                plans=plans,
+                duration=options['duration'],
+                login_first=True,
+            )
+            return asyncio.run(generator.run())
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def handle(self, *args, **options):
+        plans = LoadTestCommand().build_plans(options)
+        if not plans:
+            raise CommandError(
+                'Nenhum aluno "%s*" matriculado. Gere dados com '
+                'python manage.py populate_db --users N --courses N' % options['prefix']
+            )
+
+        reports = {
+            'wsgi': self.run_server(
+                'wsgi', options['wsgi_cmd'], {'SIMPLEMOOC_ASYNC_PROGRESS_VIEWS': '0'}, plans, options
+            ),
+            'asgi': self.run_server(
+                'asgi', options['asgi_cmd'], {'SIMPLEMOOC_ASYNC_PROGRESS_VIEWS': '1'}, plans, options
+            ),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+
+        self.stdout.write('%d usuários virtuais, %ss por servidor' % (len(plans), options['duration']))
+        self.stdout.write('%-6s %-24s %8s %8s %9s %9s %9s' % (
+            'modo', 'endpoint', 'req/s', 'erros%', 'p50 ms', 'p95 ms', 'p99 ms'
+        ))
+        for mode, report in reports.items():
+            self.stdout.write('%-6s %-24s %8.1f %8.2f' % (
+                mode, 'total', report['throughput_rps'],
+                report['errors'] * 100 / report['requests'] if report['requests'] else 0,
+            ))
+            for name, endpoint in report['endpoints'].items():
+                self.stdout.write('%-6s %-24s %8.1f %8.2f %9.2f %9.2f %9.2f' % (
+                    mode, name, endpoint['throughput_rps'], endpoint['error_rate'] * 100,
+                    endpoint['p50_ms'], endpoint['p95_ms'], endpoint['p99_ms'],
+                ))
+        wsgi, asgi = reports['wsgi']['throughput_rps'], reports['asgi']['throughput_rps']
+        if wsgi:
+            self.stdout.write('\nASGI/WSGI: %.2fx' % (asgi / wsgi))
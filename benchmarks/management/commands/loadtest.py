@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from benchmarks.loadgen import LoadGenerator
+from cursos.dataset import DEFAULT_PASSWORD
+from cursos.models import Enrollment, Lesson
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera carga HTTP concorrente contra um servidor local, simulando alunos: '
+        'aulas, aula, marcar como completa e download do certificado'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Servidor alvo')
+        parser.add_argument('--users', type=int, default=50, help='Usuários virtuais simultâneos')
+        parser.add_argument('--duration', type=float, default=30, help='Duração em segundos')
+        parser.add_argument(
+            '--rate', type=float,
+            help='Limite global de requisições por segundo (padrão: sem limite)'
+        )
+        parser.add_argument('--think-time', type=float, default=0.0, help='Pausa entre passos (s)')
+        parser.add_argument(
+            '--prefix', default='sintetico',
+            help='Prefixo dos alunos gerados pelo populate_db --users'
+        )
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument(
+            '--scenario', default='session', choices=['session', 'progress'],
+            help='session: aulas, aula, completar e certificado; '
+                 'progress: só as APIs de progresso (completar, progresso, descompletar)'
+        )
+        parser.add_argument('--json', action='store_true', help='Saída em JSON')
+
+    def build_plans(self, options):
+        """
+        Monta uma sessão por usuário virtual a partir das matrículas dos
+        alunos sintéticos (o banco é o mesmo do servidor local).
+        """
+        enrollments = list(
+            Enrollment.objects.filter(status=1, user__username__startswith=options['prefix'])
+            .select_related('user', 'course').order_by('user_id')[:options['users']]
+        )
+        lessons = {}
+        for lesson_id, course_id in Lesson.objects.filter(
+            course__in={enrollment.course_id for enrollment in enrollments}
+        ).values_list('pk', 'course_id'):
+            lessons.setdefault(course_id, []).append(lesson_id)
+
+        plans = []
+        for enrollment in enrollments:
+            slug = enrollment.course.slug
+            steps = []
+            for lesson_id in lessons.get(enrollment.course_id, []):
+                if options.get('scenario') == 'progress':
+                    steps.extend([
+                        ('mark_lesson_complete', 'POST',
+                         reverse('cursos:mark_lesson_complete', args=[slug, lesson_id]), (200,)),
+                        ('course_progress', 'GET', reverse('cursos:course_progress', args=[slug]), (200,)),
+                        ('mark_lesson_incomplete', 'POST',
+                         reverse('cursos:mark_lesson_incomplete', args=[slug, lesson_id]), (200,)),
+                    ])
+                    continue
+                steps.extend([
+                    ('lessons', 'GET', reverse('cursos:lessons', args=[slug]), (200,)),
+                    ('lesson', 'GET', reverse('cursos:lesson', args=[slug, lesson_id]), (200,)),
+                    ('mark_lesson_complete', 'POST',
+                     reverse('cursos:mark_lesson_complete', args=[slug, lesson_id]), (200,)),
+                    ('download_certificate', 'GET',
+                     reverse('cursos:download_certificate', args=[slug]), (200, 404)),
+                ])
+            if steps:
+                plans.append({'username': enrollment.user.username, 'steps': steps})
+        return plans
+
+    def handle(self, *args, **options):
+        plans = self.build_plans(options)
+        if not plans:
+            raise CommandError(
+                'Nenhum aluno "%s*" matriculado. Gere dados com '
+                'python manage.py populate_db --users N --courses N' % options['prefix']
+            )
+
+        self.stderr.write(
+            'Gerando carga em %s com %d usuários por %ss...'
+            % (options['url'], len(plans), options['duration'])
+        )
+        generator = LoadGenerator(
+            base_url=options['url'],
+            login_url=reverse('accounts:login'),
+            password=options['password'],
+            plans=plans,
+            duration=options['duration'],
+            rate=options['rate'],
+            think_time=options['think_time'],
+        )
+        report = asyncio.run(generator.run())
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            '%d requisições em %.1fs: %.1f req/s, %d erros'
+            % (report['requests'], report['elapsed_s'], report['throughput_rps'], report['errors'])
+        )
+        self.stdout.write('%-22s %8s %8s %8s %9s %9s %9s' % (
+            'endpoint', 'reqs', 'req/s', 'erros%', 'p50 ms', 'p95 ms', 'p99 ms'
+        ))
+        for name, endpoint in report['endpoints'].items():
+            self.stdout.write('%-22s %8d %8.1f %8.2f %9.2f %9.2f %9.2f' % (
+                name, endpoint['requests'], endpoint['throughput_rps'],
+                endpoint['error_rate'] * 100,
+                endpoint['p50_ms'], endpoint['p95_ms'], endpoint['p99_ms'],
+            ))
+        for name, endpoint in report['endpoints'].items():
+            self.stdout.write('\n%s' % name)
+            previous = 0
+            for bucket, total in endpoint['histogram'].items():
+                count = total - previous
+                previous = total
+                self.stdout.write('  %-9s %8d %s' % (bucket, count, '#' * min(count, 60)))
@@ -0,0 +1,102 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from benchmarks import runner
+from benchmarks.cases import BenchmarkCases
+from cursos.dataset import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Executa os benchmarks de ProgressManager, CertificateManager e das views '
+        'em um banco de teste populado na escala escolhida'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--courses', type=int, default=20)
+        parser.add_argument('--lessons-per-course', type=int, default=20)
+        parser.add_argument('--completion-ratio', type=float, default=0.4)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument(
+            '--only', action='append', default=[],
+            help='Executa apenas o benchmark indicado (pode repetir)'
+        )
+        parser.add_argument('--output', help='Grava o relatório JSON neste arquivo')
+        parser.add_argument('--baseline', help='Compara com este relatório JSON salvo anteriormente')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Aumento de p95 aceito em relação ao baseline (0.25 = 25%%)'
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Reaproveita o banco de teste')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = runner.load_baseline(options['baseline'])
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError('Baseline inválido: %s' % e)
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        self.stdout.write(output)
+        if options['output']:
+            runner.save_report(report, options['output'])
+
+        if baseline is not None:
+            regressions = runner.compare(report['results'], baseline, options['tolerance'])
+            if regressions:
+                for message in regressions:
+                    self.stderr.write(self.style.ERROR('REGRESSÃO ' + message))
+                raise CommandError('%d regressão(ões) em relação ao baseline.' % len(regressions))
+            self.stderr.write(self.style.SUCCESS('Sem regressões em relação ao baseline.'))
+
+    def run(self, options):
+        scale = {
+            'users': options['users'],
+            'courses': options['courses'],
+            'lessons_per_course': options['lessons_per_course'],
+            'completion_ratio': options['completion_ratio'],
+            'seed': options['seed'],
+        }
+        if not options['keepdb'] or not DatasetGenerator.exists('bench'):
+            DatasetGenerator(prefix='bench', **scale).run()
+
+        cases = BenchmarkCases(seed=options['seed'], sample_size=options['iterations'] * 2)
+        names = cases.available()
+        if options['only']:
+            unknown = set(options['only']) - set(names)
+            if unknown:
+                raise CommandError('Benchmarks desconhecidos: %s' % ', '.join(sorted(unknown)))
+            names = [name for name in names if name in options['only']]
+
+        results = {}
+        for name in names:
+            self.stderr.write('Executando %s...' % name)
+            results[name] = runner.measure(getattr(cases, 'bench_' + name), options['iterations'])
+
+        return {
+            'meta': {
+                'scale': scale,
+                'iterations': options['iterations'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'results': results,
+        }
@@ -0,0 +1,85 @@
+"""
+Medição de tempo e de queries para os benchmarks, cálculo de percentis e
+comparação com um arquivo de baseline.
+"""
+import json
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, pct):
+    """Percentil ``pct`` (0-100) com interpolação linear."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def measure(operation, iterations, warmup=1):
+    """
+    Executa ``operation(i)`` ``iterations`` vezes (após ``warmup`` execuções
+    descartadas) e retorna latências, vazão e queries por operação.
+    """
+    for i in range(warmup):
+        operation(i)
+
+    timings = []
+    queries = 0
+    for i in range(warmup, warmup + iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            operation(i)
+            timings.append(time.perf_counter() - start)
+        queries += len(context)
+
+    total = sum(timings)
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'mean_ms': round(total / iterations * 1000, 3) if iterations else 0.0,
+        'ops_per_sec': round(iterations / total, 1) if total else 0.0,
+        'queries_per_op': round(queries / iterations, 2) if iterations else 0.0,
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compara os resultados com o baseline. Uma regressão é um p95 acima de
+    ``(1 + tolerance)`` vezes o do baseline ou qualquer aumento de queries
+    por operação. Retorna a lista de mensagens de regressão.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        limit = previous['p95_ms'] * (1 + tolerance)
+        if current['p95_ms'] > limit:
+            regressions.append(
+                '%s: p95 %.3fms > %.3fms (baseline %.3fms + %d%%)'
+                % (name, current['p95_ms'], limit, previous['p95_ms'], tolerance * 100)
+            )
+        if current['queries_per_op'] > previous['queries_per_op']:
+            regressions.append(
+                '%s: %.2f queries/op > baseline %.2f'
+                % (name, current['queries_per_op'], previous['queries_per_op'])
+            )
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,107 @@
+"""
+Testes do runner de benchmarks
+
+Execute com: python manage.py test benchmarks.tests
+"""
+
+import asyncio
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, LiveServerTestCase, override_settings
+from django.urls import reverse
+
+from benchmarks import runner
+from benchmarks.loadgen import EndpointStats, LoadGenerator
+from benchmarks.management.commands.loadtest import Command as LoadTestCommand
+from cursos.dataset import DatasetGenerator, DEFAULT_PASSWORD
+
+
+class RunnerTests(SimpleTestCase):
+    """Testes para percentis e comparação com baseline"""
+
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(runner.percentile(values, 50), 50.5)
+        self.assertAlmostEqual(runner.percentile(values, 95), 95.05)
+        self.assertEqual(runner.percentile(values, 100), 100.0)
+        self.assertEqual(runner.percentile([], 99), 0.0)
+
+    def test_compare_detects_regressions(self):
+        baseline = {'view_index': {'p95_ms': 10.0, 'queries_per_op': 3.0}}
+
+        ok = {'view_index': {'p95_ms': 12.0, 'queries_per_op': 3.0}}
+        self.assertEqual(runner.compare(ok, baseline, tolerance=0.25), [])
+
+        slower = {'view_index': {'p95_ms': 13.0, 'queries_per_op': 3.0}}
+        self.assertEqual(len(runner.compare(slower, baseline, tolerance=0.25)), 1)
+
+        more_queries = {'view_index': {'p95_ms': 10.0, 'queries_per_op': 4.0}}
+        self.assertEqual(len(runner.compare(more_queries, baseline)), 1)
+
+        new_benchmark = {'view_lessons': {'p95_ms': 99.0, 'queries_per_op': 9.0}}
+        self.assertEqual(runner.compare(new_benchmark, baseline), [])
+
+    def test_endpoint_stats_histogram_is_cumulative(self):
+        stats = EndpointStats()
+        for latency, status in [(0.002, 200), (0.030, 200), (0.300, 500)]:
+            stats.add(latency, status, status == 200)
+
+        summary = stats.summary(elapsed=1.0)
+        self.assertEqual(summary['requests'], 3)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['histogram']['<=5ms'], 1)
+        self.assertEqual(summary['histogram']['<=50ms'], 2)
+        self.assertEqual(summary['histogram']['+Inf'], 3)
+
+    def test_summary_with_connection_errors(self):
+        stats = EndpointStats()
+        stats.add(0.010, 200, True)
+        stats.add(0.500, 'conexao', False)
+
+        summary = stats.summary(elapsed=1.0)
+        self.assertEqual(summary['statuses'], {'200': 1, 'conexao': 1})
+        self.assertEqual(summary['errors'], 1)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class LoadGeneratorTests(LiveServerTestCase):
+    """Testes para o gerador de carga HTTP contra um servidor real"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_session_against_live_server(self):
+        DatasetGenerator(users=2, courses=1, lessons_per_course=2, prefix='carga').run()
+        plans = LoadTestCommand().build_plans({'prefix': 'carga', 'users': 2})
+        generator = LoadGenerator(
+            base_url=self.live_server_url, login_url=reverse('accounts:login'),
+            password=DEFAULT_PASSWORD, plans=plans, duration=1, rate=50,
+        )
+        report = asyncio.run(generator.run())
+
+        self.assertEqual(report['virtual_users'], 2)
+        self.assertEqual(report['errors'], 0, report['endpoints'])
+        self.assertIn('mark_lesson_complete', report['endpoints'])
+        self.assertEqual(report['endpoints']['login']['statuses'], {'302': 2})
+
+    def test_progress_scenario_logs_in_before_the_clock(self):
+        DatasetGenerator(users=2, courses=1, lessons_per_course=2, prefix='carga').run()
+        plans = LoadTestCommand().build_plans({'prefix': 'carga', 'users': 2, 'scenario': 'progress'})
+        generator = LoadGenerator(
+            base_url=self.live_server_url, login_url=reverse('accounts:login'),
+            password=DEFAULT_PASSWORD, plans=plans, duration=1, rate=50, login_first=True,
+        )
+        report = asyncio.run(generator.run())
+
+        self.assertEqual(report['errors'], 0, report['endpoints'])
+        self.assertEqual(
+            sorted(report['endpoints']),
+            ['course_progress', 'mark_lesson_complete', 'mark_lesson_incomplete'],
+        )
+        self.assertEqual(report['logins']['login']['statuses'], {'302': 2})
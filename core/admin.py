@@ -1,3 +1,21 @@
 from django.contrib import admin
+from django.utils import timezone
 
-# Register your models here.
+from .models import OutboundMessage
+
+
+class OutboundMessageAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'template_name', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'template_name']
+    search_fields = ['subject']
+    readonly_fields = ['created_at', 'sent_at', 'attempts', 'last_error']
+    actions = ['retry_now']
+
+    @admin.action(description='Tentar enviar novamente')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboundMessage.SENT).update(
+            status=OutboundMessage.PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, '%d mensagens voltaram para a fila.' % updated)
+
+admin.site.register(OutboundMessage, OutboundMessageAdmin)
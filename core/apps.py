@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import instrumentation, slowqueries
+        connection_created.connect(instrumentation.install, dispatch_uid='core.instrumentation')
+        connection_created.connect(slowqueries.install, dispatch_uid='core.slowqueries')
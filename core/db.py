@@ -0,0 +1,44 @@
+"""
+Utilitários de banco de dados compartilhados pelos apps.
+"""
+from django.db import connection
+
+UPSERT_BATCH_SIZE = 200
+
+# Menor de dois valores: MIN com dois argumentos no SQLite, LEAST no PostgreSQL
+LEAST_FUNCTIONS = {'sqlite': 'MIN', 'postgresql': 'LEAST'}
+
+
+def upsert_add(model, keys, counters, rows, limits=None):
+    """
+    INSERT ... ON CONFLICT (keys) DO UPDATE somando ``counters`` ao valor
+    gravado, em lotes de várias linhas (SQLite 3.24+ e PostgreSQL).
+    ``limits`` (``{contador: máximo}``) limita a soma no próprio SQL, então
+    o teto vale mesmo com vários processos gravando a mesma chave.
+    """
+    limits = limits or {}
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in keys + counters]
+    columns = [quote(field.column) for field in fields]
+    sums = []
+    for name, column in zip(counters, columns[len(keys):]):
+        total = '%s.%s + EXCLUDED.%s' % (table, column, column)
+        if name in limits:
+            total = '%s(%s, %d)' % (LEAST_FUNCTIONS[connection.vendor], total, limits[name])
+        sums.append('%s = %s' % (column, total))
+    sums = ', '.join(sums)
+    placeholder = '(%s)' % ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                'INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO UPDATE SET %s' % (
+                    table, ', '.join(columns), ', '.join([placeholder] * len(batch)),
+                    ', '.join(columns[:len(keys)]), sums,
+                ),
+                [
+                    field.get_db_prep_value(value, connection)
+                    for row in batch for field, value in zip(fields, row)
+                ],
+            )
@@ -0,0 +1,46 @@
+"""
+Validação condicional (ETag / Last-Modified) para views que calculam o
+próprio estado antes de montar a resposta.
+
+Uso::
+
+    etag = make_etag(...)
+    not_modified = conditional_response(request, etag, last_modified)
+    if not_modified:
+        return not_modified
+    response = JsonResponse(...)
+    return set_validators(response, etag, last_modified)
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """ETag forte a partir de valores simples (ids, datas, contadores)."""
+    raw = '|'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+def conditional_response(request, etag, last_modified=None):
+    """Resposta 304/412 se as condições da requisição casarem, senão ``None``."""
+    response = get_conditional_response(
+        request, etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    Grava ETag/Last-Modified e marca a resposta como privada e sempre
+    revalidada: o cliente reaproveita o corpo guardado após um 304.
+    """
+    response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
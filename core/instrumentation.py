@@ -0,0 +1,259 @@
+"""
+Instrumentação por requisição: quantidade de queries, tempo total de SQL,
+queries mais lentas, tempo de renderização de templates e tempo total,
+agregados por nome de URL resolvida.
+"""
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger('simplemooc.instrumentation')
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Fração das requisições enviadas ao log estruturado (0.0 a 1.0)
+    'LOG_SAMPLE_RATE': 1.0,
+    # Quantas queries mais lentas guardar por requisição e por view
+    'SLOWEST_QUERIES': 5,
+    # Limite de queries por view, ex.: {'cursos:dashboard': 10}
+    'QUERY_BUDGETS': {},
+    # Diretório onde cada processo grava seu agregado (None desativa)
+    'STATS_DIR': None,
+    'FLUSH_INTERVAL': 10,
+}
+
+
+def get_setting(name):
+    """Lê uma opção de ``settings.INSTRUMENTATION`` com valor padrão."""
+    return getattr(settings, 'INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+_current_recorder = ContextVar('request_recorder', default=None)
+
+
+def current_recorder():
+    """Retorna o RequestRecorder da requisição em andamento, se houver."""
+    return _current_recorder.get()
+
+
+class RequestRecorder:
+    """
+    Coleta as métricas de uma única requisição. As queries chegam por
+    ``record_query`` enquanto ele está ativo.
+    """
+
+    def __init__(self, slowest=None):
+        self.view_name = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.slowest = []
+        self.max_slowest = slowest if slowest is not None else get_setting('SLOWEST_QUERIES')
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_query(sql, time.perf_counter() - start)
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        if self.max_slowest:
+            self.slowest.append((duration, sql))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.max_slowest:]
+
+    def activate(self):
+        return _current_recorder.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        _current_recorder.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    ``execute_wrapper`` instalado em todas as conexões (ver CoreConfig.ready).
+    Conta a query no RequestRecorder ativo, lido da ContextVar: o asgiref a
+    copia para a thread do ``sync_to_async``, onde o ORM async executa as
+    queries, com uma conexão diferente da thread do event loop.
+    """
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(sender, connection, **kwargs):
+    """Receptor de ``connection_created``."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class RequestStats:
+    """
+    Agregado em memória (por processo) das métricas de cada view.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, view_name, recorder, total_time):
+        with self._lock:
+            entry = self._views.setdefault(view_name, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'sql_time': 0.0,
+                'template_time': 0.0,
+                'total_time': 0.0,
+                'max_total_time': 0.0,
+                'slowest_queries': [],
+            })
+            entry['requests'] += 1
+            entry['queries'] += recorder.queries
+            entry['max_queries'] = max(entry['max_queries'], recorder.queries)
+            entry['sql_time'] += recorder.sql_time
+            entry['template_time'] += recorder.template_time
+            entry['total_time'] += total_time
+            entry['max_total_time'] = max(entry['max_total_time'], total_time)
+            slowest = entry['slowest_queries'] + [
+                [duration, sql] for duration, sql in recorder.slowest
+            ]
+            slowest.sort(key=lambda item: item[0], reverse=True)
+            entry['slowest_queries'] = slowest[:recorder.max_slowest]
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._views))
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def maybe_flush(self):
+        """
+        Grava o agregado deste processo em ``STATS_DIR`` no máximo uma vez
+        a cada ``FLUSH_INTERVAL`` segundos.
+        """
+        stats_dir = get_setting('STATS_DIR')
+        if not stats_dir:
+            return
+        now = time.monotonic()
+        if now - self._last_flush < get_setting('FLUSH_INTERVAL'):
+            return
+        self._last_flush = now
+        self.flush(stats_dir)
+
+    def flush(self, stats_dir):
+        os.makedirs(stats_dir, exist_ok=True)
+        path = os.path.join(stats_dir, 'requests-%d.json' % os.getpid())
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+
+def merge_snapshots(snapshots):
+    """Soma os agregados de vários processos em um só."""
+    merged = {}
+    for snapshot in snapshots:
+        for view_name, entry in snapshot.items():
+            target = merged.setdefault(view_name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'sql_time': 0.0, 'template_time': 0.0, 'total_time': 0.0,
+                'max_total_time': 0.0, 'slowest_queries': [],
+            })
+            for key in ('requests', 'queries', 'sql_time', 'template_time', 'total_time'):
+                target[key] += entry[key]
+            for key in ('max_queries', 'max_total_time'):
+                target[key] = max(target[key], entry[key])
+            slowest = target['slowest_queries'] + entry['slowest_queries']
+            slowest.sort(key=lambda item: item[0], reverse=True)
+            target['slowest_queries'] = slowest[:get_setting('SLOWEST_QUERIES')]
+    return merged
+
+
+def load_snapshots(stats_dir):
+    """Lê os agregados gravados por todos os processos."""
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(stats_dir, 'requests-*.json'))):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def log_request(view_name, recorder, total_time, status_code):
+    """
+    Envia as métricas da requisição ao log estruturado (com amostragem) e
+    avisa quando o orçamento de queries da view foi ultrapassado.
+    """
+    payload = {
+        'view': view_name,
+        'status': status_code,
+        'queries': recorder.queries,
+        'sql_ms': round(recorder.sql_time * 1000, 3),
+        'template_ms': round(recorder.template_time * 1000, 3),
+        'total_ms': round(total_time * 1000, 3),
+        'slowest_queries': [
+            {'ms': round(duration * 1000, 3), 'sql': sql}
+            for duration, sql in recorder.slowest
+        ],
+    }
+    sample_rate = get_setting('LOG_SAMPLE_RATE')
+    if sample_rate >= 1 or random.random() < sample_rate:
+        logger.info(json.dumps(payload), extra={'metrics': payload})
+
+    budget = get_setting('QUERY_BUDGETS').get(view_name)
+    if budget is not None and recorder.queries > budget:
+        logger.warning(
+            'Orçamento de queries excedido em %s: %d queries (limite %d)',
+            view_name, recorder.queries, budget,
+            extra={'metrics': payload},
+        )
+
+
+def install_template_timer():
+    """
+    Envolve ``Template.render`` do backend do Django para somar o tempo de
+    renderização ao RequestRecorder ativo. Só é instalado uma vez.
+    """
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'instrumented', False):
+        return
+    original_render = Template.render
+
+    def render(self, context=None, request=None):
+        recorder = _current_recorder.get()
+        if recorder is None:
+            return original_render(self, context, request)
+        recorder._template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original_render(self, context, request)
+        finally:
+            recorder._template_depth -= 1
+            if recorder._template_depth == 0:
+                recorder.template_time += time.perf_counter() - start
+
+    render.instrumented = True
+    Template.render = render
+
+
+stats = RequestStats()
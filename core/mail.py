@@ -1,18 +1,198 @@
+"""
+Envio de e-mails por template.
+
+Com ``MAIL_QUEUE['ENABLED']`` as mensagens são gravadas na fila
+(``OutboundMessage``) e enviadas pelo comando ``send_queued_mail``, que usa
+uma conexão SMTP por lote, respeita um limite de mensagens por segundo e
+tenta de novo com espera exponencial. Sem a fila o envio é feito na hora.
+"""
+import time
+from datetime import timedelta
+
 from django.template.loader import render_to_string
 from django.template.defaultfilters import striptags
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BATCH_SIZE': 50,
+    # Mensagens por segundo (0 = sem limite)
+    'RATE_LIMIT': 10,
+    'MAX_ATTEMPTS': 5,
+    # Espera antes da 2ª tentativa, dobrando a cada falha (segundos)
+    'RETRY_BACKOFF': 60,
+    # Tempo que um lote fica reservado para o worker que o pegou (segundos)
+    'LEASE': 300,
+}
+
+MESSAGE_FIELDS = ['subject', 'body_text', 'body_html', 'from_email', 'recipients']
+
+
+def get_setting(name):
+    """Lê uma opção de ``settings.MAIL_QUEUE`` com valor padrão."""
+    return getattr(settings, 'MAIL_QUEUE', {}).get(name, DEFAULTS[name])
+
 
 def send_mail_template(subject, template_name, context, recipient_list, from_email=settings.DEFAULT_FROM_EMAIL, fail_silently=False):
 
-    message_html = render_to_string(template_name, context)
+    send_mass_mail_template(
+        subject, template_name, context, [recipient_list], from_email, fail_silently
+    )
+
+def send_mass_mail_template(subject, template_name, context, recipient_lists, from_email=settings.DEFAULT_FROM_EMAIL, fail_silently=False):
+    """
+    Renderiza o template uma vez e envia uma mensagem para cada lista de
+    destinatários (enfileiradas com um único INSERT em lote).
+    """
+    with metrics.mail_duration.time(template=template_name):
+        message_html = render_to_string(template_name, context)
+        message_txt = striptags(message_html)
+        messages = [
+            {
+                'subject': subject, 'body_text': message_txt, 'body_html': message_html,
+                'from_email': from_email, 'recipients': list(recipients),
+                'template_name': template_name,
+            }
+            for recipients in recipient_lists
+        ]
+        if get_setting('ENABLED'):
+            enqueue(messages)
+        else:
+            send_now(messages, fail_silently)
 
-    message_txt = striptags(message_html)
+def enqueue(messages):
+    from .models import OutboundMessage
+    OutboundMessage.objects.bulk_create(
+        [OutboundMessage(**message) for message in messages], batch_size=500
+    )
 
+def build_email(message, connection=None):
     email = EmailMultiAlternatives(
-        subject=subject, body=message_txt, from_email=from_email,
-        to=recipient_list
+        subject=message['subject'], body=message['body_text'],
+        from_email=message['from_email'], to=message['recipients'],
+        connection=connection
     )
-    email.attach_alternative(message_html, "text/html")
-    email.send(fail_silently=fail_silently)
-    
\ No newline at end of file
+    if message['body_html']:
+        email.attach_alternative(message['body_html'], "text/html")
+    return email
+
+def send_now(messages, fail_silently=False):
+    connection = get_connection(fail_silently=fail_silently)
+    connection.send_messages([build_email(message) for message in messages])
+    for message in messages:
+        metrics.mail_total.inc(template=message['template_name'])
+
+
+class RateLimiter:
+    """Garante no máximo ``rate`` chamadas a ``wait()`` por segundo."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self.next_at = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = self.clock()
+        if self.next_at is not None and now < self.next_at:
+            self.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+
+class OutboxWorker:
+    """
+    Esvazia a fila de saída em lotes. Cada lote é reservado (status
+    'sending' até ``LEASE`` segundos), enviado por uma única conexão e tem a
+    situação de cada mensagem gravada com um ``bulk_update``.
+    """
+
+    def __init__(self, batch_size=None, rate=None, connection_factory=get_connection,
+                 limiter=None):
+        self.batch_size = batch_size or get_setting('BATCH_SIZE')
+        rate = get_setting('RATE_LIMIT') if rate is None else rate
+        self.limiter = limiter or RateLimiter(rate)
+        self.connection_factory = connection_factory
+
+    def claim(self):
+        from .models import OutboundMessage
+
+        now = timezone.now()
+        with transaction.atomic():
+            # Mensagens 'sending' com a reserva vencida são de um worker que parou
+            batch = list(
+                OutboundMessage.objects.select_for_update(skip_locked=True).filter(
+                    status__in=[OutboundMessage.PENDING, OutboundMessage.SENDING],
+                    next_attempt_at__lte=now,
+                ).order_by('next_attempt_at', 'pk')[:self.batch_size]
+            )
+            if batch:
+                OutboundMessage.objects.filter(pk__in=[m.pk for m in batch]).update(
+                    status=OutboundMessage.SENDING,
+                    next_attempt_at=now + timedelta(seconds=get_setting('LEASE')),
+                )
+        return batch
+
+    def retry_delay(self, attempts):
+        return timedelta(seconds=get_setting('RETRY_BACKOFF') * 2 ** (attempts - 1))
+
+    def fail(self, message, error, now):
+        from .models import OutboundMessage
+
+        message.attempts += 1
+        message.last_error = str(error)[:2000] or error.__class__.__name__
+        if message.attempts >= get_setting('MAX_ATTEMPTS'):
+            message.status = OutboundMessage.FAILED
+        else:
+            message.status = OutboundMessage.PENDING
+            message.next_attempt_at = now + self.retry_delay(message.attempts)
+
+    def send_batch(self, batch):
+        from .models import OutboundMessage
+
+        connection = self.connection_factory(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            now = timezone.now()
+            for message in batch:
+                self.fail(message, e, now)
+        else:
+            try:
+                for message in batch:
+                    self.limiter.wait()
+                    try:
+                        build_email(
+                            {field: getattr(message, field) for field in MESSAGE_FIELDS}, connection
+                        ).send()
+                    except Exception as e:
+                        self.fail(message, e, timezone.now())
+                    else:
+                        message.status = OutboundMessage.SENT
+                        message.attempts += 1
+                        message.sent_at = timezone.now()
+                        message.last_error = ''
+                        metrics.mail_total.inc(template=message.template_name)
+            finally:
+                connection.close()
+        OutboundMessage.objects.bulk_update(
+            batch, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at']
+        )
+        return batch
+
+    def run_once(self):
+        """Envia lotes até a fila não ter mais mensagens prontas. Retorna a contagem por situação."""
+        counts = {}
+        while True:
+            batch = self.claim()
+            if not batch:
+                return counts
+            for message in self.send_batch(batch):
+                counts[message.status] = counts.get(message.status, 0) + 1
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = 'Gera um token assinado para perfilar uma requisição (usuário staff)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--memory', action='store_true',
+            help='Também mede alocações de memória com tracemalloc'
+        )
+
+    def handle(self, *args, **options):
+        token = profiling.make_token('memory' if options['memory'] else 'cpu')
+        header = profiling.get_setting('HEADER')
+        param = profiling.get_setting('QUERY_PARAM')
+        self.stdout.write(token)
+        self.stderr.write(
+            '\nUse o cabeçalho "%s: %s" ou ?%s=%s (válido por %ss).'
+            % (header, token, param, token, profiling.get_setting('TOKEN_MAX_AGE'))
+        )
@@ -0,0 +1,54 @@
+import glob
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import instrumentation
+
+
+class Command(BaseCommand):
+    help = 'Exibe as métricas agregadas por view gravadas pelos processos do servidor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Saída em JSON')
+        parser.add_argument(
+            '--sort', default='total_time',
+            choices=['requests', 'queries', 'sql_time', 'template_time', 'total_time'],
+            help='Campo usado para ordenar as views'
+        )
+        parser.add_argument('--reset', action='store_true', help='Apaga os agregados gravados')
+
+    def handle(self, *args, **options):
+        stats_dir = instrumentation.get_setting('STATS_DIR')
+        if not stats_dir:
+            raise CommandError('Defina INSTRUMENTATION["STATS_DIR"] nas configurações.')
+
+        if options['reset']:
+            for path in glob.glob(os.path.join(stats_dir, 'requests-*.json')):
+                os.remove(path)
+            self.stdout.write(self.style.SUCCESS('Agregados removidos.'))
+            return
+
+        merged = instrumentation.merge_snapshots(instrumentation.load_snapshots(stats_dir))
+        if options['json']:
+            self.stdout.write(json.dumps(merged, indent=2))
+            return
+
+        if not merged:
+            self.stdout.write('Nenhuma métrica registrada.')
+            return
+
+        self.stdout.write('%-35s %8s %10s %10s %10s %10s' % (
+            'view', 'reqs', 'queries/r', 'sql ms/r', 'tpl ms/r', 'total ms/r'
+        ))
+        rows = sorted(merged.items(), key=lambda item: item[1][options['sort']], reverse=True)
+        for view_name, entry in rows:
+            requests = entry['requests'] or 1
+            self.stdout.write('%-35s %8d %10.1f %10.2f %10.2f %10.2f' % (
+                view_name, entry['requests'],
+                entry['queries'] / requests,
+                entry['sql_time'] * 1000 / requests,
+                entry['template_time'] * 1000 / requests,
+                entry['total_time'] * 1000 / requests,
+            ))
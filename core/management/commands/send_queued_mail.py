@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.mail import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = (
+        'Envia os e-mails da fila de saída em lotes (uma conexão SMTP por lote), '
+        'com limite de mensagens por segundo e novas tentativas com espera exponencial'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Esvazia as mensagens prontas e termina (para uso com cron)'
+        )
+        parser.add_argument('--batch-size', type=int, help='Padrão: MAIL_QUEUE["BATCH_SIZE"]')
+        parser.add_argument(
+            '--rate', type=float, help='Mensagens por segundo (padrão: MAIL_QUEUE["RATE_LIMIT"])'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Espera entre verificações da fila quando ela está vazia (s)'
+        )
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options['batch_size'], rate=options['rate'])
+        while True:
+            counts = worker.run_once()
+            if counts:
+                self.stdout.write(', '.join(
+                    '%s: %d' % (status, total) for status, total in sorted(counts.items())
+                ))
+            if options['once']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
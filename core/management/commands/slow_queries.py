@@ -0,0 +1,54 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import slowqueries
+
+
+class Command(BaseCommand):
+    help = 'Lista as queries lentas registradas, agrupadas pelo SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10, help='Quantidade de queries listadas')
+        parser.add_argument(
+            '--sort', default='total_ms', choices=['total_ms', 'max_ms', 'count'],
+            help='Campo usado para ordenar'
+        )
+        parser.add_argument('--json', action='store_true', help='Saída em JSON')
+        parser.add_argument('--clear', action='store_true', help='Apaga o log de queries lentas')
+
+    def handle(self, *args, **options):
+        log_file = slowqueries.get_setting('LOG_FILE')
+        if not log_file:
+            raise CommandError('Defina SLOW_QUERIES["LOG_FILE"] nas configurações.')
+
+        if options['clear']:
+            if os.path.exists(log_file):
+                os.remove(log_file)
+            self.stdout.write(self.style.SUCCESS('Log de queries lentas removido.'))
+            return
+
+        rows = slowqueries.top_offenders(
+            slowqueries.load_entries(log_file), options['sort']
+        )[:options['limit']]
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2, default=str))
+            return
+
+        if not rows:
+            self.stdout.write('Nenhuma query lenta registrada.')
+            return
+
+        for position, row in enumerate(rows, 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '%d. %d ocorrências, total %.1f ms, máx %.1f ms'
+                % (position, row['count'], row['total_ms'], row['max_ms'])
+            ))
+            self.stdout.write('   %s' % row['sql'])
+            self.stdout.write('   parâmetros: %s' % row['params'])
+            self.stdout.write('   views: %s' % (', '.join(row['views']) or '-'))
+            for frame in row['frames']:
+                self.stdout.write('   origem: %s' % frame)
+            for line in row['plan'] or []:
+                self.stdout.write('   plano: %s' % line)
@@ -0,0 +1,341 @@
+"""
+Métricas no formato texto do Prometheus, sem serviços externos.
+
+Cada processo mantém seus valores em memória e os grava periodicamente em
+``METRICS['DIR']/metrics-<pid>-<token>.json`` (escrita atômica; o token é
+sorteado quando o processo sobe, então um pid reaproveitado não sobrescreve o
+arquivo de um processo encerrado). O endpoint ``/metrics`` soma os arquivos de
+todos os processos, o que funciona com vários workers do gunicorn. Os arquivos
+de processos encerrados são somados a ``aggregate.json`` e apagados, para que
+os contadores nunca diminuam sem que o diretório cresça a cada reinício.
+"""
+import atexit
+import glob
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIR': None,
+    'FLUSH_INTERVAL': 1.0,
+    # Token do coletor (Authorization: Bearer <token>); sem ele, só staff
+    'TOKEN': None,
+    # IPs liberados sem token. Vazio por padrão: atrás de um proxy local
+    # (nginx -> uvicorn) toda requisição chega de 127.0.0.1
+    'ALLOWED_IPS': [],
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+AGGREGATE_FILE = 'aggregate.json'
+LOCK_FILE = 'aggregate.lock'
+
+
+def get_setting(name):
+    """Lê uma opção de ``settings.METRICS`` com valor padrão."""
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+def process_alive(path):
+    """Se o processo que grava ``metrics-<pid>-<token>.json`` ainda existe."""
+    try:
+        pid = int(os.path.basename(path)[len('metrics-'):-len('.json')].split('-')[0])
+    except ValueError:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_values(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_values(path, values):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(values, f)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def locked(metrics_dir):
+    """Trava exclusiva do agregado entre os processos que leem o diretório."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(metrics_dir, LOCK_FILE), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.values = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self.token = secrets.token_hex(4)
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        self.values[metric.name] = {}
+        return metric
+
+    def update(self, metric, labels, apply):
+        if not get_setting('ENABLED'):
+            return
+        key = json.dumps([str(labels.get(name, '')) for name in metric.labelnames])
+        with self._lock:
+            series = self.values[metric.name]
+            series[key] = apply(series.get(key))
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.values))
+
+    def reset(self):
+        with self._lock:
+            for name in self.values:
+                self.values[name] = {}
+
+    def maybe_flush(self):
+        if not get_setting('DIR'):
+            return
+        now = time.monotonic()
+        if now - self._last_flush < get_setting('FLUSH_INTERVAL'):
+            return
+        self._last_flush = now
+        self.flush()
+
+    def flush(self):
+        metrics_dir = get_setting('DIR')
+        if not metrics_dir:
+            return
+        os.makedirs(metrics_dir, exist_ok=True)
+        write_values(self.path(metrics_dir), self.snapshot())
+
+    def path(self, metrics_dir):
+        # O pid muda em um fork; o token, a cada processo que importa o módulo
+        return os.path.join(metrics_dir, 'metrics-%d-%s.json' % (os.getpid(), self.token))
+
+    def merge(self, merged, data):
+        for name, series in data.items():
+            metric = self.metrics.get(name)
+            if metric is None:
+                continue
+            merged.setdefault(name, {})
+            for key, value in series.items():
+                merged[name][key] = metric.merge(merged[name].get(key), value)
+        return merged
+
+    def collect(self):
+        """
+        Junta os valores de todos os processos (incluindo este), somando
+        antes ao agregado os arquivos de processos encerrados.
+        """
+        metrics_dir = get_setting('DIR')
+        if not metrics_dir:
+            return self.snapshot()
+        self.flush()
+        aggregate_path = os.path.join(metrics_dir, AGGREGATE_FILE)
+        with locked(metrics_dir):
+            paths = glob.glob(os.path.join(metrics_dir, 'metrics-*.json'))
+            dead = [path for path in paths if not process_alive(path)]
+            if dead:
+                aggregate = read_values(aggregate_path) or {}
+                for path in dead:
+                    self.merge(aggregate, read_values(path) or {})
+                write_values(aggregate_path, aggregate)
+                for path in dead:
+                    os.remove(path)
+            merged = {name: {} for name in self.metrics}
+            for path in [aggregate_path] + [path for path in paths if path not in dead]:
+                self.merge(merged, read_values(path) or {})
+        return merged
+
+    def exposition(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        values = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append('# HELP %s %s' % (name, metric.documentation))
+            lines.append('# TYPE %s %s' % (name, metric.type))
+            for key, value in sorted(values.get(name, {}).items()):
+                labels = dict(zip(metric.labelnames, json.loads(key)))
+                lines.extend(metric.render(labels, value))
+        lines.extend(cache_hit_ratio_lines(values))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{%s}' % ','.join(escaped)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        registry.update(self, labels, lambda current: (current or 0) + amount)
+
+    @staticmethod
+    def merge(current, value):
+        return (current or 0) + value
+
+    def render(self, labels, value):
+        return ['%s%s %s' % (self.name, format_labels(labels), format_value(value))]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        def apply(current):
+            # Contagens por bucket (não acumuladas) + soma + quantidade
+            current = current or [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    current[index] += 1
+                    break
+            current[-2] += value
+            current[-1] += 1
+            return current
+        registry.update(self, labels, apply)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def merge(current, value):
+        if current is None:
+            return list(value)
+        return [a + b for a, b in zip(current, value)]
+
+    def render(self, labels, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (
+                self.name, format_labels(dict(labels, le=format_value(float(bound)))), cumulative
+            ))
+        lines.append('%s_bucket%s %d' % (self.name, format_labels(dict(labels, le='+Inf')), value[-1]))
+        lines.append('%s_sum%s %s' % (self.name, format_labels(labels), format_value(float(value[-2]))))
+        lines.append('%s_count%s %d' % (self.name, format_labels(labels), value[-1]))
+        return lines
+
+
+def cache_hit_ratio_lines(values):
+    """Gauge derivado com a taxa de acertos de cada cache."""
+    totals = {}
+    for key, count in values.get(cache_requests.name, {}).items():
+        cache, result = json.loads(key)
+        hits, total = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (count if result == 'hit' else 0), total + count)
+    lines = [
+        '# HELP simplemooc_cache_hit_ratio Fração de acertos por cache',
+        '# TYPE simplemooc_cache_hit_ratio gauge',
+    ]
+    for cache, (hits, total) in sorted(totals.items()):
+        lines.append('simplemooc_cache_hit_ratio%s %s' % (
+            format_labels({'cache': cache}), format_value(hits / total if total else 0.0)
+        ))
+    return lines
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+request_duration = Histogram(
+    'simplemooc_request_duration_seconds', 'Latência das requisições por nome de URL', ['view']
+)
+requests_total = Counter(
+    'simplemooc_requests_total', 'Requisições por nome de URL e status', ['view', 'status']
+)
+db_queries = Counter(
+    'simplemooc_db_queries_total', 'Queries executadas por nome de URL', ['view']
+)
+certificate_pdf_duration = Histogram(
+    'simplemooc_certificate_pdf_seconds', 'Tempo de generate_certificate_pdf'
+)
+certificate_pdf_bytes = Histogram(
+    'simplemooc_certificate_pdf_bytes', 'Tamanho dos PDFs de certificado', buckets=SIZE_BUCKETS
+)
+mail_duration = Histogram(
+    'simplemooc_mail_seconds', 'Tempo de send_mail_template por template', ['template']
+)
+mail_total = Counter(
+    'simplemooc_mail_total', 'Mensagens enviadas por send_mail_template', ['template']
+)
+progress_transitions = Counter(
+    'simplemooc_progress_transitions_total',
+    'Transições de progresso (aula concluída, desmarcada, curso concluído)', ['transition']
+)
+activity_heartbeats = Counter(
+    'simplemooc_activity_heartbeats_total',
+    'Heartbeats de tempo de estudo recebidos por resultado (aceito/descartado)', ['result']
+)
+cache_requests = Counter(
+    'simplemooc_cache_requests_total', 'Consultas a caches por resultado (hit/miss)', ['cache', 'result']
+)
+
+
+def record_cache(cache, hit):
+    """Registra um acerto ou uma falha de um cache da aplicação."""
+    cache_requests.inc(cache=cache, result='hit' if hit else 'miss')
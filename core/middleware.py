@@ -0,0 +1,151 @@
+"""
+Middlewares do projeto.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from . import instrumentation, metrics, profiling
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Registra, por nome de URL resolvida, a quantidade de queries, o tempo de
+    SQL, as queries mais lentas, o tempo de template e o tempo total.
+    Funciona em modo síncrono e assíncrono (views async sob ASGI).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        instrumentation.install_template_timer()
+
+    @contextmanager
+    def recording(self):
+        # As conexões já contam as queries no recorder ativo (instrumentation.install)
+        recorder = instrumentation.RequestRecorder()
+        token = recorder.activate()
+        try:
+            yield recorder
+        finally:
+            recorder.deactivate(token)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not instrumentation.get_setting('ENABLED'):
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with self.recording() as recorder:
+            response = self.get_response(request)
+        self.record(request, recorder, time.perf_counter() - start, response)
+        return response
+
+    async def __acall__(self, request):
+        if not instrumentation.get_setting('ENABLED'):
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        with self.recording() as recorder:
+            response = await self.get_response(request)
+        self.record(request, recorder, time.perf_counter() - start, response)
+        return response
+
+    def record(self, request, recorder, total_time, response):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            recorder.view_name = match.view_name
+            instrumentation.stats.record(match.view_name, recorder, total_time)
+            instrumentation.log_request(
+                match.view_name, recorder, total_time, response.status_code
+            )
+            instrumentation.stats.maybe_flush()
+            metrics.request_duration.observe(total_time, view=match.view_name)
+            metrics.requests_total.inc(view=match.view_name, status=response.status_code)
+            metrics.db_queries.inc(recorder.queries, view=match.view_name)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Disponibiliza o nome da view para quem registra durante a requisição
+        recorder = instrumentation.current_recorder()
+        if recorder is not None and request.resolver_match is not None:
+            recorder.view_name = request.resolver_match.view_name
+
+
+class RequestProfilingMiddleware:
+    """
+    Executa a requisição sob cProfile quando um usuário staff envia um token
+    assinado (cabeçalho ``X-Profile`` ou ``?_profile=``) ou quando ela é
+    sorteada pela amostragem em segundo plano. Deve ficar depois do
+    AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def request_token(self, request):
+        header = 'HTTP_' + profiling.get_setting('HEADER').upper().replace('-', '_')
+        return request.META.get(header) or request.GET.get(profiling.get_setting('QUERY_PARAM'))
+
+    def requested_mode(self, request):
+        if not profiling.get_setting('ENABLED') or profiling.is_active():
+            return None
+        token = self.request_token(request)
+        if token:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_staff:
+                return profiling.read_token(token)
+            return None
+        if profiling.should_sample():
+            return 'cpu'
+        return None
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        mode = self.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        with profiling.Profile(request.path, mode) as profile:
+            response = self.get_response(request)
+            self.name_profile(request, profile)
+        return self.annotate(response, profile)
+
+    async def __acall__(self, request):
+        if self.request_token(request):
+            # Com token, request.user é avaliado (e consulta o banco) fora do event loop
+            mode = await sync_to_async(self.requested_mode)(request)
+        else:
+            mode = self.requested_mode(request)
+        if mode is None:
+            return await self.get_response(request)
+
+        # O cProfile só enxerga a thread do event loop
+        with profiling.Profile(request.path, mode) as profile:
+            response = await self.get_response(request)
+            self.name_profile(request, profile)
+        return self.annotate(response, profile)
+
+    def name_profile(self, request, profile):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            profile.name = match.view_name
+
+    def annotate(self, response, profile):
+        if profile.path:
+            response['X-Profile-File'] = os.path.basename(profile.path)
+        return response
@@ -1,3 +1,48 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class OutboundMessage(models.Model):
+    """
+    Mensagem de e-mail na fila de saída. Gravada por ``send_mail_template`` e
+    enviada pelo comando ``send_queued_mail``.
+    """
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pendente'),
+        (SENDING, 'Enviando'),
+        (SENT, 'Enviada'),
+        (FAILED, 'Falhou'),
+    )
+
+    subject = models.CharField('Assunto', max_length=255)
+    body_text = models.TextField('Texto')
+    body_html = models.TextField('HTML', blank=True)
+    from_email = models.CharField('Remetente', max_length=255)
+    recipients = models.JSONField('Destinatários', default=list)
+    template_name = models.CharField('Template', max_length=255, blank=True)
+
+    status = models.CharField(
+        'Situação', max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField('Tentativas', default=0)
+    last_error = models.TextField('Último erro', blank=True)
+    # Próxima tentativa; durante o envio marca até quando a mensagem fica reservada
+    next_attempt_at = models.DateTimeField('Próxima tentativa em', default=timezone.now)
+    sent_at = models.DateTimeField('Enviada em', null=True, blank=True)
+    created_at = models.DateTimeField('Criado em', auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.subject} ({self.get_status_display()})'
+
+    class Meta:
+        verbose_name = 'Mensagem de Saída'
+        verbose_name_plural = 'Mensagens de Saída'
+        ordering = ['pk']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_queue_idx'),
+        ]
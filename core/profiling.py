@@ -0,0 +1,163 @@
+"""
+Perfilamento sob demanda de requisições individuais (cProfile e, opcionalmente,
+tracemalloc), acionado por staff com um token assinado ou por amostragem.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Fração das requisições perfiladas em segundo plano (0.0 desativa)
+    'SAMPLE_RATE': 0.0,
+    'OUTPUT_DIR': None,
+    'HEADER': 'X-Profile',
+    'QUERY_PARAM': '_profile',
+    # Validade (segundos) dos tokens gerados por ``manage.py profile_token``
+    'TOKEN_MAX_AGE': 3600,
+    'TOP_FUNCTIONS': 30,
+    'TOP_ALLOCATIONS': 20,
+}
+
+TOKEN_SALT = 'core.profiling'
+MODES = ('cpu', 'memory')
+
+_active = ContextVar('active_profile', default=False)
+# tracemalloc é global ao processo: um perfil de memória por vez
+_memory_lock = threading.Lock()
+
+
+def get_setting(name):
+    """Lê uma opção de ``settings.PROFILING`` com valor padrão."""
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+
+def make_token(mode='cpu'):
+    """Gera um token assinado que ativa o perfilamento de uma requisição."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(mode)
+
+
+def read_token(token):
+    """Retorna o modo ('cpu' ou 'memory') de um token válido, ou None."""
+    try:
+        mode = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=get_setting('TOKEN_MAX_AGE')
+        )
+    except signing.BadSignature:
+        return None
+    return mode if mode in MODES else None
+
+
+def is_active():
+    """Indica se já existe um perfilamento em andamento neste contexto."""
+    return _active.get()
+
+
+def should_sample():
+    rate = get_setting('SAMPLE_RATE')
+    return rate > 0 and random.random() < rate
+
+
+class Profile:
+    """
+    Executa um trecho sob cProfile (e tracemalloc, no modo 'memory') e grava
+    o ``.prof`` e um resumo das funções com maior tempo acumulado. Se outro
+    perfil de memória estiver em andamento, este vira um perfil de CPU; o
+    tracemalloc só é parado se foi este perfil que o iniciou.
+    """
+
+    def __init__(self, name, mode='cpu'):
+        self.name = name
+        self.mode = mode
+        self.profiler = cProfile.Profile()
+        self.snapshot = None
+        self.elapsed = 0.0
+        self.path = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.mode == 'memory':
+            if _memory_lock.acquire(blocking=False):
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracing = True
+            else:
+                self.mode = 'cpu'
+        self._start = time.perf_counter()
+        try:
+            # Falha se outro profiler já estiver ativo nesta thread
+            self.profiler.enable()
+        except BaseException:
+            self.release_memory()
+            raise
+        self._token = _active.set(True)
+        return self
+
+    def release_memory(self):
+        if self.mode != 'memory':
+            return
+        if self._started_tracing:
+            tracemalloc.stop()
+        _memory_lock.release()
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.elapsed = time.perf_counter() - self._start
+        if self.mode == 'memory':
+            try:
+                self.snapshot = tracemalloc.take_snapshot()
+            finally:
+                self.release_memory()
+        _active.reset(self._token)
+        output_dir = get_setting('OUTPUT_DIR')
+        if output_dir:
+            self.save(output_dir)
+        return False
+
+    def summary(self):
+        stream = io.StringIO()
+        stream.write('%s (%s) - %.1f ms\n\n' % (self.name, self.mode, self.elapsed * 1000))
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(get_setting('TOP_FUNCTIONS'))
+        if self.snapshot is not None:
+            stream.write('\nMaiores alocações de memória:\n')
+            for stat in self.snapshot.statistics('lineno')[:get_setting('TOP_ALLOCATIONS')]:
+                stream.write('%s\n' % stat)
+        return stream.getvalue()
+
+    def save(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        base = '%s-%s-%d' % (
+            time.strftime('%Y%m%d-%H%M%S'),
+            self.name.replace(':', '-').replace('/', '-'),
+            os.getpid(),
+        )
+        self.path = os.path.join(output_dir, base + '.prof')
+        self.profiler.dump_stats(self.path)
+        with open(os.path.join(output_dir, base + '.txt'), 'w') as f:
+            f.write(self.summary())
+        return self.path
+
+
+@contextmanager
+def profile_section(name):
+    """
+    Perfila um trecho fora do ciclo de requisição (ex.: geração de PDF em um
+    comando) conforme ``SAMPLE_RATE``. Dentro de uma requisição já perfilada
+    não faz nada, pois o trecho já aparece no perfil da requisição.
+    """
+    if not get_setting('ENABLED') or is_active() or not should_sample():
+        yield None
+        return
+    with Profile(name) as profile:
+        yield profile
@@ -0,0 +1,180 @@
+"""
+Log de queries lentas: toda query do ORM acima de ``THRESHOLD_MS`` é gravada
+(em JSON, uma por linha) com parâmetros, view de origem, o trecho do código
+da aplicação que a disparou e o plano de execução (``EXPLAIN QUERY PLAN`` no
+SQLite, ``EXPLAIN`` no PostgreSQL).
+"""
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from . import instrumentation
+
+logger = logging.getLogger('simplemooc.slow_queries')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 100,
+    # Arquivo JSONL com as ocorrências (None apenas envia ao log)
+    'LOG_FILE': None,
+    'EXPLAIN': True,
+    # Apps cujo frame mais interno é registrado como origem da query
+    'STACK_APPS': ['cursos'],
+}
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+_capturing = ContextVar('slow_query_capturing', default=False)
+_write_lock = threading.Lock()
+
+
+def get_setting(name):
+    """Lê uma opção de ``settings.SLOW_QUERIES`` com valor padrão."""
+    return getattr(settings, 'SLOW_QUERIES', {}).get(name, DEFAULTS[name])
+
+
+def app_frame():
+    """Frame mais interno do código de ``STACK_APPS`` na pilha atual."""
+    app_dirs = tuple(
+        os.path.join(str(settings.BASE_DIR), app) + os.sep for app in get_setting('STACK_APPS')
+    )
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(app_dirs):
+            return '%s:%d in %s' % (
+                os.path.relpath(frame.filename, str(settings.BASE_DIR)), frame.lineno, frame.name
+            )
+    return None
+
+
+def explain(connection, sql, params):
+    """
+    Plano de execução da query. Usa o cursor do driver, sem os
+    ``execute_wrappers`` nem o log de queries do Django, para que o EXPLAIN
+    não entre na contagem da requisição nem nos orçamentos de queries. Dentro
+    de uma transação roda em um savepoint: no PostgreSQL um EXPLAIN com erro
+    abortaria a transação da requisição.
+    """
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None or not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    if connection.needs_rollback:
+        return None
+    savepoint = connection.in_atomic_block and connection.features.uses_savepoints
+    with connection.cursor() as wrapper:
+        cursor = wrapper.cursor
+        if savepoint:
+            cursor.execute(connection.ops.savepoint_create_sql('slow_query_explain'))
+        try:
+            cursor.execute(prefix + sql, params)
+            plan = [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+        except Exception as e:
+            if savepoint:
+                cursor.execute(connection.ops.savepoint_rollback_sql('slow_query_explain'))
+            return ['EXPLAIN falhou: %s' % e]
+        if savepoint:
+            cursor.execute(connection.ops.savepoint_commit_sql('slow_query_explain'))
+        return plan
+
+
+def record(entry):
+    logger.warning(
+        'Query lenta (%.1f ms) em %s: %s', entry['duration_ms'], entry['view'], entry['sql']
+    )
+    log_file = get_setting('LOG_FILE')
+    if not log_file:
+        return
+    os.makedirs(os.path.dirname(str(log_file)), exist_ok=True)
+    line = json.dumps(entry, default=str) + '\n'
+    with _write_lock, open(log_file, 'a') as f:
+        f.write(line)
+
+
+class SlowQueryWrapper:
+    """``execute_wrapper`` instalado em todas as conexões (ver CoreConfig.ready)."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        if _capturing.get() or not get_setting('ENABLED'):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= get_setting('THRESHOLD_MS'):
+            token = _capturing.set(True)
+            try:
+                self.capture(sql, params, many, duration_ms)
+            finally:
+                _capturing.reset(token)
+        return result
+
+    def capture(self, sql, params, many, duration_ms):
+        recorder = instrumentation.current_recorder()
+        plan = None
+        if get_setting('EXPLAIN') and not many:
+            plan = explain(self.connection, sql, params)
+        record({
+            'time': time.time(),
+            'duration_ms': round(duration_ms, 3),
+            'sql': sql,
+            'params': None if many else list(params or ()),
+            'view': recorder.view_name if recorder is not None else None,
+            'frame': app_frame(),
+            'database': self.connection.alias,
+            'plan': plan,
+        })
+
+
+def install(sender, connection, **kwargs):
+    """Receptor de ``connection_created``."""
+    if not any(isinstance(wrapper, SlowQueryWrapper) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(SlowQueryWrapper(connection))
+
+
+def load_entries(log_file):
+    entries = []
+    if not log_file or not os.path.exists(log_file):
+        return entries
+    with open(log_file) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def top_offenders(entries, sort='total_ms'):
+    """Agrupa as ocorrências pelo SQL (já parametrizado)."""
+    grouped = {}
+    for entry in entries:
+        group = grouped.setdefault(entry['sql'], {
+            'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'views': set(), 'frames': set(), 'plan': None, 'params': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        if entry['duration_ms'] >= group['max_ms']:
+            group['max_ms'] = entry['duration_ms']
+            group['plan'] = entry.get('plan')
+            group['params'] = entry.get('params')
+        if entry.get('view'):
+            group['views'].add(entry['view'])
+        if entry.get('frame'):
+            group['frames'].add(entry['frame'])
+    rows = []
+    for group in grouped.values():
+        group['views'] = sorted(group['views'])
+        group['frames'] = sorted(group['frames'])
+        rows.append(group)
+    return sorted(rows, key=lambda row: row[sort], reverse=True)
@@ -0,0 +1,41 @@
+"""
+Runner de testes do projeto (``TEST_RUNNER``).
+
+Os arquivos que a aplicação grava em ``var/`` durante as requisições vão para
+um diretório temporário, apagado no fim, em vez de se misturarem aos do
+servidor de desenvolvimento.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from core import metrics
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.var_dir = tempfile.mkdtemp(prefix='simplemooc-tests-')
+        self.var_override = override_settings(
+            INSTRUMENTATION=dict(
+                settings.INSTRUMENTATION, STATS_DIR=os.path.join(self.var_dir, 'instrumentation')
+            ),
+            METRICS=dict(settings.METRICS, DIR=os.path.join(self.var_dir, 'metrics')),
+            SLOW_QUERIES=dict(
+                settings.SLOW_QUERIES, LOG_FILE=os.path.join(self.var_dir, 'slow_queries.jsonl')
+            ),
+        )
+        self.var_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        # Sem isso o flush do atexit gravaria as métricas dos testes em var/
+        atexit.unregister(metrics.registry.flush)
+        self.var_override.disable()
+        shutil.rmtree(self.var_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
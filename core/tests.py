@@ -1,3 +1,435 @@
-from django.test import TestCase
+"""
+Testes do app core
 
-# Create your tests here.
+Execute com: python manage.py test core.tests
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import connection, transaction
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.urls import path, reverse
+
+from cursos import views as cursos_views
+from cursos.models import Course, Enrollment
+from cursos.progress import ProgressManager
+from core import instrumentation, metrics, profiling, slowqueries
+
+# URLconf de RequestInstrumentationTests com a view assíncrona de progresso
+urlpatterns = [
+    path('progresso/<slug:slug>/', cursos_views.aget_course_progress, name='async_progress'),
+]
+
+
+class RequestInstrumentationTests(TestCase):
+    """Testes para o RequestInstrumentationMiddleware"""
+
+    def setUp(self):
+        instrumentation.stats.reset()
+        Course.objects.create(name='Python', slug='python')
+
+    def test_records_queries_and_times_per_view(self):
+        """Testa o agregado por nome de URL"""
+        self.client.get(reverse('cursos:index'))
+        self.client.get(reverse('cursos:index'))
+
+        entry = instrumentation.stats.snapshot()['cursos:index']
+        self.assertEqual(entry['requests'], 2)
+        self.assertGreater(entry['queries'], 0)
+        self.assertGreater(entry['template_time'], 0)
+        self.assertGreaterEqual(entry['total_time'], entry['template_time'])
+        self.assertTrue(entry['slowest_queries'])
+
+    @override_settings(ROOT_URLCONF='core.tests')
+    def test_counts_queries_of_async_views(self):
+        """Testa que as queries do ORM async (thread do sync_to_async) são contadas"""
+        user = User.objects.create_user('aluno', password='x')
+        enrollment = Enrollment.objects.create(user=user, course=Course.objects.get(slug='python'), status=1)
+        ProgressManager.initialize_course_progress(user, enrollment)
+        client = AsyncClient()
+        client.force_login(user)
+
+        response = async_to_sync(client.get)('/progresso/python/')
+        self.assertEqual(response.status_code, 200)
+        entry = instrumentation.stats.snapshot()['async_progress']
+        self.assertGreater(entry['queries'], 0)
+
+    @override_settings(INSTRUMENTATION={'QUERY_BUDGETS': {'cursos:index': 0}})
+    def test_query_budget_warning(self):
+        """Testa o aviso quando o orçamento de queries é excedido"""
+        with self.assertLogs('simplemooc.instrumentation', level='WARNING') as logs:
+            self.client.get(reverse('cursos:index'))
+        self.assertIn('cursos:index', logs.output[0])
+
+    def test_request_stats_requires_staff(self):
+        """Testa que o endpoint de métricas é restrito a staff"""
+        url = reverse('request_stats')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        User.objects.create_user('admin', password='x', is_staff=True)
+        self.client.login(username='admin', password='x')
+        self.client.get(reverse('cursos:index'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('cursos:index', response.json())
+
+
+class RequestProfilingTests(TestCase):
+    """Testes para o RequestProfilingMiddleware"""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        self.settings_override = override_settings(PROFILING={'OUTPUT_DIR': self.output_dir})
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        Course.objects.create(name='Python', slug='python')
+        self.staff = User.objects.create_user('admin', password='x', is_staff=True)
+        self.student = User.objects.create_user('aluno', password='x')
+
+    def test_staff_with_signed_token(self):
+        """Testa que staff com token válido gera .prof e resumo"""
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse('cursos:details', kwargs={'slug': 'python'}),
+            HTTP_X_PROFILE=profiling.make_token('memory')
+        )
+
+        filename = response['X-Profile-File']
+        self.assertIn('cursos-details', filename)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, filename)))
+        with open(os.path.join(self.output_dir, filename[:-len('.prof')] + '.txt')) as f:
+            summary = f.read()
+        self.assertIn('cumulative', summary)
+        self.assertIn('alocações', summary)
+
+    def test_memory_profiles_respect_global_tracemalloc(self):
+        """Testa que o tracemalloc de fora continua ativo e perfis de memória não se sobrepõem"""
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        with profiling.Profile('externo', 'memory') as outer:
+            with profiling.Profile('interno', 'memory') as inner:
+                pass
+            self.assertTrue(tracemalloc.is_tracing())
+        self.assertTrue(tracemalloc.is_tracing())
+        self.assertEqual(inner.mode, 'cpu')
+        self.assertIsNone(inner.snapshot)
+        self.assertIsNotNone(outer.snapshot)
+
+        tracemalloc.stop()
+        with profiling.Profile('sozinho', 'memory') as profile:
+            pass
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIsNotNone(profile.snapshot)
+
+    def test_failed_enable_releases_memory_profiling(self):
+        """Testa que uma falha ao ativar o cProfile não prende o perfil de memória"""
+        profile = profiling.Profile('falha', 'memory')
+        with mock.patch.object(profile.profiler, 'enable', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                profile.__enter__()
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertFalse(profiling.is_active())
+        with profiling.Profile('depois', 'memory') as profile:
+            pass
+        self.assertEqual(profile.mode, 'memory')
+        self.assertIsNotNone(profile.snapshot)
+
+    def test_token_ignored_for_students_and_bad_signatures(self):
+        """Testa que alunos e tokens inválidos não acionam o perfilamento"""
+        url = reverse('cursos:index')
+        self.client.force_login(self.student)
+        response = self.client.get(url, {'_profile': profiling.make_token()})
+        self.assertNotIn('X-Profile-File', response)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(url, {'_profile': 'cpu:forjado:assinatura'})
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    def test_background_sampling_of_certificate_pdf(self):
+        """Testa a amostragem do PDF do certificado fora de requisições"""
+        from cursos.models import Certificate, CourseProgress, Enrollment
+        from cursos.progress import CertificateManager
+
+        course = Course.objects.get(slug='python')
+        enrollment = Enrollment.objects.create(user=self.student, course=course)
+        progress = CourseProgress.objects.create(
+            user=self.student, course=course, enrollment=enrollment, progress_percentage=100
+        )
+        certificate = Certificate.objects.create(
+            user=self.student, course=course, course_progress=progress,
+            certificate_number='ABC'
+        )
+        with override_settings(PROFILING={'OUTPUT_DIR': self.output_dir, 'SAMPLE_RATE': 1.0}):
+            pdf = CertificateManager.generate_certificate_pdf(certificate)
+
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertTrue(any(
+            name.endswith('generate_certificate_pdf-%d.prof' % os.getpid())
+            for name in os.listdir(self.output_dir)
+        ))
+
+
+class MetricsTests(TestCase):
+    """Testes para o endpoint /metrics"""
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+        self.settings_override = override_settings(
+            METRICS={'DIR': self.metrics_dir, 'TOKEN': 'segredo'}
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        metrics.registry.reset()
+        Course.objects.create(name='Python', slug='python')
+
+    def test_exposition_merges_processes(self):
+        """Testa os histogramas por view somados aos de outro processo"""
+        self.client.get(reverse('cursos:index'))
+        metrics.record_cache('aulas', hit=True)
+        metrics.record_cache('aulas', hit=False)
+        key = json.dumps(['cursos:index'])
+        other = {
+            'simplemooc_request_duration_seconds': {key: [1] + [0] * 10 + [0.002, 1]},
+            'simplemooc_metrica_removida': {'[]': 3},
+        }
+        # Processo vivo (o pai deste) com outro token
+        with open(os.path.join(self.metrics_dir, 'metrics-%d-outro.json' % os.getppid()), 'w') as f:
+            json.dump(other, f)
+
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE simplemooc_request_duration_seconds histogram', body)
+        self.assertIn(
+            'simplemooc_request_duration_seconds_bucket{view="cursos:index",le="+Inf"} 2', body
+        )
+        self.assertIn('simplemooc_request_duration_seconds_count{view="cursos:index"} 2', body)
+        self.assertIn('simplemooc_requests_total{view="cursos:index",status="200"} 1', body)
+        self.assertIn('simplemooc_db_queries_total{view="cursos:index"}', body)
+        self.assertIn('simplemooc_cache_hit_ratio{cache="aulas"} 0.5', body)
+        self.assertNotIn('metrica_removida', body)
+
+    def test_dead_processes_are_merged_into_the_aggregate(self):
+        """Testa que arquivos de processos encerrados são somados uma vez e apagados"""
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        key = json.dumps(['cursos:index', '200'])
+        dead = os.path.join(self.metrics_dir, 'metrics-%d-morto.json' % process.pid)
+        with open(dead, 'w') as f:
+            json.dump({'simplemooc_requests_total': {key: 3}}, f)
+        with open(os.path.join(self.metrics_dir, metrics.AGGREGATE_FILE), 'w') as f:
+            json.dump({'simplemooc_requests_total': {key: 2}}, f)
+
+        self.assertEqual(metrics.registry.collect()['simplemooc_requests_total'][key], 5)
+        self.assertFalse(os.path.exists(dead))
+        self.assertEqual(metrics.registry.collect()['simplemooc_requests_total'][key], 5)
+        self.assertEqual(
+            sorted(os.listdir(self.metrics_dir)),
+            sorted([metrics.AGGREGATE_FILE, metrics.LOCK_FILE, os.path.basename(
+                metrics.registry.path(self.metrics_dir)
+            )]),
+        )
+        # Outro processo com o mesmo pid grava em outro arquivo
+        self.assertNotEqual(
+            metrics.Registry().path(self.metrics_dir), metrics.registry.path(self.metrics_dir)
+        )
+
+    def test_restricted_to_token_allowed_ips_and_staff(self):
+        """Testa que localhost não basta: é preciso token, IP liberado ou staff"""
+        url = reverse('metrics')
+        response = self.client.get(url, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer errado')
+        self.assertEqual(response.status_code, 403)
+        with override_settings(METRICS={'DIR': self.metrics_dir, 'ALLOWED_IPS': ['10.0.0.9']}):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.9').status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+        User.objects.create_user('admin', password='x', is_staff=True)
+        self.client.login(username='admin', password='x')
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 200)
+
+
+class SlowQueryLogTests(TestCase):
+    """Testes para o log de queries lentas"""
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir, ignore_errors=True)
+        self.log_file = os.path.join(self.log_dir, 'slow.jsonl')
+        Course.objects.create(name='Python', slug='python')
+
+    def test_captures_view_frame_and_plan(self):
+        """Testa o registro com view de origem, frame em cursos/ e EXPLAIN"""
+        config = {'THRESHOLD_MS': 0, 'LOG_FILE': self.log_file, 'STACK_APPS': ['cursos']}
+        with override_settings(SLOW_QUERIES=config), \
+                self.assertLogs('simplemooc.slow_queries', level='WARNING'):
+            self.client.get(reverse('cursos:index'), {'q': 'python'})
+
+        entries = slowqueries.load_entries(self.log_file)
+        search = [e for e in entries if 'LIKE' in e['sql'] and e['view'] == 'cursos:index']
+        self.assertTrue(search)
+        self.assertIn('%python%', search[0]['params'])
+        self.assertTrue(search[0]['frame'].startswith(os.path.join('cursos', '')))
+        self.assertTrue(any('SCAN' in line for line in search[0]['plan']))
+        # O EXPLAIN não é registrado como query lenta
+        self.assertFalse(any(e['sql'].startswith('EXPLAIN') for e in entries))
+
+        rows = slowqueries.top_offenders(entries)
+        self.assertEqual(sum(row['count'] for row in rows), len(entries))
+        self.assertEqual(rows, sorted(rows, key=lambda row: row['total_ms'], reverse=True))
+
+    def test_explain_is_not_counted_and_keeps_the_transaction(self):
+        """Testa que o EXPLAIN fica fora da contagem e não estraga a transação"""
+        def index_queries(explain):
+            instrumentation.stats.reset()
+            config = {'THRESHOLD_MS': 0, 'LOG_FILE': self.log_file, 'EXPLAIN': explain}
+            with override_settings(SLOW_QUERIES=config), \
+                    self.assertLogs('simplemooc.slow_queries', level='WARNING'), \
+                    CaptureQueriesContext(connection) as context:
+                self.client.get(reverse('cursos:index'))
+            return len(context), instrumentation.stats.snapshot()['cursos:index']['queries']
+
+        self.assertEqual(index_queries(True), index_queries(False))
+
+        config = {'THRESHOLD_MS': 0, 'LOG_FILE': self.log_file}
+        with override_settings(SLOW_QUERIES=config), \
+                self.assertLogs('simplemooc.slow_queries', level='WARNING'), \
+                mock.patch.dict(slowqueries.EXPLAIN_PREFIXES, {'sqlite': 'EXPLAIN INVALIDO '}), \
+                transaction.atomic():
+            Course.objects.create(name='Django', slug='django')
+            self.assertEqual(Course.objects.filter(slug='django').count(), 1)
+        entries = slowqueries.load_entries(self.log_file)
+        self.assertTrue(any(
+            (entry['plan'] or [''])[0].startswith('EXPLAIN falhou') for entry in entries
+        ))
+
+    def test_below_threshold_is_ignored(self):
+        """Testa que queries rápidas não são registradas"""
+        config = {'THRESHOLD_MS': 60000, 'LOG_FILE': self.log_file}
+        with override_settings(SLOW_QUERIES=config):
+            self.client.get(reverse('cursos:index'))
+        self.assertEqual(slowqueries.load_entries(self.log_file), [])
+
+
+class MailQueueTests(TestCase):
+    """Testes para a fila de saída de e-mails"""
+
+    def queue(self, *emails):
+        from core.mail import send_mass_mail_template
+        send_mass_mail_template(
+            'Assunto', 'courses/contact_email.html',
+            {'name': 'Ana', 'email': 'ana@example.com', 'message': 'Oi'},
+            [[email] for email in emails]
+        )
+
+    def worker(self, backend=None, **kwargs):
+        from django.core.mail import get_connection
+        from core.mail import OutboxWorker
+
+        self.connections = []
+
+        def connection_factory(**options):
+            connection = backend() if backend else get_connection(**options)
+            self.connections.append(connection)
+            return connection
+        return OutboxWorker(rate=0, connection_factory=connection_factory, **kwargs)
+
+    def test_enqueue_then_send_in_batches(self):
+        """Testa que o envio sai da requisição e usa uma conexão por lote"""
+        from django.core import mail
+        from core.models import OutboundMessage
+
+        self.queue('a@example.com', 'b@example.com', 'c@example.com')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundMessage.objects.filter(status='pending').count(), 3)
+
+        counts = self.worker(batch_size=2).run_once()
+        self.assertEqual(counts, {'sent': 3})
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual([m.to for m in mail.outbox], [['a@example.com'], ['b@example.com'], ['c@example.com']])
+        self.assertTrue(mail.outbox[0].alternatives)
+        self.assertFalse(OutboundMessage.objects.exclude(status='sent').exists())
+
+    def test_retry_with_backoff_then_fail(self):
+        """Testa a nova tentativa com espera exponencial e a falha definitiva"""
+        from datetime import timedelta
+        from django.core.mail.backends.locmem import EmailBackend
+        from django.utils import timezone
+        from core.models import OutboundMessage
+
+        class FlakyBackend(EmailBackend):
+            def send_messages(self, messages):
+                if any('falha' in address for message in messages for address in message.to):
+                    raise OSError('SMTP indisponível')
+                return super().send_messages(messages)
+
+        self.queue('ok@example.com', 'falha@example.com')
+        with override_settings(MAIL_QUEUE={'RETRY_BACKOFF': 60, 'MAX_ATTEMPTS': 2}):
+            self.assertEqual(self.worker(FlakyBackend).run_once(), {'sent': 1, 'pending': 1})
+            message = OutboundMessage.objects.get(status='pending')
+            self.assertEqual(message.attempts, 1)
+            self.assertIn('SMTP indisponível', message.last_error)
+            self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+            # Ainda na espera: nada a enviar
+            self.assertEqual(self.worker(FlakyBackend).run_once(), {})
+            OutboundMessage.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+            self.assertEqual(self.worker(FlakyBackend).run_once(), {'failed': 1})
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('failed', 2))
+
+    def test_rate_limiter(self):
+        """Testa o limite de mensagens por segundo"""
+        from core.mail import RateLimiter
+
+        now = [0.0]
+        slept = []
+
+        def sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+        limiter = RateLimiter(4, clock=lambda: now[0], sleep=sleep)
+        for i in range(5):
+            limiter.wait()
+        self.assertEqual(slept, [0.25] * 4)
+        self.assertEqual(now[0], 1.0)
+
+    def test_password_reset_and_announcements_are_queued(self):
+        """Testa que a redefinição de senha e os anúncios usam a fila"""
+        from django.core import mail
+        from cursos.models import Announcement, Enrollment
+        from core.models import OutboundMessage
+
+        user = User.objects.create_user('ana', email='ana@example.com', password='x')
+        self.client.post(reverse('password_reset'), {'email': 'ana@example.com'})
+        message = OutboundMessage.objects.get()
+        self.assertEqual(message.recipients, ['ana@example.com'])
+        self.assertIn('/reset/', message.body_text)
+
+        course = Course.objects.create(name='Python', slug='python')
+        for index in range(3):
+            student = User.objects.create_user(f'aluno{index}', email=f'aluno{index}@example.com')
+            Enrollment.objects.create(user=student, course=course)
+        Enrollment.objects.create(user=user, course=course, status=2)
+        Announcement.objects.create(course=course, title='Aviso', content='Conteúdo')
+        self.assertEqual(
+            sorted(m.recipients[0] for m in OutboundMessage.objects.filter(subject='Aviso')),
+            ['aluno0@example.com', 'aluno1@example.com', 'aluno2@example.com']
+        )
+        self.assertEqual(len(mail.outbox), 0)
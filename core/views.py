@@ -1,8 +1,46 @@
+import hmac
+
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+
+from . import instrumentation, metrics
 
 def home(request):
     return render(request, 'home.html')
 
 def contact(request):
-    return render(request, 'contact.html')
\ No newline at end of file
+    return render(request, 'contact.html')
+
+@staff_member_required
+def request_stats(request):
+    """
+    Métricas agregadas por view deste processo (somente staff).
+    Com ?all=1 junta os agregados gravados por todos os processos.
+    """
+    if request.GET.get('all'):
+        snapshots = [instrumentation.stats.snapshot()]
+        stats_dir = instrumentation.get_setting('STATS_DIR')
+        if stats_dir:
+            instrumentation.stats.flush(stats_dir)
+            snapshots = instrumentation.load_snapshots(stats_dir)
+        return JsonResponse(instrumentation.merge_snapshots(snapshots))
+    return JsonResponse(instrumentation.stats.snapshot())
+
+def metrics_view(request):
+    """
+    Métricas de todos os processos no formato texto do Prometheus.
+    Liberado para usuários staff, para o coletor com o token de
+    ``METRICS['TOKEN']`` e, se configurados, para os IPs de
+    ``METRICS['ALLOWED_IPS']``.
+    """
+    token = metrics.get_setting('TOKEN')
+    allowed = bool(token) and hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token
+    )
+    allowed = allowed or request.META.get('REMOTE_ADDR') in metrics.get_setting('ALLOWED_IPS')
+    if not allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
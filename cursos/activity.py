@@ -0,0 +1,193 @@
+"""
+Tempo de estudo nas aulas a partir de heartbeats do navegador.
+
+As páginas de aula e de material enviam, em lotes, um heartbeat a cada
+``HEARTBEAT_SECONDS`` enquanto estão visíveis. Cada requisição valida as aulas
+com uma consulta e só soma os segundos em um dicionário em memória, por
+(aluno, aula, minuto); nada é gravado por heartbeat. A cada ``FLUSH_INTERVAL``
+segundos (ou ``MAX_PENDING`` chaves) o processo grava tudo com INSERT ... ON
+CONFLICT em lote: os minutos em ``LessonActivity`` e os totais do dia em
+``CourseDailyActivity``, somando ao que já existe. Assim vários processos
+podem gravar a mesma chave sem perder incrementos. O teto de 60 segundos por
+minuto é aplicado no próprio upsert de ``LessonActivity``; os totais do dia
+somam os segundos recebidos, que só passam do teto quando o mesmo minuto é
+gravado por mais de um flush.
+
+Como nas métricas, os valores ainda não gravados ficam na memória do
+processo: um processo derrubado perde no máximo ``FLUSH_INTERVAL`` segundos de
+heartbeats.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core import metrics
+from core.db import upsert_add
+
+from .models import CourseDailyActivity, Lesson, LessonActivity
+
+logger = logging.getLogger('simplemooc.activity')
+
+# Segundos de estudo que cabem em um minuto de ``LessonActivity``
+MINUTE_SECONDS = 60
+
+DEFAULTS = {
+    # Segundos de um heartbeat que não informa ``seconds``
+    'HEARTBEAT_SECONDS': 15,
+    # Heartbeats aceitos por requisição
+    'MAX_BATCH': 200,
+    # Heartbeats mais antigos que isso (s) são descartados
+    'MAX_AGE': 3600,
+    # Intervalo entre gravações no banco (s)
+    'FLUSH_INTERVAL': 10,
+    # Chaves (aluno, aula, minuto) em memória que forçam a gravação
+    'MAX_PENDING': 10000,
+}
+
+
+def get_setting(name):
+    """Lê uma opção de ``settings.LESSON_ACTIVITY`` com valor padrão."""
+    return getattr(settings, 'LESSON_ACTIVITY', {}).get(name, DEFAULTS[name])
+
+
+class HeartbeatError(ValueError):
+    """Lote de heartbeats inválido."""
+
+
+def parse_heartbeats(payload, now=None):
+    """
+    ``{"heartbeats": [{"lesson": 12, "at": 1760868000, "seconds": 15}]}`` ->
+    lista de ``(lesson_id, minuto, segundos)``. ``at`` (epoch em segundos) e
+    ``seconds`` são opcionais; heartbeats do futuro ou antigos demais são
+    descartados.
+    """
+    beats = payload.get('heartbeats') if isinstance(payload, dict) else None
+    if not isinstance(beats, list):
+        raise HeartbeatError('Envie {"heartbeats": [...]}')
+    if len(beats) > get_setting('MAX_BATCH'):
+        raise HeartbeatError('No máximo %d heartbeats por requisição' % get_setting('MAX_BATCH'))
+
+    now = (now or timezone.now()).timestamp()
+    oldest = now - get_setting('MAX_AGE')
+    parsed = []
+    for beat in beats:
+        try:
+            lesson_id = int(beat['lesson'])
+            moment = float(beat.get('at', now))
+            seconds = int(beat.get('seconds', get_setting('HEARTBEAT_SECONDS')))
+        except (TypeError, KeyError, ValueError, AttributeError):
+            raise HeartbeatError('Heartbeat inválido: %r' % (beat,))
+        if not oldest <= moment <= now + 60 or not 0 < seconds <= MINUTE_SECONDS:
+            continue
+        minute = datetime.fromtimestamp(moment - moment % 60, tz=dt_timezone.utc)
+        parsed.append((lesson_id, minute, seconds))
+    return parsed
+
+
+def allowed_lessons(user, lesson_ids):
+    """``{lesson_id: course_id}`` das aulas de cursos com matrícula aprovada (uma consulta)."""
+    return dict(Lesson.objects.filter(
+        pk__in=set(lesson_ids), course__enrollments__user=user, course__enrollments__status=1
+    ).values_list('pk', 'course_id'))
+
+
+def write_rollups(pending):
+    """
+    Grava ``{(user_id, lesson_id, course_id, minuto): [segundos, heartbeats]}``
+    nos minutos por aula e nos totais diários por curso.
+    """
+    minutes = []
+    days = {}
+    for (user_id, lesson_id, course_id, minute), (seconds, beats) in pending.items():
+        minutes.append((user_id, lesson_id, minute, seconds))
+        day = days.setdefault((course_id, timezone.localtime(minute).date()), [0, 0])
+        day[0] += seconds
+        day[1] += beats
+    with transaction.atomic():
+        upsert_add(
+            LessonActivity, ['user', 'lesson', 'minute'], ['seconds'], minutes,
+            limits={'seconds': MINUTE_SECONDS},
+        )
+        upsert_add(
+            CourseDailyActivity, ['course', 'day'], ['seconds', 'heartbeats'],
+            [key + tuple(values) for key, values in days.items()],
+        )
+
+
+class ActivityBuffer:
+    """Soma dos heartbeats ainda não gravados deste processo."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = clock()
+
+    def add(self, user_id, beats, courses):
+        """Soma ``beats`` (de ``parse_heartbeats``) das aulas em ``courses``. Retorna quantos entraram."""
+        accepted = 0
+        with self._lock:
+            for lesson_id, minute, seconds in beats:
+                course_id = courses.get(lesson_id)
+                if course_id is None:
+                    continue
+                entry = self._pending.setdefault((user_id, lesson_id, course_id, minute), [0, 0])
+                # Várias abas abertas: limita já em memória; entre flushes e
+                # processos o teto é garantido pelo upsert (write_rollups)
+                entry[0] = min(entry[0] + seconds, MINUTE_SECONDS)
+                entry[1] += 1
+                accepted += 1
+        metrics.activity_heartbeats.inc(accepted, result='accepted')
+        if len(beats) > accepted:
+            metrics.activity_heartbeats.inc(len(beats) - accepted, result='discarded')
+        return accepted
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def maybe_flush(self):
+        """Grava se o intervalo venceu ou a memória encheu; falhas ficam para a próxima vez."""
+        if (self.pending() < get_setting('MAX_PENDING')
+                and self.clock() - self._last_flush < get_setting('FLUSH_INTERVAL')):
+            return 0
+        try:
+            return self.flush()
+        except Exception:
+            logger.exception('Falha ao gravar a atividade nas aulas')
+            return 0
+
+    def flush(self):
+        """Grava o que está em memória. Retorna quantas chaves foram gravadas."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = self.clock()
+        if pending:
+            try:
+                write_rollups(pending)
+            except Exception:
+                self.restore(pending)
+                raise
+        return len(pending)
+
+    def restore(self, pending):
+        # Gravação falhou: devolve os valores para a próxima tentativa
+        with self._lock:
+            for key, (seconds, beats) in pending.items():
+                entry = self._pending.setdefault(key, [0, 0])
+                entry[0] = min(entry[0] + seconds, MINUTE_SECONDS)
+                entry[1] += beats
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+
+
+buffer = ActivityBuffer()
+atexit.register(buffer.flush)
@@ -1,10 +1,17 @@
 
 
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from . import export
+from .progress import CertificateManager, ProgressManager
 
 from .models import (
     Course, Enrollment, Announcement, Comment, Lesson, Material,
-    LessonProgress, CourseProgress, Certificate
+    LessonProgress, CourseProgress, Certificate, CourseDailyActivity, CourseStats
 )
 
 
@@ -27,23 +34,121 @@ class LessonAdmin(admin.ModelAdmin):
         MaterialInlineAdmin
     ]
 
-class LessonProgressAdmin(admin.ModelAdmin):
+class EstimatedCountPaginator(Paginator):
+    """
+    Em listagens sem filtro de tabelas muito grandes usa a estimativa do
+    PostgreSQL (``pg_class.reltuples``) no lugar de um ``COUNT(*)`` exato.
+    Nos demais casos (filtros, tabelas pequenas, outros bancos) conta normalmente.
+    """
+
+    threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.threshold:
+                return int(row[0])
+        return super().count
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Base para changelists de tabelas grandes: contagem estimada, sem o
+    segundo COUNT do total e busca por prefixo (``startswith``), que usa os
+    índices B-tree das colunas buscadas, em vez de ``icontains`` entre joins.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        query = Q()
+        for field in self.get_search_fields(request):
+            query |= Q(**{field + '__startswith': search_term})
+        return queryset.filter(query), False
+
+
+class LessonProgressAdmin(ScalableAdmin):
     list_display = ['user', 'lesson', 'completed', 'completed_at']
-    search_fields = ['user__username', 'lesson__name']
+    list_select_related = ['user', 'lesson']
+    search_fields = ['user__username', 'lesson__course__slug']
     list_filter = ['completed', 'created_at']
+    date_hierarchy = 'completed_at'
+    raw_id_fields = ['user', 'lesson']
     readonly_fields = ['created_at', 'updated_at']
 
-class CourseProgressAdmin(admin.ModelAdmin):
+class CourseProgressAdmin(ScalableAdmin):
     list_display = ['user', 'course', 'progress_percentage', 'completed_lessons', 'total_lessons', 'completed_at']
-    search_fields = ['user__username', 'course__name']
-    list_filter = ['completed_at', 'created_at']
-    readonly_fields = ['progress_percentage', 'completed_lessons', 'total_lessons', 'created_at', 'updated_at']
+    list_select_related = ['user', 'course']
+    search_fields = ['user__username', 'course__slug']
+    list_filter = ['created_at']
+    date_hierarchy = 'completed_at'
+    raw_id_fields = ['user', 'course', 'enrollment']
+    readonly_fields = [
+        'progress_percentage', 'completed_lessons', 'total_lessons', 'last_lesson', 'next_lesson',
+        'created_at', 'updated_at',
+    ]
+    actions = ['recalculate_progress', 'issue_certificates', 'export_csv', 'export_lessons_csv']
+
+    @admin.action(description='Recalcular progresso selecionado')
+    def recalculate_progress(self, request, queryset):
+        updated = ProgressManager.recalculate_progress(queryset)
+        self.message_user(request, '%d progressos recalculados.' % updated)
+
+    @admin.action(description='Emitir certificados pendentes dos cursos concluídos')
+    def issue_certificates(self, request, queryset):
+        created = CertificateManager.issue_certificates(queryset)
+        self.message_user(request, '%d certificados emitidos.' % created)
+
+    @admin.action(description='Exportar progresso selecionado (CSV)')
+    def export_csv(self, request, queryset):
+        return export.streaming_response(request, 'cursos', 'csv', queryset=queryset)
+
+    @admin.action(description='Exportar progresso por aula dos cursos selecionados (CSV)')
+    def export_lessons_csv(self, request, queryset):
+        courses = queryset.values('course_id').distinct()
+        return export.streaming_response(request, 'aulas', 'csv', courses=courses)
 
-class CertificateAdmin(admin.ModelAdmin):
+class CertificateAdmin(ScalableAdmin):
     list_display = ['certificate_number', 'user', 'course', 'issued_at']
-    search_fields = ['user__username', 'course__name', 'certificate_number']
-    list_filter = ['issued_at']
+    list_select_related = ['user', 'course']
+    search_fields = ['certificate_number', 'user__username', 'course__slug']
+    date_hierarchy = 'issued_at'
+    raw_id_fields = ['user', 'course', 'course_progress']
     readonly_fields = ['certificate_number', 'issued_at']
+    actions = ['regenerate_certificates']
+
+    @admin.action(description='Regenerar PDFs dos certificados selecionados')
+    def regenerate_certificates(self, request, queryset):
+        updated = CertificateManager.reset_certificate_files(queryset)
+        self.message_user(
+            request, '%d certificados serão regenerados no próximo download.' % updated
+        )
+
+class CourseDailyActivityAdmin(admin.ModelAdmin):
+    list_display = ['course', 'day', 'seconds', 'heartbeats']
+    list_select_related = ['course']
+    search_fields = ['course__slug']
+    date_hierarchy = 'day'
+    readonly_fields = ['course', 'day', 'seconds', 'heartbeats']
+
+class CourseStatsAdmin(admin.ModelAdmin):
+    list_display = ['course', 'enrolled_count', 'completed_count', 'certificate_count']
+    list_select_related = ['course']
+    search_fields = ['course__slug']
+    readonly_fields = ['course', 'enrolled_count', 'completed_count', 'certificate_count']
+
 
 admin.site.register(Course, CourseAdmin)
 admin.site.register([Enrollment, Announcement, Comment, Material])
@@ -51,4 +156,6 @@ admin.site.register(Lesson, LessonAdmin)
 admin.site.register(LessonProgress, LessonProgressAdmin)
 admin.site.register(CourseProgress, CourseProgressAdmin)
 admin.site.register(Certificate, CertificateAdmin)
+admin.site.register(CourseDailyActivity, CourseDailyActivityAdmin)
+admin.site.register(CourseStats, CourseStatsAdmin)
 
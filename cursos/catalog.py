@@ -0,0 +1,305 @@
+"""
+Importação e exportação do catálogo (curso, aulas e materiais) em JSON ou
+NDJSON.
+
+Cada documento é a árvore completa de um curso::
+
+    {"slug": "python", "name": "Python", "description": "", "about": "",
+     "start_date": "2024-01-10", "image": "",
+     "lessons": [{"number": 1, "name": "Introdução", "description": "",
+                  "release_date": null,
+                  "materials": [{"name": "Vídeo", "embedded": "<iframe>", "file": ""}]}]}
+
+No formato JSON o arquivo é uma lista desses documentos; no NDJSON, um por
+linha. A importação é idempotente: cursos são identificados pelo slug, aulas
+pelo número dentro do curso e materiais pelo nome dentro da aula.
+"""
+import json
+from datetime import date
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Course, CourseProgress, Lesson, Material
+from .progress import ProgressManager
+
+FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+COURSE_FIELDS = ['name', 'description', 'about', 'start_date', 'image']
+LESSON_FIELDS = ['name', 'description', 'release_date']
+MATERIAL_FIELDS = ['embedded', 'file']
+CHUNK_SIZE = 100
+
+
+class CatalogError(ValueError):
+    """Documento de catálogo inválido."""
+
+
+def serialize_date(value):
+    return value.isoformat() if value else None
+
+
+def parse_date(value, where):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise CatalogError('%s: data inválida "%s"' % (where, value))
+
+
+# Exportação
+
+def course_document(course):
+    return {
+        'slug': course.slug,
+        'name': course.name,
+        'description': course.description,
+        'about': course.about,
+        'start_date': serialize_date(course.start_date),
+        'image': course.image.name or '',
+        'lessons': [
+            {
+                'number': lesson.number,
+                'name': lesson.name,
+                'description': lesson.description,
+                'release_date': serialize_date(lesson.release_date),
+                'materials': [
+                    {'name': material.name, 'embedded': material.embedded, 'file': material.file.name or ''}
+                    for material in lesson.materials.all()
+                ],
+            }
+            for lesson in course.lessons.all()
+        ],
+    }
+
+
+def catalog_queryset(slugs=None):
+    courses = Course.objects.order_by('pk').prefetch_related(Prefetch(
+        'lessons',
+        queryset=Lesson.objects.order_by('number', 'pk').prefetch_related(
+            Prefetch('materials', queryset=Material.objects.order_by('pk'))
+        ),
+    ))
+    if slugs:
+        courses = courses.filter(slug__in=slugs)
+    return courses
+
+
+def export_lines(fmt='json', slugs=None, chunk_size=CHUNK_SIZE):
+    """
+    Gera o catálogo em pedaços de texto. Os cursos são lidos em blocos de
+    ``chunk_size`` com as aulas e materiais pré-carregados por bloco.
+    """
+    courses = catalog_queryset(slugs).iterator(chunk_size=chunk_size)
+    if fmt == 'ndjson':
+        for course in courses:
+            yield json.dumps(course_document(course), ensure_ascii=False) + '\n'
+        return
+    yield '['
+    separator = '\n'
+    for course in courses:
+        yield separator + json.dumps(course_document(course), ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+# Importação
+
+def read_documents(stream, fmt='json'):
+    """Lê os documentos de um arquivo aberto (o NDJSON é lido linha a linha)."""
+    if fmt == 'ndjson':
+        for number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise CatalogError('linha %d: JSON inválido (%s)' % (number, e))
+        return
+    try:
+        documents = json.load(stream)
+    except ValueError as e:
+        raise CatalogError('JSON inválido (%s)' % e)
+    if not isinstance(documents, list):
+        raise CatalogError('O arquivo JSON deve conter uma lista de cursos')
+    yield from documents
+
+
+def clean_document(document):
+    """Valida um documento e converte as datas."""
+    if not isinstance(document, dict) or not document.get('slug') or not document.get('name'):
+        raise CatalogError(('Curso sem "slug" ou "name": %r' % (document,))[:200])
+    slug = document['slug']
+    course = {
+        'slug': slug,
+        'name': document['name'],
+        'description': document.get('description') or '',
+        'about': document.get('about') or '',
+        'start_date': parse_date(document.get('start_date'), slug),
+        'image': document.get('image') or '',
+        'lessons': {},
+    }
+    lessons = document.get('lessons') or []
+    if not isinstance(lessons, list):
+        raise CatalogError('%s: "lessons" precisa ser uma lista' % slug)
+    for lesson in lessons:
+        if not isinstance(lesson, dict):
+            raise CatalogError(('%s: aula inválida: %r' % (slug, lesson))[:200])
+        number = lesson.get('number')
+        where = '%s, aula %s' % (slug, number)
+        if not isinstance(number, int) or not lesson.get('name'):
+            raise CatalogError('%s: aula sem "number" inteiro ou "name"' % where)
+        if number in course['lessons']:
+            raise CatalogError('%s: número de aula repetido' % where)
+        materials = {}
+        lesson_materials = lesson.get('materials') or []
+        if not isinstance(lesson_materials, list):
+            raise CatalogError('%s: "materials" precisa ser uma lista' % where)
+        for material in lesson_materials:
+            if not isinstance(material, dict):
+                raise CatalogError(('%s: material inválido: %r' % (where, material))[:200])
+            if not material.get('name'):
+                raise CatalogError('%s: material sem "name"' % where)
+            materials[material['name']] = {
+                'embedded': material.get('embedded') or '',
+                'file': material.get('file') or '',
+            }
+        course['lessons'][number] = {
+            'name': lesson['name'],
+            'description': lesson.get('description') or '',
+            'release_date': parse_date(lesson.get('release_date'), where),
+            'materials': materials,
+        }
+    return course
+
+
+def upsert(model, existing, rows, fields, build):
+    """
+    Atualiza (bulk_update) os objetos existentes que mudaram e cria
+    (bulk_create) os que faltam. Retorna (criados, atualizados).
+    """
+    changed = []
+    new = []
+    for key, data in rows.items():
+        obj = existing.get(key)
+        if obj is None:
+            new.append(build(key, data))
+            continue
+        if any(getattr(obj, field) != data[field] for field in fields):
+            for field in fields:
+                setattr(obj, field, data[field])
+            changed.append(obj)
+    if changed:
+        model.objects.bulk_update(changed, fields, batch_size=500)
+    if new:
+        model.objects.bulk_create(new, batch_size=500)
+    return len(new), len(changed)
+
+
+class CatalogImporter:
+    """
+    Importa documentos de catálogo em blocos de cursos, tudo em uma única
+    transação: se algum documento for inválido nada é gravado. Com
+    ``prune=True`` aulas e materiais ausentes do arquivo são apagados (o que
+    também apaga o progresso dos alunos nessas aulas).
+    """
+
+    def __init__(self, prune=False, chunk_size=CHUNK_SIZE):
+        self.prune = prune
+        self.chunk_size = chunk_size
+        self.result = {key: 0 for key in (
+            'courses_created', 'courses_updated', 'lessons_created', 'lessons_updated',
+            'lessons_deleted', 'materials_created', 'materials_updated', 'materials_deleted',
+        )}
+        self.seen = set()
+
+    def run(self, documents):
+        documents = iter(documents)
+        with transaction.atomic():
+            while True:
+                chunk = [clean_document(document) for document in islice(documents, self.chunk_size)]
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+        return self.result
+
+    def count(self, prefix, created, updated):
+        self.result[prefix + '_created'] += created
+        self.result[prefix + '_updated'] += updated
+
+    def import_chunk(self, chunk):
+        documents = {}
+        for document in chunk:
+            if document['slug'] in self.seen:
+                raise CatalogError('%s: curso repetido no arquivo' % document['slug'])
+            self.seen.add(document['slug'])
+            documents[document['slug']] = document
+
+        def load_courses():
+            courses = {}
+            for course in Course.objects.filter(slug__in=list(documents)).order_by('-pk'):
+                # Slugs não são únicos no modelo: vale o curso mais antigo
+                courses[course.slug] = course
+            return courses
+
+        courses = load_courses()
+        self.count('courses', *upsert(
+            Course, courses, documents, COURSE_FIELDS,
+            lambda slug, data: Course(slug=slug, **{field: data[field] for field in COURSE_FIELDS})
+        ))
+        courses = load_courses()
+
+        lessons_data = {
+            (courses[slug].pk, number): lesson
+            for slug, document in documents.items()
+            for number, lesson in document['lessons'].items()
+        }
+        course_ids = [course.pk for course in courses.values()]
+
+        def load_lessons():
+            return {
+                (lesson.course_id, lesson.number): lesson
+                for lesson in Lesson.objects.filter(course_id__in=course_ids).order_by('-pk')
+            }
+
+        lessons = load_lessons()
+        self.count('lessons', *upsert(
+            Lesson, lessons, lessons_data, LESSON_FIELDS,
+            lambda key, data: Lesson(
+                course_id=key[0], number=key[1], **{field: data[field] for field in LESSON_FIELDS}
+            )
+        ))
+        if self.prune:
+            stale = [lesson.pk for key, lesson in lessons.items() if key not in lessons_data]
+            self.result['lessons_deleted'] += Lesson.objects.filter(pk__in=stale).delete()[1].get(
+                Lesson._meta.label, 0
+            )
+        # bulk_update não dispara sinais: invalida as listagens e recalcula o
+        # progresso (percentual, próxima aula e ranking) dos cursos de uma vez
+        Course.objects.filter(pk__in=course_ids).update(updated_at=timezone.now())
+        ProgressManager.recalculate_progress(CourseProgress.objects.filter(course_id__in=course_ids))
+        lessons = load_lessons()
+
+        materials_data = {
+            (lessons[key].pk, name): material
+            for key, lesson in lessons_data.items()
+            for name, material in lesson['materials'].items()
+        }
+        lesson_ids = [lessons[key].pk for key in lessons_data]
+        materials = {
+            (material.lesson_id, material.name): material
+            for material in Material.objects.filter(lesson_id__in=lesson_ids).order_by('-pk')
+        }
+        self.count('materials', *upsert(
+            Material, materials, materials_data, MATERIAL_FIELDS,
+            lambda key, data: Material(
+                lesson_id=key[0], name=key[1], **{field: data[field] for field in MATERIAL_FIELDS}
+            )
+        ))
+        if self.prune:
+            stale = [material.pk for key, material in materials.items() if key not in materials_data]
+            self.result['materials_deleted'] += Material.objects.filter(pk__in=stale).delete()[0]
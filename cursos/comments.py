@@ -0,0 +1,32 @@
+"""
+Paginação por chave (keyset) dos comentários de um anúncio.
+
+Os comentários são lidos em ordem de ``(created_at, id)`` a partir do cursor
+da página anterior, com o autor no mesmo SELECT. O custo de cada página não
+depende de quantos comentários vieram antes (sem OFFSET nem COUNT).
+"""
+from django.db.models import Q
+
+from .cursors import encode_cursor, decode_cursor
+
+COMMENTS_PER_PAGE = 50
+
+
+def comments_page(announcement, cursor=None, per_page=COMMENTS_PER_PAGE):
+    """
+    Uma página de comentários depois de ``cursor``. Retorna
+    ``(comentários, cursor da próxima página ou None)``.
+    """
+    comments = announcement.comments.select_related('user').order_by('created_at', 'pk')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, pk = position
+        comments = comments.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+        )
+    # Um a mais para saber se existe próxima página
+    page = list(comments[:per_page + 1])
+    if len(page) > per_page:
+        page = page[:per_page]
+        return page, encode_cursor(page[-1].created_at, page[-1].pk)
+    return page, None
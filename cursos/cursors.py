@@ -0,0 +1,21 @@
+"""
+Cursores opacos para paginação por chave: codificam a posição
+``(data, id)`` do último item entregue.
+"""
+import base64
+from datetime import datetime
+
+
+def encode_cursor(moment, pk):
+    raw = '%s|%d' % (moment.isoformat(), pk)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Retorna ``(data, id)`` ou ``None`` se o cursor for inválido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        moment, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(moment), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
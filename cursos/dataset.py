@@ -0,0 +1,186 @@
+"""
+Gerador de dados sintéticos em larga escala para testes de desempenho.
+
+Todas as linhas são criadas com ``bulk_create`` em lotes, usando um gerador
+aleatório com semente fixa para que a mesma configuração produza sempre o
+mesmo banco.
+"""
+import hashlib
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import stats
+from .models import (
+    Course, Lesson, Material, Enrollment, LessonProgress, CourseProgress, Certificate
+)
+
+DEFAULT_PASSWORD = 'senha123'
+
+
+class DatasetGenerator:
+    """
+    Gera usuários, cursos, aulas, materiais, matrículas, progresso e
+    certificados.
+
+    ``completion_ratio`` é a fração de matrículas que chegam a 100%; as demais
+    param em um ponto sorteado de uma distribuição beta concentrada no início
+    do curso, como acontece com alunos reais.
+    """
+
+    def __init__(self, users, courses, lessons_per_course, completion_ratio=0.4,
+                 enrollments_per_user=3, seed=42, batch_size=1000,
+                 prefix='sintetico', certificate_pdfs=False, log=None):
+        self.users = users
+        self.courses = courses
+        self.lessons_per_course = lessons_per_course
+        self.completion_ratio = completion_ratio
+        self.enrollments_per_user = min(enrollments_per_user, courses)
+        self.seed = seed
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.certificate_pdfs = certificate_pdfs
+        self.log = log or (lambda message: None)
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+        self.counts = {}
+        self.course_lessons = {}
+
+    @staticmethod
+    def exists(prefix):
+        """Indica se já existe um conjunto gerado com este prefixo."""
+        return User.objects.filter(username__startswith=prefix).exists()
+
+    def run(self):
+        """Gera todo o conjunto de dados e retorna as estatísticas."""
+        start = time.perf_counter()
+        self.create_courses()
+        password = make_password(DEFAULT_PASSWORD)
+        for offset in range(0, self.users, self.batch_size):
+            size = min(self.batch_size, self.users - offset)
+            with transaction.atomic():
+                self.create_user_batch(offset, size, password)
+            self.log('%d/%d usuários' % (offset + size, self.users))
+        # As linhas foram criadas em lote, sem os sinais que mantêm as estatísticas
+        stats.rebuild(self.course_ids)
+        elapsed = time.perf_counter() - start
+        total = sum(self.counts.values())
+        return {
+            'counts': dict(self.counts),
+            'rows': total,
+            'seconds': elapsed,
+            'rows_per_second': total / elapsed if elapsed else 0.0,
+        }
+
+    def _bulk_create(self, model, objs):
+        created = model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(created)
+        return created
+
+    def create_courses(self):
+        with transaction.atomic():
+            courses = self._bulk_create(Course, [
+                Course(
+                    name='Curso %s %d' % (self.prefix, number),
+                    slug='%s-curso-%d' % (self.prefix, number),
+                    description='Curso gerado automaticamente',
+                    start_date=(self.now - timedelta(days=self.rng.randint(0, 365))).date(),
+                )
+                for number in range(1, self.courses + 1)
+            ])
+            if courses and courses[0].pk is None:
+                courses = list(Course.objects.filter(slug__startswith='%s-curso-' % self.prefix))
+
+            lessons = self._bulk_create(Lesson, [
+                Lesson(name='Aula %d' % number, number=number, course=course,
+                       description='Conteúdo da aula %d' % number)
+                for course in courses
+                for number in range(1, self.lessons_per_course + 1)
+            ])
+            if lessons and lessons[0].pk is None:
+                lessons = list(Lesson.objects.filter(course__in=courses))
+            for lesson in sorted(lessons, key=lambda lesson: (lesson.course_id, lesson.number)):
+                self.course_lessons.setdefault(lesson.course_id, []).append(lesson.pk)
+
+            self._bulk_create(Material, [
+                Material(name='Vídeo - %s' % lesson.name, embedded='<iframe></iframe>', lesson=lesson)
+                for lesson in lessons
+            ])
+        self.course_ids = sorted(self.course_lessons) or [course.pk for course in courses]
+
+    def create_user_batch(self, offset, size, password):
+        users = self._bulk_create(User, [
+            User(
+                username='%s%07d' % (self.prefix, number),
+                email='%s%07d@example.com' % (self.prefix, number),
+                first_name='Aluno', last_name=str(number),
+                password=password,
+            )
+            for number in range(offset + 1, offset + size + 1)
+        ])
+        if users and users[0].pk is None:
+            users = list(User.objects.filter(
+                username__in=[user.username for user in users]
+            ).order_by('username'))
+
+        enrollments = self._bulk_create(Enrollment, [
+            Enrollment(user=user, course_id=course_id, status=1)
+            for user in users
+            for course_id in self.rng.sample(self.course_ids, self.enrollments_per_user)
+        ])
+        if enrollments and enrollments[0].pk is None:
+            enrollments = list(Enrollment.objects.filter(user__in=users))
+
+        lesson_progress = []
+        course_progress = []
+        for enrollment in enrollments:
+            lesson_ids = self.course_lessons.get(enrollment.course_id, [])
+            if self.rng.random() < self.completion_ratio:
+                completed = len(lesson_ids)
+            else:
+                completed = int(self.rng.betavariate(0.7, 2.0) * len(lesson_ids))
+                completed = min(completed, max(len(lesson_ids) - 1, 0))
+            started = self.now - timedelta(days=self.rng.uniform(1, 180))
+            moment = started
+            for lesson_id in lesson_ids[:completed]:
+                moment += timedelta(hours=self.rng.uniform(0.5, 48))
+                lesson_progress.append(LessonProgress(
+                    user_id=enrollment.user_id, lesson_id=lesson_id,
+                    completed=True, completed_at=min(moment, self.now),
+                ))
+            total = len(lesson_ids)
+            course_progress.append(CourseProgress(
+                user_id=enrollment.user_id, course_id=enrollment.course_id,
+                enrollment=enrollment, completed_lessons=completed,
+                total_lessons=total,
+                progress_percentage=completed * 100 / total if total else 0.0,
+                completed_at=min(moment, self.now) if total and completed == total else None,
+                last_lesson_id=lesson_ids[completed - 1] if completed else None,
+                next_lesson_id=lesson_ids[completed] if completed < total else None,
+            ))
+        self._bulk_create(LessonProgress, lesson_progress)
+        course_progress = self._bulk_create(CourseProgress, course_progress)
+        if course_progress and course_progress[0].pk is None:
+            course_progress = list(CourseProgress.objects.filter(user__in=users))
+
+        certificates = self._bulk_create(Certificate, [
+            Certificate(
+                user_id=progress.user_id, course_id=progress.course_id,
+                course_progress=progress,
+                certificate_number=hashlib.md5(
+                    ('%s-%s-%s' % (progress.user_id, progress.course_id, self.seed)).encode()
+                ).hexdigest()[:16].upper(),
+            )
+            for progress in course_progress if progress.completed_at is not None
+        ])
+        if self.certificate_pdfs:
+            from .progress import CertificateManager
+            for certificate in Certificate.objects.filter(
+                pk__in=[certificate.pk for certificate in certificates]
+            ).select_related('user', 'course'):
+                CertificateManager.save_certificate_file(certificate)
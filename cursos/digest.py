@@ -0,0 +1,114 @@
+"""
+Resumo periódico de anúncios.
+
+Alunos com ``NotificationPreference.announcement_delivery = 'digest'`` não
+recebem um e-mail por anúncio: o comando ``send_announcement_digest`` junta
+os anúncios de todos os cursos do aluno criados desde o último resumo
+(``last_digest_at``) e grava uma única mensagem na fila de saída. Os alunos
+são processados em blocos, com um número fixo de queries por bloco.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.template.defaultfilters import striptags
+from django.template.loader import get_template
+from django.utils import timezone
+
+from accounts.models import NotificationPreference
+from core import metrics
+from core.mail import enqueue, send_now, get_setting as mail_setting
+
+from .models import Enrollment, Announcement
+
+TEMPLATE_NAME = 'courses/announcement_digest.html'
+CHUNK_SIZE = 500
+
+
+def digest_subject(total):
+    if total == 1:
+        return 'Resumo: 1 novo anúncio nos seus cursos'
+    return 'Resumo: %d novos anúncios nos seus cursos' % total
+
+
+def pending_preferences(now, period):
+    """Preferências de resumo cujo último envio tem pelo menos ``period``."""
+    return NotificationPreference.objects.filter(
+        announcement_delivery=NotificationPreference.DIGEST,
+        last_digest_at__lte=now - period,
+    ).select_related('user').order_by('pk')
+
+
+def build_digests(preferences, now):
+    """
+    Monta as mensagens de um bloco de alunos: uma query para as matrículas e
+    outra para os anúncios de todos os cursos envolvidos.
+    """
+    user_ids = [preference.user_id for preference in preferences]
+    courses_by_user = {}
+    for user_id, course_id in Enrollment.objects.filter(
+        user_id__in=user_ids, status=1
+    ).values_list('user_id', 'course_id'):
+        courses_by_user.setdefault(user_id, set()).add(course_id)
+
+    course_ids = set().union(*courses_by_user.values()) if courses_by_user else set()
+    announcements = {}
+    if course_ids:
+        since = min(preference.last_digest_at for preference in preferences)
+        for announcement in Announcement.objects.filter(
+            course_id__in=course_ids, created_at__gt=since, created_at__lte=now
+        ).select_related('course').order_by('course__name', 'course_id', 'created_at'):
+            announcements.setdefault(announcement.course_id, []).append(announcement)
+
+    template = get_template(TEMPLATE_NAME)
+    messages = []
+    for preference in preferences:
+        if not preference.user.email:
+            continue
+        courses = []
+        for course_id, course_announcements in announcements.items():
+            if course_id not in courses_by_user.get(preference.user_id, ()):
+                continue
+            items = [a for a in course_announcements if a.created_at > preference.last_digest_at]
+            if items:
+                courses.append({'course': items[0].course, 'announcements': items})
+        if not courses:
+            continue
+        message_html = template.render({'user': preference.user, 'courses': courses})
+        messages.append({
+            'subject': digest_subject(sum(len(c['announcements']) for c in courses)),
+            'body_text': striptags(message_html),
+            'body_html': message_html,
+            'from_email': settings.DEFAULT_FROM_EMAIL,
+            'recipients': [preference.user.email],
+            'template_name': TEMPLATE_NAME,
+        })
+    return messages
+
+
+def send_announcement_digests(now=None, period=timedelta(days=1), chunk_size=CHUNK_SIZE):
+    """
+    Envia (para a fila) os resumos pendentes. Alunos sem anúncios novos só
+    têm o cursor avançado. Retorna ``(alunos processados, resumos gerados)``.
+    """
+    now = now or timezone.now()
+    processed = sent = 0
+    last_pk = 0
+    while True:
+        preferences = list(pending_preferences(now, period).filter(pk__gt=last_pk)[:chunk_size])
+        if not preferences:
+            return processed, sent
+        last_pk = preferences[-1].pk
+        with metrics.mail_duration.time(template=TEMPLATE_NAME):
+            messages = build_digests(preferences, now)
+        with transaction.atomic():
+            if messages:
+                if mail_setting('ENABLED'):
+                    enqueue(messages)
+                else:
+                    send_now(messages)
+            NotificationPreference.objects.filter(
+                pk__in=[preference.pk for preference in preferences]
+            ).update(last_digest_at=now)
+        processed += len(preferences)
+        sent += len(messages)
@@ -0,0 +1,267 @@
+"""
+Importação de matrículas em lote a partir de CSV.
+
+Colunas: ``username`` (obrigatória), ``email``, ``first_name``, ``last_name``
+e ``curso`` (slug; opcional quando um curso padrão é informado). O arquivo é
+lido em blocos; em cada bloco usuários e matrículas são inseridos/atualizados
+e os CourseProgress correspondentes são criados com ``bulk_create`` e
+contadores já calculados, com um número fixo de queries por bloco. Linhas
+inválidas são reportadas sem interromper a importação.
+"""
+import csv
+import io
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import ranking, stats
+from .models import Course, Enrollment, CourseProgress, LessonProgress, refresh_next_lessons
+
+CHUNK_SIZE = 1000
+
+
+class EnrollmentImporter:
+    """
+    Importa um CSV de matrículas. ``run(lines)`` aceita qualquer iterável de
+    linhas de texto (arquivo aberto, upload decodificado) e retorna o resumo
+    com os contadores e a lista de erros ``(linha, mensagem)``.
+    """
+
+    def __init__(self, course=None, chunk_size=CHUNK_SIZE):
+        self.default_course = course
+        self.chunk_size = chunk_size
+        self.courses = {}
+        self.seen = set()
+        self.result = {
+            'rows': 0,
+            'users_created': 0,
+            'users_updated': 0,
+            'enrollments_created': 0,
+            'enrollments_reactivated': 0,
+            'progress_created': 0,
+            'errors': [],
+        }
+
+    def run(self, lines):
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames or 'username' not in reader.fieldnames:
+            self.result['errors'].append((1, 'Cabeçalho sem a coluna "username"'))
+            return self.result
+        if self.default_course is None and 'curso' not in reader.fieldnames:
+            self.result['errors'].append((1, 'Informe um curso ou a coluna "curso"'))
+            return self.result
+
+        if self.default_course is not None:
+            self.default_course = Course.objects.annotate(
+                lessons_count=Count('lessons')
+            ).get(pk=self.default_course.pk)
+            self.courses[self.default_course.slug] = self.default_course
+
+        # A linha 1 é o cabeçalho
+        rows = enumerate(reader, start=2)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+        return self.result
+
+    def error(self, line, message):
+        self.result['errors'].append((line, message))
+
+    def load_courses(self, slugs):
+        missing = [slug for slug in slugs if slug not in self.courses]
+        if not missing:
+            return
+        found = Course.objects.filter(slug__in=missing).annotate(lessons_count=Count('lessons'))
+        for course in found:
+            self.courses[course.slug] = course
+        for slug in missing:
+            self.courses.setdefault(slug, None)
+
+    def clean_rows(self, chunk):
+        """Valida as linhas do bloco e descarta as inválidas ou repetidas."""
+        self.load_courses({
+            (row.get('curso') or '').strip() for line, row in chunk if row.get('curso')
+        })
+
+        valid = []
+        for line, row in chunk:
+            self.result['rows'] += 1
+            username = (row.get('username') or '').strip()
+            email = (row.get('email') or '').strip()
+            slug = (row.get('curso') or '').strip()
+            course = self.courses.get(slug) if slug else self.default_course
+            if not username:
+                self.error(line, 'username vazio')
+                continue
+            if len(username) > 150:
+                self.error(line, 'username com mais de 150 caracteres')
+                continue
+            if email:
+                try:
+                    validate_email(email)
+                except ValidationError:
+                    self.error(line, 'e-mail inválido: %s' % email)
+                    continue
+            if course is None:
+                self.error(line, 'curso não encontrado: %s' % slug)
+                continue
+            if (username, course.pk) in self.seen:
+                self.error(line, 'matrícula repetida no arquivo')
+                continue
+            self.seen.add((username, course.pk))
+            valid.append((line, {
+                'username': username,
+                'email': email,
+                'first_name': (row.get('first_name') or '').strip()[:150],
+                'last_name': (row.get('last_name') or '').strip()[:150],
+                'course': course,
+            }))
+        return valid
+
+    def import_chunk(self, chunk):
+        rows = self.clean_rows(chunk)
+        if not rows:
+            return
+        counters = dict(self.result)
+        try:
+            with transaction.atomic():
+                users = self.upsert_users(rows)
+                enrollments = self.upsert_enrollments(rows, users)
+                self.create_progress(enrollments)
+        except DatabaseError as e:
+            # Desfaz os contadores do bloco revertido
+            counters['errors'] = self.result['errors']
+            self.result = counters
+            first, last = rows[0][0], rows[-1][0]
+            self.error(first, 'bloco das linhas %d a %d não importado: %s' % (first, last, e))
+
+    def upsert_users(self, rows):
+        data = {}
+        for line, row in rows:
+            data.setdefault(row['username'], row)
+        users = User.objects.in_bulk(list(data), field_name='username')
+
+        changed = []
+        for username, user in users.items():
+            row = data[username]
+            updates = {
+                field: row[field] for field in ('email', 'first_name', 'last_name')
+                if row[field] and getattr(user, field) != row[field]
+            }
+            if updates:
+                for field, value in updates.items():
+                    setattr(user, field, value)
+                changed.append(user)
+        if changed:
+            User.objects.bulk_update(changed, ['email', 'first_name', 'last_name'])
+            self.result['users_updated'] += len(changed)
+
+        # Alunos importados definem a senha pelo "esqueci minha senha"
+        password = make_password(None)
+        new_users = [
+            User(
+                username=username, email=row['email'], password=password,
+                first_name=row['first_name'], last_name=row['last_name']
+            )
+            for username, row in data.items() if username not in users
+        ]
+        if new_users:
+            User.objects.bulk_create(new_users)
+            self.result['users_created'] += len(new_users)
+            users.update(User.objects.in_bulk(
+                [user.username for user in new_users], field_name='username'
+            ))
+        return users
+
+    def upsert_enrollments(self, rows, users):
+        pairs = {(users[row['username']].pk, row['course'].pk) for line, row in rows}
+        user_ids = {user_id for user_id, course_id in pairs}
+        course_ids = {course_id for user_id, course_id in pairs}
+
+        def existing():
+            return {
+                (enrollment.user_id, enrollment.course_id): enrollment
+                for enrollment in Enrollment.objects.filter(
+                    user_id__in=user_ids, course_id__in=course_ids
+                ).select_related('progress')
+                if (enrollment.user_id, enrollment.course_id) in pairs
+            }
+
+        enrollments = existing()
+        # UPDATE e bulk_create não disparam os sinais: conta as matrículas aprovadas aqui
+        approved = {}
+        inactive = [e for e in enrollments.values() if e.status != 1]
+        if inactive:
+            # ``update`` (auto_now) não muda no UPDATE em lote; o feed de anúncios depende dele
+            Enrollment.objects.filter(pk__in=[e.pk for e in inactive]).update(
+                status=1, update=timezone.now()
+            )
+            self.result['enrollments_reactivated'] += len(inactive)
+            for enrollment in inactive:
+                approved[enrollment.course_id] = approved.get(enrollment.course_id, 0) + 1
+            # Quem já tinha progresso volta ao ranking do curso
+            ranking.record_added([
+                enrollment.progress for enrollment in inactive if hasattr(enrollment, 'progress')
+            ])
+
+        new_enrollments = [
+            Enrollment(user_id=user_id, course_id=course_id, status=1)
+            for user_id, course_id in pairs if (user_id, course_id) not in enrollments
+        ]
+        if new_enrollments:
+            Enrollment.objects.bulk_create(new_enrollments)
+            self.result['enrollments_created'] += len(new_enrollments)
+            for enrollment in new_enrollments:
+                approved[enrollment.course_id] = approved.get(enrollment.course_id, 0) + 1
+            enrollments = existing()
+        stats.record_enrollments(approved)
+        return enrollments
+
+    def create_progress(self, enrollments):
+        pending = []
+        for enrollment in enrollments.values():
+            try:
+                enrollment.progress
+            except CourseProgress.DoesNotExist:
+                pending.append(enrollment)
+        if not pending:
+            return
+
+        # Alunos que já tinham aulas concluídas (ex.: matrícula cancelada e refeita)
+        completed = {
+            (row['user_id'], row['lesson__course_id']): row['total']
+            for row in LessonProgress.objects.filter(
+                user_id__in={e.user_id for e in pending},
+                lesson__course_id__in={e.course_id for e in pending},
+                completed=True,
+            ).values('user_id', 'lesson__course_id').annotate(total=Count('pk'))
+        }
+        lessons = {course.pk: course.lessons_count for course in self.courses.values() if course}
+        progress = []
+        for enrollment in pending:
+            progress_row = CourseProgress(
+                user_id=enrollment.user_id, course_id=enrollment.course_id,
+                enrollment=enrollment,
+            )
+            progress_row.apply_counts(
+                lessons.get(enrollment.course_id, 0),
+                completed.get((enrollment.user_id, enrollment.course_id), 0),
+            )
+            progress.append(progress_row)
+        CourseProgress.objects.bulk_create(progress)
+        ranking.record_added(progress)
+        refresh_next_lessons(CourseProgress.objects.filter(enrollment__in=pending))
+        self.result['progress_created'] += len(progress)
+
+
+def decode_upload(uploaded_file, encoding='utf-8-sig'):
+    """Lê um arquivo enviado como texto, em streaming."""
+    return io.TextIOWrapper(uploaded_file.file, encoding=encoding, newline='')
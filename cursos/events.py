@@ -0,0 +1,175 @@
+"""
+Eventos de progresso em tempo real (Server-Sent Events).
+
+``ProgressManager`` publica no ``broker`` deste processo quando o progresso de
+um aluno muda ou um certificado fica pronto; cada conexão SSE aberta pelo
+aluno (``cursos:progress_events``) assina os eventos do usuário e os recebe
+por uma ``asyncio.Queue``. Não há broker externo: o stream só recebe eventos
+publicados pelo mesmo processo, então sirva-o com um único processo ASGI (ex.:
+``uvicorn simplemooc.asgi:application``) ou aponte o endpoint para ele.
+
+Conexões ociosas custam só uma tarefa suspensa no event loop. Ao conectar o
+cliente recebe o estado atual dos seus cursos, então um evento perdido durante
+uma reconexão é corrigido pelo estado inicial da conexão seguinte.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+
+DEFAULTS = {
+    # Eventos guardados por conexão; se o cliente não acompanhar, os mais antigos são descartados
+    'QUEUE_SIZE': 100,
+    # Comentário enviado a cada N segundos sem eventos (mantém proxies com a conexão aberta)
+    'HEARTBEAT': 15,
+    # Duração máxima de uma conexão (s); o EventSource reconecta sozinho
+    'STREAM_TIMEOUT': 300,
+    # Espera sugerida ao cliente antes de reconectar (ms)
+    'RETRY': 3000,
+}
+
+Event = namedtuple('Event', 'id name data')
+
+
+def get_setting(name):
+    """Lê uma opção de ``settings.PROGRESS_EVENTS`` com valor padrão."""
+    return getattr(settings, 'PROGRESS_EVENTS', {}).get(name, DEFAULTS[name])
+
+
+class Subscription:
+    """Fila de eventos de uma conexão, ligada ao event loop que a consome."""
+
+    def __init__(self, user_id, loop, maxsize):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, event):
+        # Roda no event loop da conexão
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class EventBroker:
+    """
+    Pub/sub em memória por usuário. ``publish`` pode ser chamado de qualquer
+    thread (views síncronas, workers); a entrega é agendada no loop de cada
+    assinante com ``call_soon_threadsafe``.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, asyncio.get_running_loop(), get_setting('QUEUE_SIZE'))
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def publish(self, user_id, name, data):
+        """Envia o evento para as conexões abertas do usuário. Retorna quantas eram."""
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        if not subscriptions:
+            return 0
+        event = Event(next(self._ids), name, data)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Loop já encerrado: a conexão será removida pelo próprio stream
+                pass
+        return len(subscriptions)
+
+
+broker = EventBroker()
+
+
+def publish_on_commit(user_id, name, data):
+    """Publica depois do COMMIT, para o cliente nunca ver um estado desfeito."""
+    transaction.on_commit(lambda: broker.publish(user_id, name, data))
+
+
+def progress_data(slug, progress):
+    return {
+        'course': slug,
+        'completed_lessons': progress.completed_lessons,
+        'total_lessons': progress.total_lessons,
+        'progress_percentage': progress.progress_percentage,
+        'completed': progress.completed_at is not None,
+    }
+
+
+def certificate_data(slug, certificate):
+    return {
+        'course': slug,
+        'certificate_number': certificate.certificate_number,
+        'download_url': reverse('cursos:download_certificate', args=[slug]),
+    }
+
+
+def format_event(event):
+    return 'id: %d\nevent: %s\ndata: %s\n\n' % (
+        event.id, event.name, json.dumps(event.data, ensure_ascii=False)
+    )
+
+
+async def initial_events(user_id):
+    """Estado atual do progresso do aluno em cada curso (async ORM)."""
+    from .models import CourseProgress
+
+    progresses = CourseProgress.objects.filter(
+        user_id=user_id, enrollment__status=1
+    ).select_related('course').order_by('course_id')
+    return [
+        Event(0, 'progress', progress_data(progress.course.slug, progress))
+        async for progress in progresses
+    ]
+
+
+async def event_stream(user_id, heartbeat=None, timeout=None, clock=time.monotonic):
+    """
+    Gerador assíncrono com o corpo do stream SSE. A assinatura é feita na
+    primeira iteração, no event loop que atende a conexão, e antes de ler o
+    estado inicial, para nenhum evento se perder entre as duas coisas.
+    """
+    heartbeat = heartbeat or get_setting('HEARTBEAT')
+    deadline = clock() + (timeout or get_setting('STREAM_TIMEOUT'))
+    subscription = broker.subscribe(user_id)
+    try:
+        yield 'retry: %d\n\n' % get_setting('RETRY')
+        for event in await initial_events(user_id):
+            yield format_event(event)
+        while True:
+            remaining = deadline - clock()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
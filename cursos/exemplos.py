@@ -156,10 +156,8 @@ def mark_lesson_complete_example(request, slug, lesson_id):
     # Marcar como completa
     ProgressManager.mark_lesson_complete(request.user, lesson)
     
-    # Obter progresso atualizado
+    # Obter progresso atualizado (já gravado por mark_lesson_complete)
     course_progress = ProgressManager.get_course_progress(request.user, course)
-    course_progress.calculate_progress()
-    course_progress.save()
     
     # Gerar certificado se necessário
     certificate = None
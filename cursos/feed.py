@@ -0,0 +1,109 @@
+"""
+Feed JSON dos anúncios de todos os cursos em que o aluno está matriculado.
+
+Os anúncios são entregues em ordem de ``(updated_at, id)``: o cliente guarda
+o cursor da última resposta e pede só o que mudou depois dele (``since``),
+o que também traz anúncios editados. O estado do feed (maior ``updated_at``,
+total de anúncios e a matrícula mais recente) é lido com uma única agregação
+e vira ETag e Last-Modified, então uma consulta sem novidades responde 304
+sem listar nada.
+
+O cursor também guarda a matrícula mais recente do momento em que foi gerado:
+os anúncios antigos de um curso matriculado depois ficariam para trás da
+posição, então nesse caso o feed recomeça do início (``reset``).
+"""
+from django.db.models import Count, Max, Q
+from django.urls import reverse
+
+from .cursors import encode_cursor, decode_cursor
+from .models import Announcement
+
+FEED_LIMIT = 50
+MAX_FEED_LIMIT = 200
+
+
+def user_announcements(user):
+    """Anúncios dos cursos com matrícula aprovada (um JOIN com Enrollment)."""
+    return Announcement.objects.filter(
+        course__enrollments__user=user, course__enrollments__status=1
+    )
+
+
+def feed_state(user):
+    """
+    ``(maior updated_at, total de anúncios, matrícula mais recente)`` em uma
+    agregação; as datas são ``None`` se não houver anúncios.
+    """
+    # Max da matrícula no mesmo JOIN do filtro: só as matrículas do aluno
+    state = user_announcements(user).order_by().aggregate(
+        last_modified=Max('updated_at'), total=Count('pk'),
+        enrolled_at=Max('course__enrollments__update'),
+    )
+    return state['last_modified'], state['total'], state['enrolled_at']
+
+
+def microseconds(moment):
+    return round(moment.timestamp() * 10 ** 6)
+
+
+def encode_feed_cursor(updated_at, pk, enrolled_at):
+    return '%s.%d' % (encode_cursor(updated_at, pk), microseconds(enrolled_at))
+
+
+def decode_feed_cursor(cursor):
+    """
+    Retorna ``((data, id), microssegundos da matrícula)`` ou ``None`` se o
+    cursor for inválido.
+    """
+    position, _, enrolled_at = cursor.partition('.')
+    position = decode_cursor(position)
+    if position is None or not enrolled_at.isdigit():
+        return None
+    return position, int(enrolled_at)
+
+
+def feed_page(user, since=None, limit=FEED_LIMIT, enrolled_at=None):
+    """
+    Anúncios alterados depois do cursor ``since``. ``enrolled_at`` é a
+    matrícula mais recente lida por ``feed_state``. Retorna ``(itens, cursor
+    da última posição, há mais itens, recomeçou do início)``; um cursor de
+    antes de uma nova matrícula recomeça o feed.
+    """
+    announcements = user_announcements(user).order_by('updated_at', 'pk').values(
+        'pk', 'title', 'content', 'created_at', 'updated_at', 'course__slug', 'course__name'
+    )
+    position = None
+    reset = False
+    if since:
+        cursor = decode_feed_cursor(since)
+        if cursor and enrolled_at and cursor[1] >= microseconds(enrolled_at):
+            position = cursor[0]
+        else:
+            reset = True
+    if position:
+        updated_at, pk = position
+        announcements = announcements.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk)
+        )
+    rows = list(announcements[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = [
+        {
+            'id': row['pk'],
+            'course': row['course__slug'],
+            'course_name': row['course__name'],
+            'title': row['title'],
+            'content': row['content'],
+            'created_at': row['created_at'].isoformat(),
+            'updated_at': row['updated_at'].isoformat(),
+            'url': reverse('cursos:show_announcement', args=[row['course__slug'], row['pk']]),
+        }
+        for row in rows
+    ]
+    if rows:
+        cursor = encode_feed_cursor(rows[-1]['updated_at'], rows[-1]['pk'], enrolled_at)
+    else:
+        cursor = since if position else None
+    return items, cursor, has_more, reset
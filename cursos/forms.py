@@ -3,7 +3,7 @@ from django.core.mail import send_mail
 from django.conf import settings
 
 from core.mail import send_mail_template
-from .models import Comment
+from .models import Comment, Course
 class ContactCourse(forms.Form):
     name = forms.CharField(label='Nome', max_length=100)
     email = forms.EmailField(label='E-mail')
@@ -43,4 +43,15 @@ class ContactCourse(forms.Form):
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
-        fields = ['comment']
\ No newline at end of file
+        fields = ['comment']
+
+
+class EnrollmentImportForm(forms.Form):
+    file = forms.FileField(
+        label='Arquivo CSV',
+        help_text='Colunas: username, email, first_name, last_name, curso (slug)'
+    )
+    course = forms.ModelChoiceField(
+        label='Curso', queryset=Course.objects.all(), required=False,
+        help_text='Usado nas linhas sem a coluna "curso"'
+    )
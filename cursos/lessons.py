@@ -0,0 +1,70 @@
+"""
+Listagem de aulas em cache e reordenação em lote.
+
+A chave do cache inclui ``Course.updated_at``, que é atualizado sempre que uma
+aula do curso muda. Assim invalidar a listagem é um único UPDATE no curso,
+e o cache nunca devolve aulas de uma versão anterior.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from core import metrics
+
+from .models import Course, CourseProgress, Lesson, refresh_next_lessons
+
+LESSONS_TIMEOUT = 60 * 60
+
+
+class LessonOrderError(ValueError):
+    """Ordem de aulas inválida para o curso."""
+
+
+def lessons_cache_key(course):
+    return 'cursos:lessons:%d:%s' % (course.pk, course.updated_at.timestamp())
+
+
+def get_course_lessons(course):
+    """Aulas do curso, na ordem de ``number``, lidas do cache quando possível."""
+    key = lessons_cache_key(course)
+    lessons = cache.get(key)
+    metrics.record_cache('lessons', hit=lessons is not None)
+    if lessons is None:
+        lessons = list(course.lessons.all())
+        cache.set(key, lessons, LESSONS_TIMEOUT)
+    return lessons
+
+
+def invalidate_lessons(course_id):
+    """Invalida a listagem de aulas do curso (um único UPDATE)."""
+    Course.objects.filter(pk=course_id).update(updated_at=timezone.now())
+
+
+def reorder_lessons(course, lesson_ids):
+    """
+    Aplica uma ordem completa (lista com todos os ids das aulas do curso) com
+    um único ``bulk_update`` e invalida a listagem uma vez. Retorna quantas
+    aulas mudaram de número.
+    """
+    lesson_ids = [int(pk) for pk in lesson_ids]
+    with transaction.atomic():
+        lessons = {
+            lesson.pk: lesson
+            for lesson in Lesson.objects.select_for_update().filter(course=course).only('pk', 'number')
+        }
+        if len(lesson_ids) != len(set(lesson_ids)):
+            raise LessonOrderError('A ordem contém aulas repetidas')
+        if set(lesson_ids) != set(lessons):
+            raise LessonOrderError('A ordem deve conter exatamente as aulas do curso')
+
+        changed = []
+        for number, pk in enumerate(lesson_ids, start=1):
+            lesson = lessons[pk]
+            if lesson.number != number:
+                lesson.number = number
+                changed.append(lesson)
+        if changed:
+            Lesson.objects.bulk_update(changed, ['number'], batch_size=500)
+            invalidate_lessons(course.pk)
+            refresh_next_lessons(CourseProgress.objects.filter(course=course))
+    return len(changed)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from cursos import catalog
+
+
+class Command(BaseCommand):
+    help = 'Exporta cursos, aulas e materiais em JSON ou NDJSON (streaming)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', default='json', choices=list(catalog.FORMATS))
+        parser.add_argument(
+            '--curso', action='append', dest='cursos', metavar='SLUG',
+            help='Exporta apenas este curso (pode se repetir)'
+        )
+        parser.add_argument('--output', '-o', help='Arquivo de saída (padrão: stdout)')
+
+    def handle(self, *args, **options):
+        lines = catalog.export_lines(options['formato'], options['cursos'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line)
+        self.stderr.write(self.style.SUCCESS('Catálogo exportado para %s' % options['output']))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cursos import export
+from cursos.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Exporta o progresso dos alunos em CSV ou NDJSON (streaming, memória constante)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tipo', default='cursos', choices=list(export.KINDS),
+            help='cursos: uma linha por aluno/curso; aulas: uma linha por aluno/aula'
+        )
+        parser.add_argument('--formato', default='csv', choices=list(export.FORMATS))
+        parser.add_argument(
+            '--curso', action='append', dest='cursos', metavar='SLUG',
+            help='Limita a um curso (pode se repetir); sem ele exporta todos'
+        )
+        parser.add_argument('--output', '-o', help='Arquivo de saída (padrão: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        courses = None
+        if options['cursos']:
+            courses = Course.objects.filter(slug__in=options['cursos'])
+            if not courses.exists():
+                raise CommandError('Nenhum curso encontrado: %s' % ', '.join(options['cursos']))
+
+        lines = export.export_lines(
+            options['tipo'], options['formato'], courses, chunk_size=options['chunk_size']
+        )
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        count = -1 if options['formato'] == 'csv' else 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line)
+                count += 1
+        self.stderr.write(self.style.SUCCESS(
+            '%d linhas exportadas para %s' % (count, options['output'])
+        ))
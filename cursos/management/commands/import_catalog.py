@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cursos import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa cursos, aulas e materiais de um arquivo JSON ou NDJSON. '
+        'Reimportar o mesmo arquivo não duplica nada (chaves: slug, número da aula '
+        'e nome do material)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument(
+            '--formato', choices=list(catalog.FORMATS),
+            help='Padrão: deduzido da extensão do arquivo'
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Apaga aulas e materiais que não estão no arquivo (e o progresso nessas aulas)'
+        )
+
+    def handle(self, *args, **options):
+        fmt = options['formato'] or ('ndjson' if options['arquivo'].endswith('.ndjson') else 'json')
+        start = time.perf_counter()
+        try:
+            with open(options['arquivo'], encoding='utf-8') as f:
+                result = catalog.CatalogImporter(prune=options['prune']).run(
+                    catalog.read_documents(f, fmt)
+                )
+        except (OSError, catalog.CatalogError) as e:
+            raise CommandError(str(e))
+
+        for key, value in result.items():
+            self.stdout.write('%-20s %d' % (key, value))
+        self.stdout.write(self.style.SUCCESS(
+            'Catálogo importado em %.1fs' % (time.perf_counter() - start)
+        ))
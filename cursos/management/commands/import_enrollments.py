@@ -0,0 +1,48 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cursos.enrollment_import import CHUNK_SIZE, EnrollmentImporter
+from cursos.models import Course
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa matrículas de um CSV (username, email, first_name, last_name, curso), '
+        'criando usuários, matrículas e progresso em lote'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do CSV')
+        parser.add_argument(
+            '--curso', help='Slug do curso usado nas linhas sem a coluna "curso"'
+        )
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--encoding', default='utf-8-sig')
+
+    def handle(self, *args, **options):
+        course = None
+        if options['curso']:
+            try:
+                course = Course.objects.get(slug=options['curso'])
+            except Course.DoesNotExist:
+                raise CommandError('Curso não encontrado: %s' % options['curso'])
+
+        importer = EnrollmentImporter(course=course, chunk_size=options['chunk_size'])
+        try:
+            with open(options['arquivo'], encoding=options['encoding'], newline='') as f:
+                result = importer.run(f)
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+        except csv.Error as e:
+            raise CommandError('CSV inválido: %s' % e)
+
+        for line, message in result['errors']:
+            self.stderr.write('linha %d: %s' % (line, message))
+        self.stdout.write(self.style.SUCCESS(
+            '%(rows)d linhas: %(users_created)d usuários criados, %(users_updated)d atualizados, '
+            '%(enrollments_created)d matrículas criadas, %(enrollments_reactivated)d reativadas, '
+            '%(progress_created)d progressos criados' % result
+        ))
+        if result['errors']:
+            self.stdout.write(self.style.WARNING('%d linhas com erro' % len(result['errors'])))
@@ -1,14 +1,43 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from cursos.models import Course, Lesson, Enrollment, Material
 from cursos.progress import ProgressManager
+from cursos.dataset import DatasetGenerator, DEFAULT_PASSWORD
 from datetime import datetime
 
 
 class Command(BaseCommand):
     help = 'Popula o banco de dados com dados de exemplo'
 
+    def add_arguments(self, parser):
+        scale = parser.add_argument_group(
+            'modo escala',
+            'Gera um banco sintético grande com bulk_create '
+            '(ex.: --users 100000 --courses 2000 --lessons-per-course 50 --completion-ratio 0.4)'
+        )
+        scale.add_argument('--users', type=int, help='Quantidade de alunos')
+        scale.add_argument('--courses', type=int, help='Quantidade de cursos')
+        scale.add_argument('--lessons-per-course', type=int, default=20)
+        scale.add_argument('--enrollments-per-user', type=int, default=3)
+        scale.add_argument(
+            '--completion-ratio', type=float, default=0.4,
+            help='Fração das matrículas que chegam a 100%%'
+        )
+        scale.add_argument('--seed', type=int, default=42, help='Semente do gerador aleatório')
+        scale.add_argument('--batch-size', type=int, default=1000)
+        scale.add_argument(
+            '--prefix', default='sintetico',
+            help='Prefixo dos usernames e slugs gerados'
+        )
+        scale.add_argument(
+            '--certificate-pdfs', action='store_true',
+            help='Também gera os PDFs dos certificados (lento)'
+        )
+
     def handle(self, *args, **options):
+        if options['users'] is not None or options['courses'] is not None:
+            return self.handle_scale(options)
+
         self.stdout.write("Criando dados de exemplo...")
 
         # Criar usuários
@@ -174,3 +203,41 @@ class Command(BaseCommand):
             self.stdout.write(f"  - {curso.name} ({curso.lessons.count()} aulas)")
         self.stdout.write("\nAcesse: http://127.0.0.1:8000/")
         self.stdout.write("Admin: http://127.0.0.1:8000/admin/")
+
+    def handle_scale(self, options):
+        users = options['users'] or 0
+        courses = options['courses'] or 1
+        if not 0 <= options['completion_ratio'] <= 1:
+            raise CommandError('--completion-ratio deve estar entre 0 e 1.')
+        if DatasetGenerator.exists(options['prefix']):
+            raise CommandError(
+                'Já existem usuários com o prefixo "%s". Use --prefix para gerar outro conjunto.'
+                % options['prefix']
+            )
+
+        self.stdout.write(
+            f"Gerando {users} alunos, {courses} cursos com {options['lessons_per_course']} aulas "
+            f"(semente {options['seed']})..."
+        )
+        generator = DatasetGenerator(
+            users=users,
+            courses=courses,
+            lessons_per_course=options['lessons_per_course'],
+            completion_ratio=options['completion_ratio'],
+            enrollments_per_user=options['enrollments_per_user'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            certificate_pdfs=options['certificate_pdfs'],
+            log=lambda message: self.stdout.write(f'  → {message}'),
+        )
+        result = generator.run()
+
+        self.stdout.write("\n" + "="*50)
+        for model, count in result['counts'].items():
+            self.stdout.write(f"  {model:<16} {count:>12}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['rows']} linhas em {result['seconds']:.1f}s "
+            f"({result['rows_per_second']:.0f} linhas/s)"
+        ))
+        self.stdout.write(f"Senha dos alunos gerados: {DEFAULT_PASSWORD}")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cursos import stats
+from cursos.models import Course
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula as estatísticas dos cursos (matrículas, conclusões por aula, ranking, '
+        'tempo até concluir e certificados) a partir das tabelas de origem'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Cursos a recalcular (padrão: todos)')
+
+    def handle(self, *args, **options):
+        course_ids = None
+        if options['slugs']:
+            course_ids = list(Course.objects.filter(slug__in=options['slugs']).values_list('pk', flat=True))
+            if not course_ids:
+                raise CommandError('Nenhum curso encontrado')
+        rebuilt = stats.rebuild(course_ids)
+        self.stdout.write('%d cursos recalculados' % rebuilt)
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from cursos.digest import send_announcement_digests, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera o resumo de anúncios dos alunos que preferem receber um e-mail '
+        'por período (agende uma vez por dia, ex.: cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period', type=float, default=24,
+            help='Intervalo mínimo entre dois resumos do mesmo aluno, em horas'
+        )
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        processed, sent = send_announcement_digests(
+            period=timedelta(hours=options['period']), chunk_size=options['chunk_size']
+        )
+        self.stdout.write('%d alunos processados, %d resumos na fila' % (processed, sent))
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.7 on 2026-10-19 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cursos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='certificate',
+            name='issued_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Emitido em'),
+        ),
+        migrations.AlterField(
+            model_name='courseprogress',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Curso Concluído em'),
+        ),
+        migrations.AlterField(
+            model_name='lessonprogress',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Concluída em'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.7 on 2026-10-19 09:36
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_count(apps, schema_editor):
+    Announcement = apps.get_model('cursos', 'Announcement')
+    Comment = apps.get_model('cursos', 'Comment')
+    counts = Comment.objects.filter(announcement=OuterRef('pk')).order_by().values(
+        'announcement'
+    ).annotate(total=Count('pk')).values('total')
+    Announcement.objects.update(
+        comment_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cursos', '0002_progress_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcement',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Comentários'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['announcement', 'created_at', 'id'], name='comment_keyset_idx'),
+        ),
+        migrations.RunPython(fill_comment_count, migrations.RunPython.noop),
+    ]
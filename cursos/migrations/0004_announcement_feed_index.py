@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-19 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cursos', '0003_announcement_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(fields=['course', 'updated_at', 'id'], name='announcement_feed_idx'),
+        ),
+    ]
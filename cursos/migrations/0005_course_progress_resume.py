@@ -0,0 +1,48 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:01
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_resume_pointers(apps, schema_editor):
+    CourseProgress = apps.get_model('cursos', 'CourseProgress')
+    Lesson = apps.get_model('cursos', 'Lesson')
+    LessonProgress = apps.get_model('cursos', 'LessonProgress')
+    completed = LessonProgress.objects.filter(
+        user=OuterRef(OuterRef('user')), lesson=OuterRef('pk'), completed=True
+    )
+    next_lesson = Lesson.objects.filter(course=OuterRef('course')).exclude(
+        Exists(completed)
+    ).order_by('number', 'pk').values('pk')[:1]
+    last_lesson = LessonProgress.objects.filter(
+        user=OuterRef('user'), lesson__course=OuterRef('course')
+    ).order_by('-updated_at', '-pk').values('lesson')[:1]
+    CourseProgress.objects.update(
+        next_lesson=Subquery(next_lesson), last_lesson=Subquery(last_lesson)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cursos', '0004_announcement_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='last_lesson',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cursos.lesson', verbose_name='Última Aula'),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='next_lesson',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cursos.lesson', verbose_name='Próxima Aula'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['course', 'number'], name='lesson_course_number_idx'),
+        ),
+        migrations.RunPython(fill_resume_pointers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cursos', '0005_course_progress_resume'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LessonActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField(verbose_name='Minuto')),
+                ('seconds', models.PositiveIntegerField(default=0, verbose_name='Segundos')),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='cursos.lesson', verbose_name='Aula')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_activity', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Atividade na Aula',
+                'verbose_name_plural': 'Atividades nas Aulas',
+                'unique_together': {('user', 'lesson', 'minute')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseDailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Dia')),
+                ('seconds', models.PositiveBigIntegerField(default=0, verbose_name='Segundos')),
+                ('heartbeats', models.PositiveIntegerField(default=0, verbose_name='Heartbeats')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity', to='cursos.course', verbose_name='Curso')),
+            ],
+            options={
+                'verbose_name': 'Atividade Diária do Curso',
+                'verbose_name_plural': 'Atividades Diárias dos Cursos',
+                'unique_together': {('course', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:07
+
+from bisect import bisect_left
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+# Cópia de cursos.stats.COMPLETION_BUCKETS no momento desta migração
+COMPLETION_BUCKETS = (1, 6, 24, 72, 168, 336, 720, 1440, 2160, 4320, 8760)
+
+
+def fill_course_stats(apps, schema_editor):
+    Course = apps.get_model('cursos', 'Course')
+    CourseStats = apps.get_model('cursos', 'CourseStats')
+    LessonStats = apps.get_model('cursos', 'LessonStats')
+    CourseHistogram = apps.get_model('cursos', 'CourseHistogram')
+    Enrollment = apps.get_model('cursos', 'Enrollment')
+    CourseProgress = apps.get_model('cursos', 'CourseProgress')
+    Certificate = apps.get_model('cursos', 'Certificate')
+    LessonProgress = apps.get_model('cursos', 'LessonProgress')
+
+    def per_course(queryset):
+        return dict(
+            queryset.order_by().values('course_id').annotate(total=Count('pk'))
+            .values_list('course_id', 'total')
+        )
+
+    enrolled = per_course(Enrollment.objects.filter(status=1))
+    completions = per_course(CourseProgress.objects.filter(completed_at__isnull=False))
+    certificates = per_course(Certificate.objects.all())
+    CourseStats.objects.bulk_create([
+        CourseStats(
+            course_id=pk, enrolled_count=enrolled.get(pk, 0),
+            completed_count=completions.get(pk, 0), certificate_count=certificates.get(pk, 0),
+        )
+        for pk in Course.objects.values_list('pk', flat=True).iterator()
+    ], batch_size=500)
+    LessonStats.objects.bulk_create([
+        LessonStats(lesson_id=lesson_id, completed_count=total)
+        for lesson_id, total in LessonProgress.objects.filter(completed=True).order_by().values(
+            'lesson_id'
+        ).annotate(total=Count('pk')).values_list('lesson_id', 'total').iterator()
+    ], batch_size=500)
+    histogram = {}
+    completed = CourseProgress.objects.filter(completed_at__isnull=False).values_list(
+        'course_id', 'created_at', 'completed_at'
+    )
+    for course_id, created_at, completed_at in completed.iterator(chunk_size=2000):
+        hours = max((completed_at - created_at).total_seconds(), 0) / 3600
+        key = (course_id, bisect_left(COMPLETION_BUCKETS, hours))
+        histogram[key] = histogram.get(key, 0) + 1
+    CourseHistogram.objects.bulk_create([
+        CourseHistogram(course_id=course_id, metric='completion_time', bucket=bucket, total=total)
+        for (course_id, bucket), total in histogram.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cursos', '0006_lesson_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='cursos.course', verbose_name='Curso')),
+                ('enrolled_count', models.PositiveIntegerField(default=0, verbose_name='Matriculados')),
+                ('completed_count', models.PositiveIntegerField(default=0, verbose_name='Concluíram')),
+                ('certificate_count', models.PositiveIntegerField(default=0, verbose_name='Certificados')),
+            ],
+            options={
+                'verbose_name': 'Estatísticas do Curso',
+                'verbose_name_plural': 'Estatísticas dos Cursos',
+            },
+        ),
+        migrations.CreateModel(
+            name='LessonStats',
+            fields=[
+                ('lesson', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='cursos.lesson', verbose_name='Aula')),
+                ('completed_count', models.PositiveIntegerField(default=0, verbose_name='Concluíram')),
+            ],
+            options={
+                'verbose_name': 'Estatísticas da Aula',
+                'verbose_name_plural': 'Estatísticas das Aulas',
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('completion_time', 'Tempo até concluir')], max_length=30, verbose_name='Métrica')),
+                ('bucket', models.PositiveSmallIntegerField(verbose_name='Faixa')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Alunos')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='histograms', to='cursos.course', verbose_name='Curso')),
+            ],
+            options={
+                'verbose_name': 'Histograma do Curso',
+                'verbose_name_plural': 'Histogramas dos Cursos',
+                'unique_together': {('course', 'metric', 'bucket')},
+            },
+        ),
+        migrations.RunPython(fill_course_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:15
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, Value
+from django.db.models.functions import Cast, Floor, Least
+
+# Cópia de cursos.ranking.BUCKET_WIDTH/LAST_BUCKET no momento desta migração
+BUCKET_WIDTH = 5
+LAST_BUCKET = 100 // BUCKET_WIDTH
+
+
+def fill_progress_histogram(apps, schema_editor):
+    CourseHistogram = apps.get_model('cursos', 'CourseHistogram')
+    CourseProgress = apps.get_model('cursos', 'CourseProgress')
+    rows = CourseProgress.objects.filter(enrollment__status=1).order_by().annotate(
+        bucket=Least(
+            Cast(Floor(F('progress_percentage') / BUCKET_WIDTH), IntegerField()), Value(LAST_BUCKET)
+        )
+    ).values('course_id', 'bucket').annotate(total=Count('pk'))
+    CourseHistogram.objects.bulk_create([
+        CourseHistogram(
+            course_id=row['course_id'], metric='progress', bucket=row['bucket'], total=row['total']
+        )
+        for row in rows.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cursos', '0007_course_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='coursehistogram',
+            name='metric',
+            field=models.CharField(choices=[('completion_time', 'Tempo até concluir'), ('progress', 'Percentual de progresso')], max_length=30, verbose_name='Métrica'),
+        ),
+        migrations.AddIndex(
+            model_name='courseprogress',
+            index=models.Index(fields=['course', '-progress_percentage'], name='progress_course_rank_idx'),
+        ),
+        migrations.RunPython(fill_progress_histogram, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,8 @@ from django.db import models
 from django.urls import reverse
 from django.conf import settings
 from django.utils import timezone
-from core.mail import send_mail_template
+from core.mail import send_mass_mail_template
+from accounts.models import NotificationPreference
 
 class CourseManager(models.Manager):
 
@@ -69,6 +70,9 @@ class Lesson(models.Model):
         verbose_name = 'Aula'
         verbose_name_plural = 'Aulas'
         ordering = ['number']
+        indexes = [
+            models.Index(fields=['course', 'number'], name='lesson_course_number_idx'),
+        ]
     
 class Material(models.Model):
     name = models.CharField('Nome', max_length=100)
@@ -130,6 +134,8 @@ class Announcement(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='Curso', related_name='announcements')
     title = models.CharField('Titulo', max_length=100)
     content = models.TextField('Conteúdo')
+    # Mantido pelos sinais de Comment, evita um COUNT por anúncio nas listagens
+    comment_count = models.PositiveIntegerField('Comentários', default=0, editable=False)
     created_at = models.DateTimeField('Criado em', auto_now_add=True)
     updated_at = models.DateTimeField('Atualizado em', auto_now=True)
 
@@ -140,6 +146,9 @@ class Announcement(models.Model):
         verbose_name = 'Anúncio'
         verbose_name_plural = 'Anúncios'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['course', 'updated_at', 'id'], name='announcement_feed_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -157,6 +166,9 @@ class Comment(models.Model):
         verbose_name = 'Comentário'
         verbose_name_plural = 'Comentários'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['announcement', 'created_at', 'id'], name='comment_keyset_idx'),
+        ]
 
 class LessonProgress(models.Model):
     """
@@ -172,7 +184,7 @@ class LessonProgress(models.Model):
         on_delete=models.CASCADE
     )
     completed = models.BooleanField('Concluída', default=False)
-    completed_at = models.DateTimeField('Concluída em', null=True, blank=True)
+    completed_at = models.DateTimeField('Concluída em', null=True, blank=True, db_index=True)
     created_at = models.DateTimeField('Criado em', auto_now_add=True)
     updated_at = models.DateTimeField('Atualizado em', auto_now=True)
 
@@ -185,6 +197,25 @@ class LessonProgress(models.Model):
         unique_together = (('user', 'lesson'),)
 
 
+def next_lesson_queryset(user, course):
+    """
+    Id da primeira aula (por ``number``) do curso que o aluno não concluiu:
+    um anti-join pelo índice único (user, lesson) de LessonProgress. Aceita
+    ids ou ``OuterRef`` (ver ``refresh_next_lessons``).
+    """
+    completed = LessonProgress.objects.filter(user=user, lesson=models.OuterRef('pk'), completed=True)
+    return Lesson.objects.filter(course=course).exclude(
+        models.Exists(completed)
+    ).order_by('number', 'pk').values_list('pk', flat=True)[:1]
+
+
+def refresh_next_lessons(progresses):
+    """Recalcula a próxima aula de vários CourseProgress com um único UPDATE."""
+    return progresses.update(next_lesson=models.Subquery(next_lesson_queryset(
+        models.OuterRef(models.OuterRef('user')), models.OuterRef('course')
+    )))
+
+
 class CourseProgress(models.Model):
     """
     Modelo para rastrear o progresso geral de um usuário em um curso.
@@ -205,25 +236,65 @@ class CourseProgress(models.Model):
     completed_lessons = models.IntegerField('Aulas Concluídas', default=0)
     total_lessons = models.IntegerField('Total de Aulas', default=0)
     progress_percentage = models.FloatField('Percentual de Progresso', default=0.0)
-    completed_at = models.DateTimeField('Curso Concluído em', null=True, blank=True)
+    completed_at = models.DateTimeField('Curso Concluído em', null=True, blank=True, db_index=True)
+    # Ponteiros de "continuar de onde parei", mantidos pelo ProgressManager
+    last_lesson = models.ForeignKey(
+        Lesson, verbose_name='Última Aula', null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='+'
+    )
+    next_lesson = models.ForeignKey(
+        Lesson, verbose_name='Próxima Aula', null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='+'
+    )
     created_at = models.DateTimeField('Criado em', auto_now_add=True)
     updated_at = models.DateTimeField('Atualizado em', auto_now=True)
 
     def __str__(self):
         return f'{self.user.username} - {self.course.name} ({self.progress_percentage}%)'
 
+    def update_resume(self, lesson=None):
+        """Aponta a última aula mexida e a próxima não concluída (um anti-join)."""
+        if lesson is not None:
+            self.last_lesson = lesson
+        self.next_lesson_id = next_lesson_queryset(self.user_id, self.course_id).first()
+
+    async def aupdate_resume(self, lesson=None):
+        """Versão assíncrona de ``update_resume``."""
+        if lesson is not None:
+            self.last_lesson = lesson
+        self.next_lesson_id = await next_lesson_queryset(self.user_id, self.course_id).afirst()
+
     def calculate_progress(self):
         """Calcula o percentual de progresso do usuário no curso."""
-        lessons = self.course.lessons.all().count()
-        if lessons == 0:
-            self.progress_percentage = 0.0
-        else:
+        lessons = Lesson.objects.filter(course_id=self.course_id).count()
+        completed = 0
+        if lessons:
             completed = LessonProgress.objects.filter(
-                user=self.user,
-                lesson__course=self.course,
+                user_id=self.user_id,
+                lesson__course_id=self.course_id,
                 completed=True
             ).count()
-            self.progress_percentage = (completed / lessons) * 100
+        return self.apply_counts(lessons, completed)
+
+    async def acalculate_progress(self):
+        """Versão assíncrona de ``calculate_progress`` (async ORM)."""
+        lessons = await Lesson.objects.filter(course_id=self.course_id).acount()
+        completed = 0
+        if lessons:
+            completed = await LessonProgress.objects.filter(
+                user_id=self.user_id,
+                lesson__course_id=self.course_id,
+                completed=True
+            ).acount()
+        return self.apply_counts(lessons, completed)
+
+    def apply_counts(self, lessons, completed):
+        """Atualiza os contadores a partir de totais já calculados."""
+        if lessons == 0:
+            self.progress_percentage = 0.0
+        else:
+            # Mesma conta do UPDATE em lote de ProgressManager.recalculate_progress
+            self.progress_percentage = completed * 100 / lessons
             self.completed_lessons = completed
             self.total_lessons = lessons
         return self.progress_percentage
@@ -232,6 +303,10 @@ class CourseProgress(models.Model):
         verbose_name = 'Progresso do Curso'
         verbose_name_plural = 'Progressos dos Cursos'
         unique_together = (('user', 'course'),)
+        indexes = [
+            # Ranking do curso (cursos/ranking.py)
+            models.Index(fields=['course', '-progress_percentage'], name='progress_course_rank_idx'),
+        ]
 
 
 class Certificate(models.Model):
@@ -252,7 +327,7 @@ class Certificate(models.Model):
         on_delete=models.CASCADE, related_name='certificate'
     )
     certificate_number = models.CharField('Número do Certificado', max_length=50, unique=True)
-    issued_at = models.DateTimeField('Emitido em', auto_now_add=True)
+    issued_at = models.DateTimeField('Emitido em', auto_now_add=True, db_index=True)
     certificate_file = models.FileField(
         upload_to='certificates', verbose_name='Arquivo do Certificado',
         null=True, blank=True
@@ -274,6 +349,111 @@ class Certificate(models.Model):
         unique_together = (('user', 'course'),)
 
 
+class LessonActivity(models.Model):
+    """
+    Segundos de estudo de um aluno em uma aula dentro de um minuto. Gravado
+    em lote a partir dos heartbeats agregados em memória (ver cursos/activity.py).
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name='Usuário',
+        related_name='lesson_activity', on_delete=models.CASCADE
+    )
+    lesson = models.ForeignKey(
+        Lesson, verbose_name='Aula', related_name='activity', on_delete=models.CASCADE
+    )
+    minute = models.DateTimeField('Minuto')
+    seconds = models.PositiveIntegerField('Segundos', default=0)
+
+    def __str__(self):
+        return f'{self.user_id} - {self.lesson_id} ({self.minute:%Y-%m-%d %H:%M}): {self.seconds}s'
+
+    class Meta:
+        verbose_name = 'Atividade na Aula'
+        verbose_name_plural = 'Atividades nas Aulas'
+        unique_together = (('user', 'lesson', 'minute'),)
+
+
+class CourseDailyActivity(models.Model):
+    """Total diário de tempo de estudo por curso, somado a cada gravação dos heartbeats."""
+    course = models.ForeignKey(
+        Course, verbose_name='Curso', related_name='daily_activity', on_delete=models.CASCADE
+    )
+    day = models.DateField('Dia')
+    seconds = models.PositiveBigIntegerField('Segundos', default=0)
+    heartbeats = models.PositiveIntegerField('Heartbeats', default=0)
+
+    def __str__(self):
+        return f'{self.course} - {self.day}: {self.seconds}s'
+
+    class Meta:
+        verbose_name = 'Atividade Diária do Curso'
+        verbose_name_plural = 'Atividades Diárias dos Cursos'
+        unique_together = (('course', 'day'),)
+
+
+class CourseStats(models.Model):
+    """
+    Contadores do curso para a página de estatísticas, mantidos a cada
+    matrícula, conclusão e certificado (ver cursos/stats.py).
+    """
+    course = models.OneToOneField(
+        Course, verbose_name='Curso', primary_key=True,
+        on_delete=models.CASCADE, related_name='stats'
+    )
+    enrolled_count = models.PositiveIntegerField('Matriculados', default=0)
+    completed_count = models.PositiveIntegerField('Concluíram', default=0)
+    certificate_count = models.PositiveIntegerField('Certificados', default=0)
+
+    def __str__(self):
+        return f'Estatísticas - {self.course}'
+
+    class Meta:
+        verbose_name = 'Estatísticas do Curso'
+        verbose_name_plural = 'Estatísticas dos Cursos'
+
+
+class LessonStats(models.Model):
+    """Quantos alunos concluíram a aula (etapa do funil do curso)."""
+    lesson = models.OneToOneField(
+        Lesson, verbose_name='Aula', primary_key=True,
+        on_delete=models.CASCADE, related_name='stats'
+    )
+    completed_count = models.PositiveIntegerField('Concluíram', default=0)
+
+    def __str__(self):
+        return f'Estatísticas - {self.lesson}'
+
+    class Meta:
+        verbose_name = 'Estatísticas da Aula'
+        verbose_name_plural = 'Estatísticas das Aulas'
+
+
+class CourseHistogram(models.Model):
+    """Quantidade de alunos por faixa de uma métrica do curso."""
+
+    COMPLETION_TIME = 'completion_time'
+    PROGRESS = 'progress'
+    METRIC_CHOICES = (
+        (COMPLETION_TIME, 'Tempo até concluir'),
+        (PROGRESS, 'Percentual de progresso'),
+    )
+
+    course = models.ForeignKey(
+        Course, verbose_name='Curso', on_delete=models.CASCADE, related_name='histograms'
+    )
+    metric = models.CharField('Métrica', max_length=30, choices=METRIC_CHOICES)
+    bucket = models.PositiveSmallIntegerField('Faixa')
+    total = models.PositiveIntegerField('Alunos', default=0)
+
+    def __str__(self):
+        return f'{self.course} - {self.get_metric_display()} [{self.bucket}]: {self.total}'
+
+    class Meta:
+        verbose_name = 'Histograma do Curso'
+        verbose_name_plural = 'Histogramas dos Cursos'
+        unique_together = (('course', 'metric', 'bucket'),)
+
+
 def post_save_announcement(instance, created, **kwargs):
     if created:
         subject = instance.title
@@ -281,14 +461,144 @@ def post_save_announcement(instance, created, **kwargs):
             'announcement': instance
         }
         template_name = 'courses/announcement_mail.html'
-        enrollments = Enrollment.objects.filter(
+        # Quem prefere o resumo recebe o anúncio pelo send_announcement_digest
+        emails = Enrollment.objects.filter(
             course=instance.course, status=1
+        ).exclude(
+            user__notification_preference__announcement_delivery=NotificationPreference.DIGEST
+        ).values_list('user__email', flat=True)
+        send_mass_mail_template(
+            subject, template_name, context, [[email] for email in emails.iterator()]
         )
-        for enrollment in enrollments:
-            recipient_list = [enrollment.user.email]
-            send_mail_template(subject, template_name, context, recipient_list)
+
 
 models.signals.post_save.connect(
     post_save_announcement, sender=Announcement,
     dispatch_uid='post_save_announcement'
-)
\ No newline at end of file
+)
+
+
+def comment_created(instance, created, **kwargs):
+    if created:
+        Announcement.objects.filter(pk=instance.announcement_id).update(
+            comment_count=models.F('comment_count') + 1
+        )
+
+
+def comment_deleted(instance, **kwargs):
+    Announcement.objects.filter(pk=instance.announcement_id, comment_count__gt=0).update(
+        comment_count=models.F('comment_count') - 1
+    )
+
+
+models.signals.post_save.connect(
+    comment_created, sender=Comment, dispatch_uid='comment_created'
+)
+models.signals.post_delete.connect(
+    comment_deleted, sender=Comment, dispatch_uid='comment_deleted'
+)
+
+
+def lessons_changed(instance, created=True, **kwargs):
+    # Invalida a listagem de aulas em cache (ver cursos/lessons.py)
+    Course.objects.filter(pk=instance.course_id).update(updated_at=timezone.now())
+    progresses = CourseProgress.objects.filter(course_id=instance.course_id)
+    if created:
+        # Aula nova ou apagada (post_delete não envia ``created``) muda o
+        # percentual dos alunos: recalcula em lote, com o ranking
+        from .progress import ProgressManager
+
+        ProgressManager.recalculate_progress(progresses)
+    else:
+        # Aula renumerada muda só a próxima aula dos alunos
+        refresh_next_lessons(progresses)
+
+
+models.signals.post_save.connect(
+    lessons_changed, sender=Lesson, dispatch_uid='lessons_changed_save'
+)
+models.signals.post_delete.connect(
+    lessons_changed, sender=Lesson, dispatch_uid='lessons_changed_delete'
+)
+
+
+def enrollment_loaded(instance, **kwargs):
+    # Situação gravada, para enrollment_saved saber se a matrícula mudou de aprovada
+    # (lido do __dict__ para não disparar uma query quando o campo foi adiado)
+    instance._saved_status = instance.__dict__.get('status') if instance.pk else None
+
+
+def enrollment_saved(instance, **kwargs):
+    from .ranking import record_progress
+    from .stats import record_enrollments
+
+    was_approved = instance._saved_status == 1
+    is_approved = instance.status == 1
+    if was_approved != is_approved:
+        record_enrollments({instance.course_id: 1 if is_approved else -1})
+        # Cancelar tira o aluno do ranking do curso; reativar o devolve
+        percentage = CourseProgress.objects.filter(enrollment=instance).values_list(
+            'progress_percentage', flat=True
+        ).first()
+        if percentage is not None:
+            record_progress(
+                instance.course_id, instance.user_id,
+                percentage if was_approved else None, percentage if is_approved else None,
+            )
+    instance._saved_status = instance.status
+
+
+def enrollment_deleted(instance, **kwargs):
+    from .stats import record_enrollments
+
+    if instance._saved_status == 1:
+        record_enrollments({instance.course_id: -1})
+
+
+models.signals.post_init.connect(
+    enrollment_loaded, sender=Enrollment, dispatch_uid='enrollment_loaded'
+)
+models.signals.post_save.connect(
+    enrollment_saved, sender=Enrollment, dispatch_uid='enrollment_saved'
+)
+models.signals.post_delete.connect(
+    enrollment_deleted, sender=Enrollment, dispatch_uid='enrollment_deleted'
+)
+
+
+def certificate_created(instance, created, **kwargs):
+    from .stats import record_certificates
+
+    if created:
+        record_certificates({instance.course_id: 1})
+
+
+def certificate_deleted(instance, **kwargs):
+    from .stats import record_certificates
+
+    record_certificates({instance.course_id: -1})
+
+
+models.signals.post_save.connect(
+    certificate_created, sender=Certificate, dispatch_uid='certificate_created'
+)
+models.signals.post_delete.connect(
+    certificate_deleted, sender=Certificate, dispatch_uid='certificate_deleted'
+)
+
+
+def progress_deleted(instance, **kwargs):
+    from .ranking import record_progress
+    from .stats import record_course_completion
+
+    if instance.completed_at:
+        record_course_completion(instance, -1)
+    # Só quem tem matrícula aprovada está no ranking (a matrícula ainda existe
+    # quando o progresso é apagado em cascata)
+    if Enrollment.objects.filter(pk=instance.enrollment_id, status=1).exists():
+        record_progress(instance.course_id, instance.user_id, instance.progress_percentage, None)
+
+
+models.signals.post_delete.connect(
+    progress_deleted, sender=CourseProgress, dispatch_uid='progress_deleted'
+)
@@ -1,10 +1,108 @@
 """
 Módulo de progresso e certificado para gerenciar o acompanhamento do usuário nos cursos
+
+Os métodos com prefixo ``a`` são as versões assíncronas (async ORM) usadas
+pelas views de progresso quando ``ASYNC_PROGRESS_VIEWS`` está ativo.
 """
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.core.files.base import ContentFile
+from django.db.models import Case, Count, F, FloatField, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from core import metrics, profiling
+from . import events, ranking, stats
 from datetime import datetime
-from .models import LessonProgress, CourseProgress, Certificate, Lesson, Course
+import hashlib
+from .models import LessonProgress, CourseProgress, Certificate, Lesson, Course, refresh_next_lessons
+
+logger = logging.getLogger('simplemooc.progress')
+
+_pdf_executor = None
+
+
+def pdf_executor():
+    """Pool de threads onde os PDFs são renderizados sem bloquear o event loop."""
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'CERTIFICATE_PDF_WORKERS', 2),
+            thread_name_prefix='certificate-pdf',
+        )
+    return _pdf_executor
+
+
+def record_lesson_transition(lesson_id, delta):
+    """
+    Efeitos de uma aula que acabou de ser concluída (+1) ou desmarcada (-1),
+    comuns às versões síncrona e assíncrona.
+    """
+    stats.record_lesson_completion(lesson_id, delta)
+    metrics.progress_transitions.inc(transition='lesson_completed' if delta > 0 else 'lesson_uncompleted')
+
+
+def record_course_transition(course, progress, previous, completed):
+    """
+    Efeitos de uma gravação de ``progress`` (``previous`` é o percentual lido
+    antes dela e ``completed`` indica que o curso acabou de ser concluído):
+    ranking, estatísticas, métrica e o evento de progresso, depois do COMMIT.
+    """
+    ranking.record_progress(course.pk, progress.user_id, previous, progress.progress_percentage)
+    if completed:
+        stats.record_course_completion(progress)
+        metrics.progress_transitions.inc(transition='course_completed')
+    events.publish_on_commit(progress.user_id, 'progress', events.progress_data(course.slug, progress))
+
+
+# Tentativas de gravar um CourseProgress que outra requisição mudou no meio
+SAVE_ATTEMPTS = 3
+PROGRESS_FIELDS = (
+    'completed_lessons', 'total_lessons', 'progress_percentage', 'completed_at',
+    'last_lesson_id', 'next_lesson_id', 'updated_at',
+)
+
+
+def lesson_transition(lesson_progress, completed):
+    """
+    UPDATE condicional que conclui (ou desmarca) a aula só se ela ainda não
+    estiver nesse estado. Retorna o queryset e os valores; ``update`` devolve
+    1 só para quem fez a transição, mesmo com requisições simultâneas.
+    """
+    now = timezone.now()
+    lesson_progress.completed = completed
+    lesson_progress.completed_at = now if completed else None
+    lesson_progress.updated_at = now
+    queryset = LessonProgress.objects.filter(pk=lesson_progress.pk, completed=not completed)
+    return queryset, {'completed': completed, 'completed_at': lesson_progress.completed_at, 'updated_at': now}
+
+
+def read_state(progress):
+    """Guarda no ``progress`` o percentual e a conclusão lidos do banco."""
+    progress._read_state = (progress.progress_percentage, progress.completed_at)
+    return progress
+
+
+def course_transition(progress):
+    """
+    Prepara a gravação de ``progress``, já recalculado, como um UPDATE
+    condicional: só grava se o percentual e a conclusão ainda forem os lidos
+    (``read_state``). Retorna o queryset, os valores e se o curso
+    acabou de ser concluído.
+    """
+    percentage, completed_at = progress._read_state
+    completed = progress.progress_percentage >= 100 and progress.completed_at is None
+    if completed:
+        progress.completed_at = timezone.now()
+    progress.updated_at = timezone.now()
+    queryset = CourseProgress.objects.filter(
+        pk=progress.pk, progress_percentage=percentage, completed_at=completed_at
+    )
+    return queryset, {field: getattr(progress, field) for field in PROGRESS_FIELDS}, completed
 
 
 class ProgressManager:
@@ -22,12 +120,12 @@ class ProgressManager:
             lesson=lesson
         )
         if not progress.completed:
-            progress.completed = True
-            progress.completed_at = timezone.now()
-            progress.save()
+            queryset, values = lesson_transition(progress, True)
+            if queryset.update(**values):
+                record_lesson_transition(lesson.pk, 1)
         
         # Atualizar progresso do curso
-        ProgressManager.update_course_progress(user, lesson.course)
+        ProgressManager.update_course_progress(user, lesson.course, lesson)
         
         return progress
 
@@ -38,12 +136,12 @@ class ProgressManager:
         """
         try:
             progress = LessonProgress.objects.get(user=user, lesson=lesson)
-            progress.completed = False
-            progress.completed_at = None
-            progress.save()
+            queryset, values = lesson_transition(progress, False)
+            if queryset.update(**values):
+                record_lesson_transition(lesson.pk, -1)
             
             # Atualizar progresso do curso
-            ProgressManager.update_course_progress(user, lesson.course)
+            ProgressManager.update_course_progress(user, lesson.course, lesson)
         except LessonProgress.DoesNotExist:
             pass
         
@@ -62,16 +160,31 @@ class ProgressManager:
     @staticmethod
     def get_course_progress(user, course):
         """
-        Obtém o progresso de um usuário em um curso.
+        Obtém o progresso de um usuário em um curso, sem recalcular: toda
+        mudança de aulas já o grava (``update_course_progress`` e
+        ``recalculate_progress``), passando pelo ranking.
         """
         try:
-            progress = CourseProgress.objects.get(user=user, course=course)
-            progress.calculate_progress()
-            progress.save()
-            return progress
+            return CourseProgress.objects.select_related('next_lesson', 'last_lesson').get(
+                user=user, course=course
+            )
         except CourseProgress.DoesNotExist:
             return None
 
+    @staticmethod
+    def get_progress_state(user, slug):
+        """
+        Contadores do progresso do aluno no curso (matrícula aprovada) e a
+        versão das aulas (``Course.updated_at``) em uma consulta pelo índice
+        único (user, course), sem recalcular nada. ``None`` se não houver.
+        """
+        return CourseProgress.objects.filter(
+            user=user, course__slug=slug, enrollment__status=1
+        ).values(
+            'pk', 'completed_lessons', 'total_lessons', 'progress_percentage',
+            'completed_at', 'updated_at', 'course__updated_at',
+        ).order_by('course_id').first()
+
     @staticmethod
     def initialize_course_progress(user, enrollment):
         """
@@ -81,34 +194,115 @@ class ProgressManager:
         try:
             progress = CourseProgress.objects.get(user=user, course=course)
         except CourseProgress.DoesNotExist:
-            progress = CourseProgress.objects.create(
-                user=user,
-                course=course,
-                enrollment=enrollment
-            )
-        
-        progress.calculate_progress()
-        progress.save()
-        return progress
+            progress = CourseProgress(user=user, course=course, enrollment=enrollment)
+            progress.calculate_progress()
+            progress.update_resume()
+            progress.save()
+            record_course_transition(course, progress, None, False)
+            return progress
+        return ProgressManager.save_course_progress(course, read_state(progress))
 
     @staticmethod
-    def update_course_progress(user, course):
+    def update_course_progress(user, course, lesson=None):
         """
-        Atualiza o progresso geral do usuário em um curso.
+        Atualiza o progresso geral do usuário em um curso e o ponteiro de
+        retomada (``lesson`` é a aula que acabou de mudar).
         """
         try:
             progress = CourseProgress.objects.get(user=user, course=course)
+        except CourseProgress.DoesNotExist:
+            return None
+        return ProgressManager.save_course_progress(course, read_state(progress), lesson)
+
+    @staticmethod
+    def save_course_progress(course, progress, lesson=None):
+        """
+        Recalcula e grava ``progress`` com um UPDATE condicional; se outra
+        requisição o gravou no meio, relê e tenta de novo (até
+        ``SAVE_ATTEMPTS`` vezes). Os efeitos (ranking, estatísticas, evento)
+        são aplicados só por quem gravou.
+        """
+        for attempt in range(SAVE_ATTEMPTS):
+            if attempt:
+                progress.refresh_from_db()
+                read_state(progress)
             progress.calculate_progress()
-            progress.save()
-            
-            # Verificar se o curso foi concluído
-            if progress.progress_percentage >= 100 and progress.completed_at is None:
-                progress.completed_at = timezone.now()
-                progress.save()
-            
-            return progress
+            progress.update_resume(lesson)
+            queryset, values, completed = course_transition(progress)
+            if queryset.update(**values):
+                record_course_transition(course, progress, progress._read_state[0], completed)
+                break
+        return progress
+
+    @staticmethod
+    async def amark_lesson_complete(user, lesson):
+        """
+        Versão assíncrona de ``mark_lesson_complete``. Não recalcula o curso:
+        chame ``aupdate_course_progress`` em seguida (uma vez por requisição).
+        """
+        progress, created = await LessonProgress.objects.aget_or_create(user=user, lesson=lesson)
+        if not progress.completed:
+            queryset, values = lesson_transition(progress, True)
+            if await queryset.aupdate(**values):
+                await sync_to_async(record_lesson_transition)(lesson.pk, 1)
+        return progress
+
+    @staticmethod
+    async def amark_lesson_incomplete(user, lesson):
+        """
+        Versão assíncrona de ``mark_lesson_incomplete``; ``None`` se a aula não
+        foi iniciada. Como em ``amark_lesson_complete``, não recalcula o curso.
+        """
+        try:
+            progress = await LessonProgress.objects.aget(user=user, lesson=lesson)
+        except LessonProgress.DoesNotExist:
+            return None
+        queryset, values = lesson_transition(progress, False)
+        if await queryset.aupdate(**values):
+            await sync_to_async(record_lesson_transition)(lesson.pk, -1)
+        return progress
+
+    @staticmethod
+    async def aupdate_course_progress(user, course, lesson=None):
+        """
+        Versão assíncrona de ``update_course_progress``; os efeitos da gravação
+        são os mesmos (``record_course_transition``).
+        """
+        try:
+            progress = read_state(await CourseProgress.objects.aget(user=user, course=course))
         except CourseProgress.DoesNotExist:
             return None
+        for attempt in range(SAVE_ATTEMPTS):
+            if attempt:
+                await progress.arefresh_from_db()
+                read_state(progress)
+            await progress.acalculate_progress()
+            await progress.aupdate_resume(lesson)
+            queryset, values, completed = course_transition(progress)
+            if await queryset.aupdate(**values):
+                await sync_to_async(record_course_transition)(
+                    course, progress, progress._read_state[0], completed
+                )
+                break
+        return progress
+
+    @staticmethod
+    async def aget_course_progress(user, course):
+        """Versão assíncrona de ``get_course_progress``."""
+        try:
+            return await CourseProgress.objects.aget(user=user, course=course)
+        except CourseProgress.DoesNotExist:
+            return None
+
+    @staticmethod
+    async def aget_progress_state(user, slug):
+        """Versão assíncrona de ``get_progress_state``."""
+        return await CourseProgress.objects.filter(
+            user=user, course__slug=slug, enrollment__status=1
+        ).values(
+            'pk', 'completed_lessons', 'total_lessons', 'progress_percentage',
+            'completed_at', 'updated_at', 'course__updated_at',
+        ).order_by('course_id').afirst()
 
     @staticmethod
     def get_all_lessons_completed(user, course):
@@ -121,14 +315,63 @@ class ProgressManager:
             completed=True
         )
 
+    @staticmethod
+    def count_subqueries():
+        """
+        Subqueries com o total de aulas do curso e de aulas concluídas pelo
+        usuário, relativas a uma linha de CourseProgress.
+        """
+        lessons = Lesson.objects.filter(
+            course=OuterRef('course')
+        ).order_by().values('course').annotate(total=Count('pk')).values('total')
+        completed = LessonProgress.objects.filter(
+            user=OuterRef('user'),
+            lesson__course=OuterRef('course'),
+            completed=True
+        ).order_by().values('lesson__course').annotate(total=Count('pk')).values('total')
+        return Coalesce(Subquery(lessons), 0), Coalesce(Subquery(completed), 0)
+
+    @staticmethod
+    def recalculate_progress(queryset):
+        """
+        Recalcula contadores, percentual e conclusão de vários CourseProgress
+        com UPDATEs em lote, sem carregar as linhas. Retorna quantas linhas
+        foram atualizadas.
+        """
+        lessons, completed = ProgressManager.count_subqueries()
+        now = timezone.now()
+        selected = CourseProgress.objects.filter(pk__in=queryset.values('pk'))
+        updated = selected.update(
+            total_lessons=lessons, completed_lessons=completed, updated_at=now
+        )
+        selected.update(progress_percentage=Case(
+            When(total_lessons=0, then=Value(0.0)),
+            default=F('completed_lessons') * 100.0 / F('total_lessons'),
+            output_field=FloatField(),
+        ))
+        selected.filter(progress_percentage__gte=100, completed_at__isnull=True).update(
+            completed_at=now
+        )
+        refresh_next_lessons(selected)
+        ranking.rebuild(selected.order_by().values_list('course_id', flat=True).distinct())
+        return updated
+
     @staticmethod
     def get_user_courses_progress(user):
         """
         Retorna o progresso do usuário em todos os cursos em que está inscrito.
         """
-        progresses = CourseProgress.objects.filter(user=user)
+        lessons, completed = ProgressManager.count_subqueries()
+        progresses = list(
+            CourseProgress.objects.filter(user=user).select_related(
+                'course', 'certificate', 'next_lesson'
+            ).annotate(
+                lessons_count=lessons,
+                completed_count=completed,
+            )
+        )
         for progress in progresses:
-            progress.calculate_progress()
+            progress.apply_counts(progress.lessons_count, progress.completed_count)
         return progresses
 
 
@@ -165,6 +408,15 @@ class CertificateManager:
         """
         Gera um arquivo PDF do certificado.
         """
+        with profiling.profile_section('generate_certificate_pdf'), \
+                metrics.certificate_pdf_duration.time():
+            pdf = CertificateManager._render_certificate_pdf(certificate)
+        if pdf:
+            metrics.certificate_pdf_bytes.observe(len(pdf))
+        return pdf
+
+    @staticmethod
+    def _render_certificate_pdf(certificate):
         try:
             from reportlab.lib.pagesizes import landscape, A4
             from reportlab.lib.colors import HexColor
@@ -292,9 +544,126 @@ class CertificateManager:
             return certificate
         
         except ImportError as e:
-            print(f"Aviso: {e}. O certificado não será salvo em PDF, mas o objeto Certificate foi criado.")
+            logger.warning('%s. O certificado não será salvo em PDF, mas o objeto Certificate foi criado.', e)
             return certificate
 
+    @staticmethod
+    def issue_certificates(queryset, batch_size=1000):
+        """
+        Cria, com bulk_create, os certificados que faltam para os
+        CourseProgress concluídos de ``queryset``. Os PDFs são gerados sob
+        demanda no primeiro download. Retorna quantos certificados foram
+        criados (um certificado emitido no meio por outra requisição fica de
+        fora).
+        """
+        pending = queryset.filter(
+            progress_percentage__gte=100, certificate__isnull=True
+        ).order_by().values_list('pk', 'user_id', 'course_id')
+        stamp = timezone.now().isoformat()
+        created = 0
+        batch = []
+
+        def save(batch):
+            Certificate.objects.bulk_create(batch, ignore_conflicts=True)
+            # ignore_conflicts descarta em silêncio as linhas em conflito: conta
+            # só as deste lote que foram de fato gravadas
+            inserted = list(Certificate.objects.filter(
+                course_progress_id__in=[certificate.course_progress_id for certificate in batch],
+                certificate_number__in=[certificate.certificate_number for certificate in batch],
+            ).values_list('course_id', flat=True))
+            # bulk_create não dispara o sinal que conta os certificados
+            per_course = {}
+            for course_id in inserted:
+                per_course[course_id] = per_course.get(course_id, 0) + 1
+            stats.record_certificates(per_course)
+            return len(inserted)
+
+        for pk, user_id, course_id in pending.iterator(chunk_size=batch_size):
+            # Com separadores e o pk do progresso: (1, 23) e (12, 3) não geram o mesmo número
+            number = hashlib.md5(
+                f'{pk}-{user_id}-{course_id}-{stamp}'.encode()
+            ).hexdigest()[:16].upper()
+            batch.append(Certificate(
+                user_id=user_id, course_id=course_id, course_progress_id=pk,
+                certificate_number=number
+            ))
+            if len(batch) >= batch_size:
+                created += save(batch)
+                batch = []
+        if batch:
+            created += save(batch)
+        return created
+
+    @staticmethod
+    def reset_certificate_files(queryset):
+        """
+        Apaga os PDFs dos certificados de ``queryset`` e limpa o campo em um
+        único UPDATE; o PDF é gerado novamente no próximo download.
+        """
+        storage = Certificate._meta.get_field('certificate_file').storage
+        files = queryset.exclude(certificate_file='').exclude(certificate_file__isnull=True)
+        for name in files.values_list('certificate_file', flat=True).iterator():
+            storage.delete(name)
+        return queryset.update(certificate_file=None)
+
+    @staticmethod
+    def get_certificate_state(user, slug):
+        """Número, data e arquivo do certificado do aluno no curso (uma consulta)."""
+        return Certificate.objects.filter(user=user, course__slug=slug).values(
+            'certificate_number', 'issued_at', 'certificate_file'
+        ).order_by('course_id').first()
+
+    @staticmethod
+    def get_certificates_state(user):
+        """
+        Resumo do que a lista de certificados exibe (certificados e o menu de
+        cursos do painel) em uma única agregação.
+        """
+        return get_user_model().objects.filter(pk=user.pk).aggregate(
+            certificate_count=Count('certificates', distinct=True),
+            file_count=Count('certificates', filter=Q(certificates__certificate_file__gt=''), distinct=True),
+            last_issued=Max('certificates__issued_at'),
+            enrollment_count=Count('enrollments', distinct=True),
+            last_enrollment=Max('enrollments__update'),
+            last_course=Max('enrollments__course__updated_at'),
+        )
+
+    @staticmethod
+    async def acheck_and_generate_certificate(user, course, course_progress):
+        """
+        Versão assíncrona de ``check_and_generate_certificate`` para um
+        progresso já recalculado. O PDF é renderizado no ``pdf_executor``.
+        """
+        if course_progress.progress_percentage < 100:
+            return None
+        certificate = await Certificate.objects.filter(user=user, course=course).afirst()
+        if certificate is not None:
+            return certificate
+
+        certificate, created = await Certificate.objects.aget_or_create(
+            user=user, course=course, course_progress=course_progress,
+            defaults={'certificate_number': Certificate(
+                user=user, course=course
+            ).generate_certificate_number()},
+        )
+        if not created:
+            return certificate
+        try:
+            pdf_content = await asyncio.get_running_loop().run_in_executor(
+                pdf_executor(), CertificateManager.generate_certificate_pdf, certificate
+            )
+        except ImportError as e:
+            logger.warning('%s. O certificado não será salvo em PDF, mas o objeto Certificate foi criado.', e)
+        else:
+            filename = f"certificado_{user.id}_{course.id}_{certificate.certificate_number}.pdf"
+            await sync_to_async(certificate.certificate_file.save)(
+                filename, ContentFile(pdf_content), save=True
+            )
+        events.broker.publish(
+            user.pk, 'certificate', events.certificate_data(course.slug, certificate)
+        )
+        return certificate
+
     @staticmethod
     def get_certificate(user, course):
         """
@@ -323,6 +692,9 @@ class CertificateManager:
                 # Criar novo certificado
                 certificate = CertificateManager.create_certificate(user, course, course_progress)
                 certificate = CertificateManager.save_certificate_file(certificate)
+                events.publish_on_commit(
+                    user.pk, 'certificate', events.certificate_data(course.slug, certificate)
+                )
                 return certificate
         
         except CourseProgress.DoesNotExist:
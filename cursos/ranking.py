@@ -0,0 +1,199 @@
+"""
+Posição do aluno no curso ("à frente de 72% dos alunos") e ranking top-N.
+
+O percentual de progresso de cada ``CourseProgress`` com matrícula aprovada
+entra em um histograma por curso (``CourseHistogram`` com a métrica
+``progress``), em faixas de ``BUCKET_WIDTH`` pontos; 100% fica em uma faixa
+própria. Toda gravação que muda o percentual passa por ``record_progress``
+(um único INSERT ... ON CONFLICT que tira o aluno de uma faixa e o põe em
+outra), e cancelar, reativar ou apagar a matrícula também move o aluno. O
+percentil lê só as faixas do curso, sem ORDER BY nem COUNT sobre
+``CourseProgress``.
+
+O ranking top-N fica em cache e guarda o menor percentual da lista. Uma
+mudança só o invalida (depois do COMMIT) se o aluno já estiver na lista ou
+tiver alcançado esse percentual; as demais (a maioria, em cursos grandes) não
+custam nada.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, Value
+from django.db.models.functions import Cast, Floor, Least
+
+from core.db import upsert_add
+
+from .models import CourseHistogram, CourseProgress
+
+BUCKET_WIDTH = 5
+LAST_BUCKET = 100 // BUCKET_WIDTH
+
+DEFAULTS = {
+    # Alunos no ranking do curso
+    'LEADERBOARD_SIZE': 10,
+    # Validade do ranking em cache (s); mudanças relevantes o invalidam antes
+    'LEADERBOARD_TIMEOUT': 60 * 60,
+}
+
+
+def get_setting(name):
+    """Lê uma opção de ``settings.COURSE_RANKING`` com valor padrão."""
+    return getattr(settings, 'COURSE_RANKING', {}).get(name, DEFAULTS[name])
+
+
+def progress_bucket(percentage):
+    """Faixa do histograma de um percentual de progresso."""
+    return min(max(int(percentage), 0) // BUCKET_WIDTH, LAST_BUCKET)
+
+
+def leaderboard_cache_key(course_id):
+    return 'cursos:leaderboard:%d' % course_id
+
+
+def invalidate_leaderboard(course_ids):
+    """
+    Apaga os rankings em cache depois do COMMIT: apagados antes, uma leitura
+    concorrente voltaria a guardar a lista sem a mudança ainda não gravada.
+    """
+    keys = [leaderboard_cache_key(course_id) for course_id in course_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def move(course_id, old, new):
+    """
+    Tira o aluno da faixa ``old`` e o põe na faixa ``new`` (qualquer uma pode
+    ser ``None``) com um único INSERT ... ON CONFLICT, também quando as duas
+    são a mesma: assim uma mudança de progresso custa sempre uma query. Uma
+    faixa nunca fica negativa.
+    """
+    quote = connection.ops.quote_name
+    table = quote(CourseHistogram._meta.db_table)
+    course, metric, bucket, total = (
+        quote(CourseHistogram._meta.get_field(name).column)
+        for name in ('course', 'metric', 'bucket', 'total')
+    )
+    rows = [
+        (course_id, CourseHistogram.PROGRESS, value, int(value == new and value != old))
+        for value in sorted({value for value in (old, new) if value is not None})
+    ]
+    # +1 na linha da faixa nova e -1 na da antiga (EXCLUDED é a linha proposta)
+    change = (
+        '%s.%s + (CASE WHEN EXCLUDED.%s = %%s THEN 1 ELSE 0 END)'
+        ' - (CASE WHEN EXCLUDED.%s = %%s THEN 1 ELSE 0 END)' % (table, total, bucket, bucket)
+    )
+    changes = [-1 if new is None else new, -1 if old is None else old]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO %s (%s, %s, %s, %s) VALUES %s ON CONFLICT (%s, %s, %s) '
+            'DO UPDATE SET %s = CASE WHEN %s < 0 THEN 0 ELSE %s END' % (
+                table, course, metric, bucket, total, ', '.join(['(%s, %s, %s, %s)'] * len(rows)),
+                course, metric, bucket, total, change, change,
+            ),
+            [value for row in rows for value in row] + changes * 2,
+        )
+
+
+def record_progress(course_id, user_id, old, new):
+    """
+    Registra a mudança do percentual de um aluno de ``old`` para ``new``
+    (``None`` quando ele entra ou sai do ranking): move o aluno de faixa e
+    invalida o ranking em cache se preciso.
+    """
+    if old == new:
+        return
+    move(
+        course_id,
+        None if old is None else progress_bucket(old),
+        None if new is None else progress_bucket(new),
+    )
+    cached = cache.get(leaderboard_cache_key(course_id))
+    if cached is not None and (
+        user_id in cached['users'] or (new is not None and new >= cached['cutoff'])
+    ):
+        invalidate_leaderboard([course_id])
+
+
+def record_added(progresses):
+    """
+    Conta, com um upsert, alunos que entram no ranking em lote (progresso
+    criado com ``bulk_create`` ou matrícula reativada com UPDATE).
+    """
+    totals = {}
+    for progress in progresses:
+        key = (progress.course_id, progress_bucket(progress.progress_percentage))
+        totals[key] = totals.get(key, 0) + 1
+    upsert_add(CourseHistogram, ['course', 'metric', 'bucket'], ['total'], [
+        (course_id, CourseHistogram.PROGRESS, bucket, total)
+        for (course_id, bucket), total in totals.items()
+    ])
+    invalidate_leaderboard({course_id for course_id, bucket in totals})
+
+
+def rebuild(course_ids):
+    """Recalcula o histograma de progresso dos cursos com um GROUP BY."""
+    course_ids = list(course_ids)
+    rows = CourseProgress.objects.filter(
+        course_id__in=course_ids, enrollment__status=1
+    ).order_by().annotate(
+        bucket=Least(
+            Cast(Floor(F('progress_percentage') / BUCKET_WIDTH), IntegerField()), Value(LAST_BUCKET)
+        )
+    ).values('course_id', 'bucket').annotate(total=Count('pk'))
+    with transaction.atomic():
+        CourseHistogram.objects.filter(
+            course_id__in=course_ids, metric=CourseHistogram.PROGRESS
+        ).delete()
+        CourseHistogram.objects.bulk_create([
+            CourseHistogram(
+                course_id=row['course_id'], metric=CourseHistogram.PROGRESS,
+                bucket=row['bucket'], total=row['total'],
+            )
+            for row in rows
+        ], batch_size=500)
+    invalidate_leaderboard(course_ids)
+
+
+def percentile(progress):
+    """
+    Percentual dos outros alunos do curso em faixas abaixo da faixa de
+    ``progress`` (uma consulta a no máximo 21 linhas), ou ``None`` se o aluno
+    está sozinho no curso.
+    """
+    mine = progress_bucket(progress.progress_percentage)
+    below = others = 0
+    for bucket, total in CourseHistogram.objects.filter(
+        course_id=progress.course_id, metric=CourseHistogram.PROGRESS
+    ).values_list('bucket', 'total'):
+        others += total
+        if bucket < mine:
+            below += total
+    others -= 1
+    if others <= 0:
+        return None
+    return round(min(below, others) * 100 / others)
+
+
+def leaderboard(course):
+    """
+    Os ``LEADERBOARD_SIZE`` alunos mais adiantados com matrícula aprovada
+    (quem concluiu antes vem primeiro no empate), lidos do cache quando
+    possível.
+    """
+    key = leaderboard_cache_key(course.pk)
+    cached = cache.get(key)
+    if cached is None:
+        size = get_setting('LEADERBOARD_SIZE')
+        entries = list(CourseProgress.objects.filter(course=course, enrollment__status=1).order_by(
+            '-progress_percentage', F('completed_at').asc(nulls_last=True), 'pk'
+        ).values(
+            'user_id', 'user__username', 'user__first_name', 'user__last_name',
+            'progress_percentage', 'completed_at',
+        )[:size])
+        cached = {
+            'entries': entries,
+            'users': {entry['user_id'] for entry in entries},
+            # Com a lista incompleta qualquer aluno entra nela
+            'cutoff': entries[-1]['progress_percentage'] if len(entries) >= size else -1,
+        }
+        cache.set(key, cached, get_setting('LEADERBOARD_TIMEOUT'))
+    return cached['entries']
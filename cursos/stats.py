@@ -0,0 +1,212 @@
+"""
+Estatísticas dos cursos (funil de conclusão por aula) mantidas incrementalmente.
+
+``CourseStats``, ``LessonStats`` e ``CourseHistogram`` guardam só contadores.
+Eles são atualizados no momento em que algo muda: ``ProgressManager`` ao
+concluir ou desmarcar uma aula e ao concluir um curso, e os sinais de
+``Enrollment`` e ``Certificate`` (as operações em lote chamam as funções
+``record_*`` diretamente). Os acréscimos usam INSERT ... ON CONFLICT e
+somam ao valor gravado, e as reduções nunca passam de zero. Assim a página
+de estatísticas lê poucas linhas, qualquer que seja o tamanho do curso.
+
+A migração 0007 preenche as tabelas com os dados existentes. O comando
+``rebuild_course_stats`` recalcula tudo a partir das tabelas de origem; rode-o
+depois de alterações feitas fora da aplicação.
+"""
+from bisect import bisect_left
+
+from django.db import transaction
+from django.db.models import Count, F, PositiveIntegerField
+
+from core.db import upsert_add
+
+from . import ranking
+from .models import (
+    Course, CourseHistogram, CourseProgress, CourseStats, Certificate, Enrollment,
+    Lesson, LessonProgress, LessonStats,
+)
+
+# Limites superiores (horas) das faixas de tempo até concluir o curso; a
+# última faixa (índice len(COMPLETION_BUCKETS)) é "mais de um ano"
+COMPLETION_BUCKETS = (1, 6, 24, 72, 168, 336, 720, 1440, 2160, 4320, 8760)
+
+
+def completion_bucket(progress_created_at, completed_at):
+    """Faixa do tempo entre o início do progresso (matrícula) e a conclusão."""
+    hours = max((completed_at - progress_created_at).total_seconds(), 0) / 3600
+    return bisect_left(COMPLETION_BUCKETS, hours)
+
+
+def apply_deltas(model, key, deltas):
+    """
+    ``deltas`` é ``{valor da chave: {campo: variação}}``. Soma as variações
+    positivas com um único upsert (os demais contadores entram com zero, pois
+    a linha pode ainda não existir) e aplica as negativas com UPDATE
+    protegido, para um contador nunca ficar negativo.
+    """
+    counters = [
+        field.name for field in model._meta.concrete_fields
+        if field.name != key and isinstance(field, PositiveIntegerField)
+    ]
+    increments = [
+        (value,) + tuple(max(changes.get(field, 0), 0) for field in counters)
+        for value, changes in deltas.items()
+        if any(delta > 0 for delta in changes.values())
+    ]
+    if increments:
+        upsert_add(model, [key], counters, increments)
+    for value, changes in deltas.items():
+        for field, delta in changes.items():
+            if delta < 0:
+                model.objects.filter(**{key: value, field + '__gte': -delta}).update(
+                    **{field: F(field) + delta}
+                )
+
+
+def record_enrollments(deltas):
+    """``{course_id: variação}`` de matrículas aprovadas."""
+    apply_deltas(CourseStats, 'course', {
+        course_id: {'enrolled_count': delta} for course_id, delta in deltas.items() if delta
+    })
+
+
+def record_certificates(deltas):
+    """``{course_id: variação}`` de certificados emitidos."""
+    apply_deltas(CourseStats, 'course', {
+        course_id: {'certificate_count': delta} for course_id, delta in deltas.items() if delta
+    })
+
+
+def record_lesson_completion(lesson_id, delta):
+    """Uma aula concluída (+1) ou desmarcada (-1)."""
+    apply_deltas(LessonStats, 'lesson', {lesson_id: {'completed_count': delta}})
+
+
+def record_course_completion(progress, delta=1):
+    """
+    Curso concluído (+1) ou progresso concluído apagado (-1): conta a
+    conclusão e a faixa de tempo que levou.
+    """
+    apply_deltas(CourseStats, 'course', {progress.course_id: {'completed_count': delta}})
+    bucket = completion_bucket(progress.created_at, progress.completed_at)
+    if delta > 0:
+        upsert_add(CourseHistogram, ['course', 'metric', 'bucket'], ['total'], [(
+            progress.course_id, CourseHistogram.COMPLETION_TIME, bucket, delta,
+        )])
+    else:
+        rows = CourseHistogram.objects.filter(
+            course_id=progress.course_id, metric=CourseHistogram.COMPLETION_TIME, bucket=bucket
+        )
+        rows.filter(total__gte=-delta).update(total=F('total') + delta)
+        # Como no rebuild, faixas vazias não ficam gravadas
+        rows.filter(total=0).delete()
+
+
+def rebuild(course_ids=None):
+    """
+    Recalcula as estatísticas dos cursos (todos, se ``course_ids`` for
+    ``None``), inclusive o histograma do ranking, com consultas agrupadas.
+    Retorna quantos cursos foram gravados.
+    """
+    courses = Course.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+    course_ids = list(courses.values_list('pk', flat=True))
+
+    def per_course(queryset):
+        # Um GROUP BY por tabela: juntar as três multiplicaria as linhas
+        return dict(
+            queryset.filter(course_id__in=course_ids).order_by().values('course_id').annotate(
+                total=Count('pk')
+            ).values_list('course_id', 'total')
+        )
+
+    enrolled = per_course(Enrollment.objects.filter(status=1))
+    completions = per_course(CourseProgress.objects.filter(completed_at__isnull=False))
+    certificates = per_course(Certificate.objects.all())
+    lessons = LessonProgress.objects.filter(
+        lesson__course_id__in=course_ids, completed=True
+    ).order_by().values('lesson_id').annotate(total=Count('pk'))
+    histogram = {}
+    completed = CourseProgress.objects.filter(
+        course_id__in=course_ids, completed_at__isnull=False
+    ).values_list('course_id', 'created_at', 'completed_at')
+    for course_id, created_at, completed_at in completed.iterator(chunk_size=2000):
+        key = (course_id, completion_bucket(created_at, completed_at))
+        histogram[key] = histogram.get(key, 0) + 1
+
+    with transaction.atomic():
+        CourseStats.objects.filter(course_id__in=course_ids).delete()
+        LessonStats.objects.filter(lesson__course_id__in=course_ids).delete()
+        CourseHistogram.objects.filter(
+            course_id__in=course_ids, metric=CourseHistogram.COMPLETION_TIME
+        ).delete()
+        CourseStats.objects.bulk_create([
+            CourseStats(
+                course_id=pk, enrolled_count=enrolled.get(pk, 0),
+                completed_count=completions.get(pk, 0), certificate_count=certificates.get(pk, 0),
+            )
+            for pk in course_ids
+        ], batch_size=500)
+        LessonStats.objects.bulk_create([
+            LessonStats(lesson_id=row['lesson_id'], completed_count=row['total'])
+            for row in lessons.iterator(chunk_size=2000)
+        ], batch_size=500)
+        CourseHistogram.objects.bulk_create([
+            CourseHistogram(
+                course_id=course_id, metric=CourseHistogram.COMPLETION_TIME, bucket=bucket, total=total
+            )
+            for (course_id, bucket), total in histogram.items()
+        ], batch_size=500)
+    ranking.rebuild(course_ids)
+    return len(course_ids)
+
+
+def bucket_label(bucket):
+    if bucket >= len(COMPLETION_BUCKETS):
+        return 'mais de %d dias' % (COMPLETION_BUCKETS[-1] // 24)
+    hours = COMPLETION_BUCKETS[bucket]
+    if hours == 1:
+        return 'até 1 hora'
+    return 'até %d horas' % hours if hours < 24 else 'até %d dias' % (hours // 24)
+
+
+def median_bucket(totals):
+    """Faixa que contém a mediana de ``{faixa: alunos}`` (ou ``None``)."""
+    count = sum(totals.values())
+    seen = 0
+    for bucket in sorted(totals):
+        seen += totals[bucket]
+        if seen * 2 >= count and count:
+            return bucket
+    return None
+
+
+def course_analytics(course):
+    """Funil do curso lido só das tabelas agregadas (três consultas)."""
+    stats = CourseStats.objects.filter(course=course).first() or CourseStats(course=course)
+    enrolled = stats.enrolled_count
+    funnel = []
+    previous = enrolled
+    for lesson in Lesson.objects.filter(course=course).order_by('number', 'pk').values(
+        'pk', 'number', 'name', 'stats__completed_count'
+    ):
+        completed = lesson['stats__completed_count'] or 0
+        funnel.append({
+            'lesson': lesson,
+            'completed': completed,
+            'rate': completed * 100 / enrolled if enrolled else 0.0,
+            'drop_off': (previous - completed) * 100 / previous if previous > completed else 0.0,
+        })
+        previous = completed
+    totals = dict(CourseHistogram.objects.filter(
+        course=course, metric=CourseHistogram.COMPLETION_TIME
+    ).values_list('bucket', 'total'))
+    median = median_bucket(totals)
+    return {
+        'stats': stats,
+        'funnel': funnel,
+        'completion_rate': stats.completed_count * 100 / enrolled if enrolled else 0.0,
+        'median_completion': bucket_label(median) if median is not None else None,
+        'completion_times': [(bucket_label(bucket), totals[bucket]) for bucket in sorted(totals)],
+    }
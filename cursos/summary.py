@@ -0,0 +1,80 @@
+"""
+Resumo JSON do progresso do aluno em todos os cursos com matrícula aprovada.
+
+Tudo sai de uma única consulta sobre ``Enrollment``: os totais de aulas vêm
+das mesmas subqueries de ``ProgressManager.count_subqueries`` (nada é
+recalculado nem gravado) e o certificado e a próxima aula (o ponteiro
+``CourseProgress.next_lesson``) por JOIN, com 1 ou 100 cursos.
+
+``fields`` escolhe as chaves de cada curso (``course`` sempre vem); campos
+não pedidos ficam fora das consultas.
+"""
+from django.urls import reverse
+
+from .models import Enrollment
+from .progress import ProgressManager
+
+SUMMARY_FIELDS = ('name', 'progress', 'certificate', 'next_lesson')
+
+
+class SummaryFieldError(ValueError):
+    """Campo desconhecido em ``fields``."""
+
+
+def parse_fields(value):
+    """``'progress,next_lesson'`` -> conjunto de campos; vazio = todos."""
+    if not value:
+        return set(SUMMARY_FIELDS)
+    fields = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = fields - set(SUMMARY_FIELDS) - {'course'}
+    if unknown:
+        raise SummaryFieldError('Campos inválidos: %s' % ', '.join(sorted(unknown)))
+    return fields
+
+
+def progress_summary(user, fields=None):
+    """Lista de dicionários, um por curso, na ordem de matrícula."""
+    fields = set(SUMMARY_FIELDS) if fields is None else fields
+    columns = ['course__slug']
+    enrollments = Enrollment.objects.filter(user=user, status=1).order_by('pk')
+    if 'name' in fields:
+        columns.append('course__name')
+    if 'progress' in fields:
+        lessons, completed = ProgressManager.count_subqueries()
+        enrollments = enrollments.annotate(lessons_count=lessons, completed_count=completed)
+        columns += ['lessons_count', 'completed_count', 'progress__completed_at']
+    if 'certificate' in fields:
+        columns.append('progress__certificate__certificate_number')
+    if 'next_lesson' in fields:
+        columns += ['progress__next_lesson', 'progress__next_lesson__number', 'progress__next_lesson__name']
+    return [summary_item(row, fields) for row in enrollments.values(*columns)]
+
+
+def summary_item(row, fields):
+    slug = row['course__slug']
+    item = {'course': slug}
+    if 'name' in fields:
+        item['name'] = row['course__name']
+    if 'progress' in fields:
+        total, completed = row['lessons_count'], row['completed_count']
+        item['progress'] = {
+            'completed': completed,
+            'total': total,
+            'percentage': round(completed * 100 / total, 1) if total else 0.0,
+            'done': row['progress__completed_at'] is not None,
+        }
+    if 'certificate' in fields:
+        number = row['progress__certificate__certificate_number']
+        item['certificate'] = number and {
+            'number': number,
+            'url': reverse('cursos:download_certificate', args=[slug]),
+        }
+    if 'next_lesson' in fields:
+        lesson_id = row['progress__next_lesson']
+        item['next_lesson'] = lesson_id and {
+            'id': lesson_id,
+            'number': row['progress__next_lesson__number'],
+            'name': row['progress__next_lesson__name'],
+            'url': reverse('cursos:lesson', args=[slug, lesson_id]),
+        }
+    return item
@@ -7,4 +7,4 @@ register = template.Library()
 @register.simple_tag
 def my_courses(user):
     """Retorna as inscrições do usuário"""
-    return user.enrollments.all()
+    return user.enrollments.select_related('course')
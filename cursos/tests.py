@@ -4,14 +4,41 @@ Testes para o sistema de Progresso e Certificados
 Execute com: python manage.py test cursos.tests.ProgressManagerTests
 """
 
-from django.test import TestCase
-from django.contrib.auth.models import User
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.urls import reverse
 from django.utils import timezone
-from datetime import datetime
 
+from accounts.models import NotificationPreference
+from core.models import OutboundMessage
+from cursos import activity, export, ranking, stats, views
+from cursos.catalog import CatalogError, CatalogImporter, read_documents
+from cursos.comments import COMMENTS_PER_PAGE, comments_page
+from cursos.dataset import DatasetGenerator
+from cursos.digest import send_announcement_digests
+from cursos.enrollment_import import EnrollmentImporter
+from cursos.events import broker, event_stream
+from cursos.lessons import get_course_lessons, reorder_lessons
 from cursos.models import (
-    Course, Lesson, Material, Enrollment,
-    LessonProgress, CourseProgress, Certificate
+    Course, Lesson, Material, Enrollment, Announcement, Comment,
+    LessonProgress, CourseProgress, Certificate, CourseDailyActivity, LessonActivity,
+    CourseStats, LessonStats, CourseHistogram
 )
 from cursos.progress import ProgressManager, CertificateManager
 
@@ -377,3 +404,1255 @@ class CourseProgressModelTests(TestCase):
         )
         progress.calculate_progress()
         self.assertEqual(progress.progress_percentage, 100.0)
+
+
+class DatasetGeneratorTests(TestCase):
+    """Testes para o gerador de dados sintéticos (populate_db --users ...)"""
+
+    def generate(self, prefix, seed=7):
+        return DatasetGenerator(
+            users=30, courses=4, lessons_per_course=5, completion_ratio=0.5,
+            enrollments_per_user=2, seed=seed, batch_size=7, prefix=prefix
+        ).run()
+
+    def test_generate_consistent_rows(self):
+        """Testa que contadores e certificados batem com o progresso gerado"""
+        result = self.generate('gen')
+
+        self.assertEqual(result['counts']['User'], 30)
+        self.assertEqual(result['counts']['Enrollment'], 60)
+        self.assertEqual(result['counts']['CourseProgress'], 60)
+        self.assertEqual(
+            result['counts']['LessonProgress'],
+            LessonProgress.objects.filter(completed=True).count()
+        )
+        self.assertEqual(
+            Certificate.objects.count(),
+            CourseProgress.objects.filter(progress_percentage=100).count()
+        )
+        for progress in CourseProgress.objects.all()[:10]:
+            expected = progress.progress_percentage
+            self.assertAlmostEqual(progress.calculate_progress(), expected)
+
+    def test_same_seed_same_distribution(self):
+        """Testa que a mesma semente gera a mesma distribuição de progresso"""
+        self.generate('a')
+        self.generate('b')
+        first = list(CourseProgress.objects.filter(
+            user__username__startswith='a').order_by('user__username', 'course__slug'
+        ).values_list('completed_lessons', flat=True))
+        second = list(CourseProgress.objects.filter(
+            user__username__startswith='b').order_by('user__username', 'course__slug'
+        ).values_list('completed_lessons', flat=True))
+        self.assertEqual(first, second)
+
+
+class ProgressExportTests(TestCase):
+    """Testes para a exportação de progresso em streaming"""
+
+    def setUp(self):
+        DatasetGenerator(
+            users=12, courses=3, lessons_per_course=4, enrollments_per_user=2, prefix='exp'
+        ).run()
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_per_course(self):
+        """Testa o CSV de um curso com cabeçalho e uma linha por matrícula"""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('cursos:export_progress'), {'curso': 'exp-curso-1'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(self.read(response).splitlines()))
+        self.assertEqual(
+            len(rows), CourseProgress.objects.filter(course__slug='exp-curso-1').count()
+        )
+        self.assertEqual({row['curso'] for row in rows}, {'exp-curso-1'})
+
+    def test_ndjson_lessons_and_permissions(self):
+        """Testa o NDJSON por aula e a restrição a staff"""
+        url = reverse('cursos:export_progress')
+        response = self.client.get(url, {'tipo': 'aulas', 'formato': 'ndjson'})
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(url, {'tipo': 'aulas', 'formato': 'ndjson'})
+        lines = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(len(lines), LessonProgress.objects.count())
+        self.assertIn('concluida_em', lines[0])
+
+    def test_async_content_under_asgi(self):
+        """Testa que sob ASGI a exportação é um iterador assíncrono lido em lotes"""
+        async def read(response):
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        client = AsyncClient()
+        client.force_login(self.staff)
+        with mock.patch.object(export, 'ASYNC_BATCH', 5):
+            response = async_to_sync(client.get)(reverse('cursos:export_progress'))
+            self.assertTrue(response.is_async)
+            rows = list(csv.DictReader(async_to_sync(read)(response).splitlines()))
+        self.assertEqual(len(rows), CourseProgress.objects.count())
+
+    def test_admin_action_and_command(self):
+        """Testa a ação do admin e o comando export_progress"""
+        self.staff.is_superuser = True
+        self.staff.save()
+        self.client.force_login(self.staff)
+        selected = list(CourseProgress.objects.values_list('pk', flat=True)[:5])
+        response = self.client.post(reverse('admin:cursos_courseprogress_changelist'), {
+            'action': 'export_csv', '_selected_action': selected,
+        })
+        self.assertEqual(len(self.read(response).splitlines()), 6)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'progresso.csv')
+            call_command('export_progress', output=output, chunk_size=3, stderr=io.StringIO())
+            with open(output) as f:
+                self.assertEqual(len(f.read().splitlines()), CourseProgress.objects.count() + 1)
+
+
+class ProgressAdminActionsTests(TestCase):
+    """Testes para as ações em lote do admin de progresso e certificados"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(self.admin)
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.lessons = [
+            Lesson.objects.create(name=f'Aula {i}', number=i, course=self.course) for i in range(4)
+        ]
+        self.progresses = []
+        for index, completed in enumerate([4, 2, 0]):
+            user = User.objects.create_user(f'aluno{index}', password='x')
+            enrollment = Enrollment.objects.create(user=user, course=self.course)
+            for lesson in self.lessons[:completed]:
+                LessonProgress.objects.create(user=user, lesson=lesson, completed=True)
+            # Contadores propositalmente desatualizados
+            self.progresses.append(CourseProgress.objects.create(
+                user=user, course=self.course, enrollment=enrollment
+            ))
+
+    def run_action(self, model, action, objects):
+        return self.client.post(reverse(f'admin:cursos_{model}_changelist'), {
+            'action': action, '_selected_action': [obj.pk for obj in objects],
+        })
+
+    def test_recalculate_and_issue_certificates(self):
+        """Testa o recálculo em lote e a emissão dos certificados pendentes"""
+        self.run_action('courseprogress', 'recalculate_progress', self.progresses)
+        values = list(CourseProgress.objects.order_by('user__username').values_list(
+            'completed_lessons', 'total_lessons', 'progress_percentage'
+        ))
+        self.assertEqual(values, [(4, 4, 100.0), (2, 4, 50.0), (0, 4, 0.0)])
+        self.assertIsNotNone(CourseProgress.objects.get(pk=self.progresses[0].pk).completed_at)
+
+        self.run_action('courseprogress', 'issue_certificates', self.progresses)
+        self.run_action('courseprogress', 'issue_certificates', self.progresses)
+        certificate = Certificate.objects.get()
+        self.assertEqual(certificate.course_progress_id, self.progresses[0].pk)
+        self.assertFalse(certificate.certificate_file)
+
+    def test_issue_certificates_counts_only_inserted_rows(self):
+        """Testa que um certificado emitido no meio da emissão em lote não é contado"""
+        ProgressManager.recalculate_progress(CourseProgress.objects.all())
+        CourseProgress.objects.filter(pk=self.progresses[1].pk).update(progress_percentage=100)
+        bulk_create = Certificate.objects.bulk_create
+
+        def concurrent_bulk_create(batch, **kwargs):
+            # Outra requisição emite o certificado do primeiro aluno antes do lote
+            progress = CourseProgress.objects.get(pk=self.progresses[0].pk)
+            CertificateManager.create_certificate(progress.user, self.course, progress)
+            return bulk_create(batch, **kwargs)
+
+        with mock.patch.object(Certificate.objects, 'bulk_create', concurrent_bulk_create):
+            created = CertificateManager.issue_certificates(CourseProgress.objects.all())
+        self.assertEqual(created, 1)
+        self.assertEqual(Certificate.objects.count(), 2)
+        self.assertEqual(
+            len(set(Certificate.objects.values_list('certificate_number', flat=True))), 2
+        )
+
+    def test_regenerate_certificates_on_next_download(self):
+        """Testa que o PDF apagado em lote é gerado de novo no download"""
+        progress = self.progresses[0]
+        ProgressManager.recalculate_progress(CourseProgress.objects.filter(pk=progress.pk))
+        CertificateManager.issue_certificates(CourseProgress.objects.all())
+        certificate = Certificate.objects.get()
+        CertificateManager.save_certificate_file(certificate)
+        old_name = certificate.certificate_file.name
+
+        self.run_action('certificate', 'regenerate_certificates', [certificate])
+        certificate.refresh_from_db()
+        self.assertFalse(certificate.certificate_file)
+        self.assertFalse(certificate.certificate_file.storage.exists(old_name))
+
+        self.client.force_login(progress.user)
+        response = self.client.get(reverse('cursos:download_certificate', args=['python']))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+
+class EnrollmentImporterTests(TestCase):
+    """Testes para a importação de matrículas em lote"""
+
+    def setUp(self):
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.other = Course.objects.create(name='Django', slug='django')
+        self.lessons = [
+            Lesson.objects.create(name=f'Aula {i}', number=i, course=self.course) for i in range(4)
+        ]
+        # Aluno já existente, com matrícula cancelada e uma aula concluída
+        self.existing = User.objects.create_user('existente', email='antigo@example.com')
+        Enrollment.objects.create(user=self.existing, course=self.course, status=2)
+        LessonProgress.objects.create(user=self.existing, lesson=self.lessons[0], completed=True)
+
+    def run_import(self, content, **kwargs):
+        return EnrollmentImporter(**kwargs).run(io.StringIO(content))
+
+    def test_import_with_errors_per_row(self):
+        """Testa o upsert, o progresso pré-calculado e os erros por linha"""
+        content = (
+            'username,email,curso\n'
+            'novo1,novo1@example.com,python\n'
+            'existente,novo@example.com,python\n'
+            ',sem@example.com,python\n'
+            'novo2,email-invalido,python\n'
+            'novo3,novo3@example.com,inexistente\n'
+            'novo1,novo1@example.com,python\n'
+            'novo1,novo1@example.com,django\n'
+        )
+        result = self.run_import(content, chunk_size=2)
+
+        self.assertEqual(result['rows'], 7)
+        self.assertEqual([line for line, message in result['errors']], [4, 5, 6, 7])
+        self.assertEqual(result['users_created'], 1)
+        self.assertEqual(result['users_updated'], 1)
+        self.assertEqual(result['enrollments_created'], 2)
+        self.assertEqual(result['enrollments_reactivated'], 1)
+        self.assertEqual(result['progress_created'], 3)
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.email, 'novo@example.com')
+        self.assertFalse(User.objects.get(username='novo1').has_usable_password())
+        progress = CourseProgress.objects.get(user=self.existing, course=self.course)
+        self.assertEqual(progress.enrollment.status, 1)
+        self.assertEqual((progress.completed_lessons, progress.total_lessons), (1, 4))
+        self.assertEqual(progress.progress_percentage, 25.0)
+        self.assertIsNotNone(progress.next_lesson_id)
+
+    def test_queries_do_not_grow_per_row(self):
+        """Testa que o bloco usa um punhado de queries, não algumas por linha"""
+        content = 'username,email\n' + ''.join(
+            f'aluno{i},aluno{i}@example.com\n' for i in range(200)
+        )
+        with CaptureQueriesContext(connection) as context:
+            result = self.run_import(content, course=self.course)
+        self.assertEqual(result['progress_created'], 200)
+        # Só os lotes de INSERT (limitados pelo banco) variam com o volume
+        self.assertLess(len(context), 20)
+        self.assertEqual(
+            CourseProgress.objects.filter(course=self.course, total_lessons=4).count(), 200
+        )
+
+    def test_staff_upload_view(self):
+        """Testa o envio do CSV pela view de staff"""
+        url = reverse('cursos:import_enrollments')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+        upload = SimpleUploadedFile(
+            'alunos.csv', 'username,email\nana,ana@example.com\n'.encode('utf-8-sig')
+        )
+        response = self.client.post(url, {'file': upload, 'course': self.other.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result']['enrollments_created'], 1)
+        self.assertTrue(Enrollment.objects.filter(user__username='ana', course=self.other).exists())
+
+    def test_malformed_csv_is_reported(self):
+        """Testa que um CSV que o módulo csv rejeita vira erro de importação"""
+        # Campo maior que o limite do módulo csv
+        content = b'username,email\nana,' + b'x' * (csv.field_size_limit() + 1) + b'\n'
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+        upload = SimpleUploadedFile('alunos.csv', content)
+        response = self.client.post(
+            reverse('cursos:import_enrollments'), {'file': upload, 'course': self.other.pk}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['result'])
+        self.assertIn('CSV inválido', response.context['form'].errors['file'][0])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'alunos.csv')
+            with open(path, 'wb') as f:
+                f.write(content)
+            with self.assertRaisesMessage(CommandError, 'CSV inválido'):
+                call_command('import_enrollments', path, curso=self.other.slug)
+
+
+class CatalogTests(TestCase):
+    """Testes para a importação/exportação do catálogo"""
+
+    def document(self, lessons=3, slug='python'):
+        return {
+            'slug': slug, 'name': 'Python', 'start_date': '2024-01-10',
+            'lessons': [
+                {
+                    'number': number, 'name': f'Aula {number}',
+                    'materials': [{'name': 'Vídeo', 'embedded': f'<iframe>{number}</iframe>'}],
+                }
+                for number in range(1, lessons + 1)
+            ],
+        }
+
+    def import_documents(self, documents, **kwargs):
+        return CatalogImporter(**kwargs).run(documents)
+
+    def test_idempotent_reimport(self):
+        """Testa que reimportar não duplica e só atualiza o que mudou"""
+        with CaptureQueriesContext(connection) as context:
+            result = self.import_documents([self.document(lessons=1500)])
+        self.assertEqual(result['lessons_created'], 1500)
+        self.assertEqual(result['materials_created'], 1500)
+        self.assertLess(len(context), 40)
+
+        result = self.import_documents([self.document(lessons=1500)])
+        self.assertEqual(sum(result.values()), 0)
+        self.assertEqual(Lesson.objects.count(), 1500)
+        self.assertEqual(Material.objects.count(), 1500)
+
+        document = self.document(lessons=2)
+        document['lessons'][0]['name'] = 'Introdução'
+        result = self.import_documents([document], prune=True)
+        self.assertEqual(result['lessons_updated'], 1)
+        self.assertEqual(result['lessons_deleted'], 1498)
+        self.assertEqual(
+            list(Lesson.objects.values_list('number', 'name')), [(1, 'Introdução'), (2, 'Aula 2')]
+        )
+
+    def test_invalid_document_rolls_back(self):
+        """Testa que um documento inválido não grava nada"""
+        bad = self.document(slug='django')
+        bad['lessons'].append({'number': 1, 'name': 'Repetida'})
+        with self.assertRaises(CatalogError):
+            self.import_documents([self.document(), bad], chunk_size=1)
+        self.assertFalse(Course.objects.exists())
+
+    def test_malformed_lessons_and_materials(self):
+        """Testa que aulas e materiais que não são objetos viram CatalogError"""
+        lesson = {'number': 1, 'name': 'Aula'}
+        for lessons in ([1], ['Aula 1'], lesson, [dict(lesson, materials=['Vídeo'])],
+                        [dict(lesson, materials='Vídeo')]):
+            document = dict(self.document(), lessons=lessons)
+            with self.subTest(lessons=lessons), self.assertRaises(CatalogError):
+                self.import_documents([document])
+        self.assertFalse(Course.objects.exists())
+
+    def test_streaming_export_round_trip(self):
+        """Testa a exportação em streaming e a reimportação do resultado"""
+        self.import_documents([self.document(), self.document(slug='django')])
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse('cursos:export_catalog'), {'formato': 'ndjson'})
+        content = b''.join(response.streaming_content).decode()
+        documents = list(read_documents(io.StringIO(content), 'ndjson'))
+        self.assertEqual([d['slug'] for d in documents], ['python', 'django'])
+        self.assertEqual(documents[0]['lessons'][2]['materials'][0]['embedded'], '<iframe>3</iframe>')
+        self.assertEqual(sum(self.import_documents(documents).values()), 0)
+
+        response = self.client.get(
+            reverse('cursos:export_catalog'), {'formato': 'json', 'curso': 'django'}
+        )
+        exported = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([d['slug'] for d in exported], ['django'])
+
+
+class LessonReorderTests(TestCase):
+    """Testes para a reordenação de aulas e o cache da listagem"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.lessons = [
+            Lesson.objects.create(name=f'Aula {i}', number=i, course=self.course)
+            for i in range(1, 6)
+        ]
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+
+    def listing(self):
+        course = Course.objects.get(pk=self.course.pk)
+        return [lesson.pk for lesson in get_course_lessons(course)]
+
+    def test_reorder_single_update_and_invalidation(self):
+        """Testa a nova ordem aplicada em lote e a listagem invalidada uma vez"""
+        self.assertEqual(self.listing(), [lesson.pk for lesson in self.lessons])
+        course = Course.objects.get(pk=self.course.pk)
+        with self.assertNumQueries(0):
+            get_course_lessons(course)
+
+        order = [lesson.pk for lesson in reversed(self.lessons)]
+        self.client.force_login(self.staff)
+        url = reverse('cursos:reorder_lessons', args=['python'])
+        # sessão, usuário, curso, SAVEPOINT, SELECT FOR UPDATE, UPDATE em lote,
+        # invalidação, ponteiros de próxima aula, RELEASE e a ordem final
+        with self.assertNumQueries(10):
+            response = self.client.post(
+                url, json.dumps({'order': order}), content_type='application/json'
+            )
+        self.assertEqual(response.json()['updated'], 4)
+        self.assertEqual(response.json()['order'], order)
+        self.assertEqual(self.listing(), order)
+
+    def test_rejects_incomplete_order(self):
+        """Testa que a ordem precisa conter todas as aulas, sem repetição"""
+        self.client.force_login(self.staff)
+        url = reverse('cursos:reorder_lessons', args=['python'])
+        ids = [str(lesson.pk) for lesson in self.lessons]
+        for order in (ids[:-1], ids + ids[:1], ['x']):
+            response = self.client.post(url, {'order': ','.join(order)})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            list(Lesson.objects.values_list('number', flat=True)), [1, 2, 3, 4, 5]
+        )
+
+        student = User.objects.create_user('aluno', password='x')
+        self.client.force_login(student)
+        self.assertEqual(self.client.post(url, {'order': ','.join(ids)}).status_code, 302)
+
+    def test_admin_save_invalidates_listing(self):
+        """Testa que salvar uma aula (ex.: pelo admin) invalida a listagem"""
+        self.listing()
+        lesson = self.lessons[0]
+        lesson.number = 10
+        lesson.save()
+        self.assertEqual(self.listing()[-1], lesson.pk)
+
+
+class AnnouncementDigestTests(TestCase):
+    """Testes do resumo periódico de anúncios"""
+
+    def setUp(self):
+        self.python = Course.objects.create(name='Python', slug='python')
+        self.django = Course.objects.create(name='Django', slug='django')
+        self.digest_user = User.objects.create_user('resumo', 'resumo@example.com', 'x')
+        self.immediate_user = User.objects.create_user('imediato', 'imediato@example.com', 'x')
+        for user in (self.digest_user, self.immediate_user):
+            for course in (self.python, self.django):
+                Enrollment.objects.create(user=user, course=course, status=1)
+        self.preference = NotificationPreference.objects.create(
+            user=self.digest_user, announcement_delivery=NotificationPreference.DIGEST,
+            last_digest_at=timezone.now() - timedelta(days=2),
+        )
+
+    def announce(self, course, title):
+        return Announcement.objects.create(course=course, title=title, content='Conteúdo')
+
+    def test_digest_groups_announcements_across_courses(self):
+        self.announce(self.python, 'Aula nova de Python')
+        self.announce(self.django, 'Aula nova de Django')
+        self.announce(self.django, 'Prova de Django')
+
+        # O envio imediato ignora quem prefere o resumo
+        immediate = OutboundMessage.objects.all()
+        self.assertEqual(immediate.count(), 3)
+        self.assertTrue(all(m.recipients == ['imediato@example.com'] for m in immediate))
+        immediate.delete()
+
+        self.assertEqual(send_announcement_digests(), (1, 1))
+        message = OutboundMessage.objects.get()
+        self.assertEqual(message.recipients, ['resumo@example.com'])
+        self.assertIn('3 novos anúncios', message.subject)
+        for title in ('Aula nova de Python', 'Aula nova de Django', 'Prova de Django'):
+            self.assertIn(title, message.body_html)
+
+        # Mesmo período: nada a enviar de novo
+        self.assertEqual(send_announcement_digests(), (0, 0))
+
+    def test_digest_uses_constant_queries_per_chunk(self):
+        past = timezone.now() - timedelta(days=2)
+        for i in range(10):
+            user = User.objects.create_user('aluno%d' % i, 'aluno%d@example.com' % i, 'x')
+            Enrollment.objects.create(user=user, course=self.python, status=1)
+            NotificationPreference.objects.create(
+                user=user, announcement_delivery=NotificationPreference.DIGEST, last_digest_at=past
+            )
+        self.announce(self.python, 'Aviso')
+
+        # preferências, matrículas, anúncios, savepoint (2), INSERT na fila,
+        # UPDATE do cursor e busca vazia do próximo bloco
+        with self.assertNumQueries(8):
+            self.assertEqual(send_announcement_digests(chunk_size=100), (11, 11))
+
+    def test_preference_view_switches_to_digest(self):
+        self.client.force_login(self.immediate_user)
+        response = self.client.post('/conta/notificacoes/', {'announcement_delivery': 'digest'})
+        self.assertEqual(response.status_code, 200)
+        preference = NotificationPreference.objects.get(user=self.immediate_user)
+        self.assertEqual(preference.announcement_delivery, NotificationPreference.DIGEST)
+        # Anúncios anteriores à troca já foram enviados individualmente
+        self.assertGreater(preference.last_digest_at, self.preference.last_digest_at)
+
+
+class AnnouncementCommentsTests(TestCase):
+    """Testes da paginação por chave e do contador de comentários"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('aluno', 'aluno@example.com', 'x')
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.announcement = Announcement.objects.create(
+            course=self.course, title='Aviso', content='Conteúdo'
+        )
+
+    def comment(self, text):
+        return Comment.objects.create(announcement=self.announcement, user=self.user, comment=text)
+
+    def test_comment_count_follows_creates_and_deletes(self):
+        comments = [self.comment('c%d' % i) for i in range(3)]
+        self.announcement.refresh_from_db()
+        self.assertEqual(self.announcement.comment_count, 3)
+
+        comments[0].delete()
+        self.announcement.refresh_from_db()
+        self.assertEqual(self.announcement.comment_count, 2)
+
+    def test_keyset_pages_cover_all_comments_once(self):
+        for i in range(7):
+            self.comment('c%d' % i)
+        # Mesma data em vários comentários: o id desempata
+        Comment.objects.filter(comment__in=['c2', 'c3', 'c4']).update(
+            created_at=Comment.objects.get(comment='c2').created_at
+        )
+
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = comments_page(self.announcement, cursor, per_page=3)
+            seen.extend(comment.comment for comment in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['c%d' % i for i in range(7)])
+
+        # Cursor inválido volta para a primeira página
+        page, cursor = comments_page(self.announcement, 'inválido', per_page=3)
+        self.assertEqual([c.comment for c in page], ['c0', 'c1', 'c2'])
+
+    def test_show_announcement_links_next_page(self):
+        for i in range(COMMENTS_PER_PAGE + 1):
+            self.comment('c%d' % i)
+        url = '/cursos/%s/anuncios/%d/' % (self.course.slug, self.announcement.pk)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['comments']), COMMENTS_PER_PAGE)
+        response = self.client.get(url, {'depois': response.context['next_cursor']})
+        self.assertEqual([c.comment for c in response.context['comments']], ['c%d' % COMMENTS_PER_PAGE])
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class AnnouncementFeedTests(TestCase):
+    """Testes do feed JSON de anúncios com GET condicional"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('aluno', 'aluno@example.com', 'x')
+        self.python = Course.objects.create(name='Python', slug='python')
+        self.django = Course.objects.create(name='Django', slug='django')
+        self.other = Course.objects.create(name='Go', slug='go')
+        Enrollment.objects.create(user=self.user, course=self.python, status=1)
+        Enrollment.objects.create(user=self.user, course=self.django, status=1)
+        Enrollment.objects.create(user=self.user, course=self.other, status=0)
+        for course in (self.python, self.django, self.other):
+            Announcement.objects.create(course=course, title='Aviso %s' % course.slug, content='x')
+        self.client.force_login(self.user)
+
+    def test_feed_lists_approved_courses_with_cursor(self):
+        response = self.client.get('/cursos/anuncios/feed/', {'limit': 1})
+        data = response.json()
+        self.assertEqual([a['course'] for a in data['announcements']], ['python'])
+        self.assertTrue(data['has_more'])
+
+        data = self.client.get('/cursos/anuncios/feed/', {'since': data['cursor']}).json()
+        self.assertEqual([a['course'] for a in data['announcements']], ['django'])
+        self.assertFalse(data['has_more'])
+
+        # Nada novo: o cursor se mantém; um anúncio editado volta a aparecer
+        cursor = data['cursor']
+        data = self.client.get('/cursos/anuncios/feed/', {'since': cursor}).json()
+        self.assertEqual((data['announcements'], data['cursor']), ([], cursor))
+        announcement = Announcement.objects.get(course=self.python)
+        announcement.title = 'Aviso editado'
+        announcement.save()
+        data = self.client.get('/cursos/anuncios/feed/', {'since': cursor}).json()
+        self.assertEqual([a['title'] for a in data['announcements']], ['Aviso editado'])
+
+    def test_new_enrollment_resets_the_cursor(self):
+        data = self.client.get('/cursos/anuncios/feed/').json()
+        self.assertEqual(len(data['announcements']), 2)
+        self.assertFalse(data['reset'])
+        cursor = data['cursor']
+        etag = self.client.get('/cursos/anuncios/feed/', {'since': cursor})['ETag']
+
+        # O anúncio do curso Go é mais antigo que o cursor, mas o aluno acaba de entrar no curso
+        enrollment = Enrollment.objects.get(user=self.user, course=self.other)
+        enrollment.active()
+        response = self.client.get(
+            '/cursos/anuncios/feed/', {'since': cursor}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['reset'])
+        self.assertEqual(
+            sorted(a['course'] for a in data['announcements']), ['django', 'go', 'python']
+        )
+
+        # A partir do novo cursor o feed volta a ser incremental
+        data = self.client.get('/cursos/anuncios/feed/', {'since': data['cursor']}).json()
+        self.assertEqual((data['announcements'], data['reset']), ([], False))
+
+    def test_enrollments_of_other_users_do_not_reset_the_cursor(self):
+        cursor = self.client.get('/cursos/anuncios/feed/').json()['cursor']
+        other = User.objects.create_user('outro', 'outro@example.com', 'x')
+        Enrollment.objects.create(user=other, course=self.python, status=1)
+        data = self.client.get('/cursos/anuncios/feed/', {'since': cursor}).json()
+        self.assertEqual((data['announcements'], data['reset']), ([], False))
+
+    def test_unchanged_feed_returns_304(self):
+        response = self.client.get('/cursos/anuncios/feed/')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        etag = response['ETag']
+
+        # Sessão, usuário e a agregação do estado do feed
+        with self.assertNumQueries(3):
+            response = self.client.get('/cursos/anuncios/feed/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            '/cursos/anuncios/feed/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+        Announcement.objects.create(course=self.django, title='Novo', content='x')
+        response = self.client.get('/cursos/anuncios/feed/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['announcements']), 3)
+
+
+class ConditionalProgressTests(TestCase):
+    """Testes do GET condicional no progresso e nos certificados"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('aluno', 'aluno@example.com', 'x')
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.lessons = [
+            Lesson.objects.create(name=f'Aula {i}', number=i, course=self.course) for i in range(2)
+        ]
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course, status=1)
+        ProgressManager.initialize_course_progress(self.user, enrollment)
+        self.client.force_login(self.user)
+
+    def revalidate(self, url, etag, queries):
+        with self.assertNumQueries(queries):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_progress_returns_304_until_it_changes(self):
+        url = '/cursos/python/progresso/'
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        etag = response['ETag']
+
+        # Sessão, usuário e a leitura do progresso gravado
+        self.assertEqual(self.revalidate(url, etag, 3).status_code, 304)
+
+        ProgressManager.mark_lesson_complete(self.user, self.lessons[0])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['course_progress']['completed_lessons'], 1)
+        etag = response['ETag']
+
+        # Uma aula nova muda o total mesmo sem o progresso ter sido regravado
+        Lesson.objects.create(name='Aula nova', number=3, course=self.course)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['course_progress']['total_lessons'], 3)
+
+    def test_certificate_download_and_list_revalidate(self):
+        for lesson in self.lessons:
+            ProgressManager.mark_lesson_complete(self.user, lesson)
+        CertificateManager.check_and_generate_certificate(self.user, self.course)
+
+        url = '/cursos/python/certificado/download/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        self.assertEqual(self.revalidate(url, response['ETag'], 3).status_code, 304)
+
+        url = '/cursos/meus-certificados/'
+        response = self.client.get(url)
+        self.assertContains(response, 'Python')
+        self.assertEqual(self.revalidate(url, response['ETag'], 3).status_code, 304)
+
+        Certificate.objects.update(certificate_file='')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class ProgressEventsTests(TestCase):
+    """Testes do pub/sub de progresso e do stream SSE"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('aluno', 'aluno@example.com', 'x')
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.lessons = [
+            Lesson.objects.create(name=f'Aula {i}', number=i, course=self.course) for i in range(2)
+        ]
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course, status=1)
+        ProgressManager.initialize_course_progress(self.user, enrollment)
+
+    def test_progress_manager_publishes_after_commit(self):
+        before = broker.subscriber_count()
+        with self.captureOnCommitCallbacks() as callbacks:
+            ProgressManager.mark_lesson_complete(self.user, self.lessons[0])
+
+        async def receive():
+            subscription = broker.subscribe(self.user.pk)
+            try:
+                # Nada é publicado antes do COMMIT
+                self.assertTrue(subscription.queue.empty())
+                for callback in callbacks:
+                    callback()
+                return await asyncio.wait_for(subscription.queue.get(), 1)
+            finally:
+                broker.unsubscribe(subscription)
+
+        event = asyncio.run(receive())
+        self.assertEqual(event.name, 'progress')
+        self.assertEqual(event.data['course'], 'python')
+        self.assertEqual(event.data['completed_lessons'], 1)
+        self.assertEqual(broker.subscriber_count(), before)
+
+    def test_stream_requires_login(self):
+        response = async_to_sync(self.async_client.get)('/cursos/progresso/eventos/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_is_not_served_under_wsgi(self):
+        self.client.force_login(self.user)
+        before = broker.subscriber_count()
+        response = self.client.get('/cursos/progresso/eventos/')
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(broker.subscriber_count(), before)
+
+    async def test_stream_sends_state_then_published_events(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get('/cursos/progresso/eventos/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        try:
+            self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+            initial = (await anext(stream)).decode()
+            self.assertIn('event: progress', initial)
+            self.assertIn('"completed_lessons": 0', initial)
+
+            self.assertEqual(broker.publish(self.user.pk, 'certificate', {'course': 'python'}), 1)
+            event = (await anext(stream)).decode()
+            self.assertIn('event: certificate', event)
+            self.assertIn('"course": "python"', event)
+        finally:
+            await stream.aclose()
+
+    async def test_stream_sends_keepalive_and_ends_at_timeout(self):
+        before = broker.subscriber_count()
+        chunks = [chunk async for chunk in event_stream(self.user.pk, heartbeat=0.01, timeout=0.05)]
+        self.assertTrue(chunks[0].startswith('retry:'))
+        self.assertIn(': keepalive\n\n', chunks)
+        self.assertEqual(broker.subscriber_count(), before)
+
+
+class AsyncProgressViewsTests(TestCase):
+    """Testes das versões assíncronas das views de progresso"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.factory = AsyncRequestFactory()
+        self.user = User.objects.create_user('aluno', 'aluno@example.com', 'x')
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.lessons = [
+            Lesson.objects.create(name=f'Aula {i}', number=i, course=self.course) for i in range(2)
+        ]
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course, status=1)
+        ProgressManager.initialize_course_progress(self.user, enrollment)
+
+    def request(self, method, path, user=None, **extra):
+        request = getattr(self.factory, method)(path, **extra)
+        request.user = user or AnonymousUser()
+        return request
+
+    async def test_complete_lessons_and_issue_certificate(self):
+        response = await views.amark_lesson_complete(
+            self.request('post', '/', self.user), 'python', self.lessons[0].pk
+        )
+        data = json.loads(response.content)
+        self.assertTrue(data['lesson_progress']['completed'])
+        self.assertEqual(data['course_progress']['completed_lessons'], 1)
+        self.assertIsNone(data['certificate'])
+
+        response = await views.amark_lesson_complete(
+            self.request('post', '/', self.user), 'python', self.lessons[1].pk
+        )
+        data = json.loads(response.content)
+        self.assertTrue(data['course_progress']['completed'])
+        self.assertTrue(data['certificate']['generated'])
+        certificate = await Certificate.objects.aget(user=self.user, course=self.course)
+        self.assertTrue(certificate.certificate_file.name.endswith('.pdf'))
+
+        response = await views.amark_lesson_incomplete(
+            self.request('post', '/', self.user), 'python', self.lessons[1].pk
+        )
+        data = json.loads(response.content)
+        self.assertFalse(data['lesson_progress']['completed'])
+        self.assertEqual(data['course_progress']['completed_lessons'], 1)
+
+    async def test_course_progress_revalidates(self):
+        response = await views.aget_course_progress(self.request('get', '/', self.user), 'python')
+        self.assertEqual(response.status_code, 200)
+        response = await views.aget_course_progress(
+            self.request('get', '/', self.user, headers={'If-None-Match': response['ETag']}), 'python'
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_rejects_wrong_method_anonymous_and_not_enrolled(self):
+        other = await sync_to_async(User.objects.create_user)('visitante', password='x')
+        lesson_id = self.lessons[0].pk
+        response = await views.amark_lesson_complete(self.request('get', '/', self.user), 'python', lesson_id)
+        self.assertEqual(response.status_code, 405)
+        response = await views.amark_lesson_complete(self.request('post', '/'), 'python', lesson_id)
+        self.assertEqual(response.status_code, 302)
+        response = await views.amark_lesson_complete(self.request('post', '/', other), 'python', lesson_id)
+        self.assertEqual(response.status_code, 403)
+
+
+class ProgressSummaryTests(TestCase):
+    """Testes do resumo de progresso de todos os cursos do aluno"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('aluno', 'aluno@example.com', 'x')
+        self.courses = []
+        for slug in ('python', 'django', 'go'):
+            course = Course.objects.create(name=slug.title(), slug=slug)
+            for number in (1, 2):
+                Lesson.objects.create(name=f'{slug} {number}', number=number, course=course)
+            enrollment = Enrollment.objects.create(
+                user=self.user, course=course, status=0 if slug == 'go' else 1
+            )
+            ProgressManager.initialize_course_progress(self.user, enrollment)
+            self.courses.append(course)
+        self.client.force_login(self.user)
+
+    def test_summary_of_approved_courses(self):
+        python, django, _ = self.courses
+        first = python.lessons.get(number=1)
+        LessonProgress.objects.create(user=self.user, lesson=first, completed=True)
+        for lesson in django.lessons.all():
+            LessonProgress.objects.create(user=self.user, lesson=lesson, completed=True)
+        ProgressManager.update_course_progress(self.user, python)
+        progress = ProgressManager.update_course_progress(self.user, django)
+        Certificate.objects.create(
+            user=self.user, course=django, course_progress=progress, certificate_number='ABC'
+        )
+
+        # Sessão, usuário e matrículas
+        with self.assertNumQueries(3):
+            response = self.client.get('/cursos/progresso/resumo/')
+        self.assertNotIn(b': ', response.content)
+        python_data, django_data = response.json()['courses']
+
+        self.assertEqual(python_data['progress'], {'completed': 1, 'total': 2, 'percentage': 50.0, 'done': False})
+        self.assertIsNone(python_data['certificate'])
+        self.assertEqual(python_data['next_lesson']['number'], 2)
+        self.assertEqual(
+            python_data['next_lesson']['url'], '/cursos/python/aulas/%d/' % python.lessons.get(number=2).pk
+        )
+        self.assertTrue(django_data['progress']['done'])
+        self.assertEqual(django_data['certificate']['number'], 'ABC')
+        self.assertIsNone(django_data['next_lesson'])
+
+    def test_field_selection(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/cursos/progresso/resumo/', {'fields': 'progress'})
+        self.assertEqual(
+            [sorted(item) for item in response.json()['courses']], [['course', 'progress']] * 2
+        )
+
+        response = self.client.get('/cursos/progresso/resumo/', {'fields': 'progress,senha'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ResumePointerTests(TestCase):
+    """Testes do ponteiro de "continuar de onde parei" em CourseProgress"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('aluno', 'aluno@example.com', 'x')
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.lessons = [
+            Lesson.objects.create(name=f'Aula {number}', number=number, course=self.course)
+            for number in (1, 2, 3)
+        ]
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course, status=1)
+        self.progress = ProgressManager.initialize_course_progress(self.user, enrollment)
+
+    def pointers(self):
+        self.progress.refresh_from_db()
+        return self.progress.last_lesson_id, self.progress.next_lesson_id
+
+    def test_transitions_move_the_pointers(self):
+        first, second, third = self.lessons
+        self.assertEqual(self.pointers(), (None, first.pk))
+
+        ProgressManager.mark_lesson_complete(self.user, second)
+        self.assertEqual(self.pointers(), (second.pk, first.pk))
+        ProgressManager.mark_lesson_complete(self.user, first)
+        self.assertEqual(self.pointers(), (first.pk, third.pk))
+        ProgressManager.mark_lesson_complete(self.user, third)
+        self.assertEqual(self.pointers(), (third.pk, None))
+        ProgressManager.mark_lesson_incomplete(self.user, second)
+        self.assertEqual(self.pointers(), (second.pk, second.pk))
+
+    def test_lesson_changes_refresh_the_next_lesson(self):
+        first, second, third = self.lessons
+        ProgressManager.mark_lesson_complete(self.user, first)
+        self.assertEqual(self.pointers(), (first.pk, second.pk))
+
+        reorder_lessons(self.course, [first.pk, third.pk, second.pk])
+        self.assertEqual(self.pointers(), (first.pk, third.pk))
+        third.delete()
+        self.assertEqual(self.pointers(), (first.pk, second.pk))
+        intro = Lesson.objects.create(name='Introdução', number=0, course=self.course)
+        self.assertEqual(self.pointers(), (first.pk, intro.pk))
+
+    def test_pointers_in_api_and_lessons_page(self):
+        self.client.force_login(self.user)
+        ProgressManager.mark_lesson_complete(self.user, self.lessons[0])
+
+        data = self.client.get('/cursos/python/progresso/').json()['course_progress']
+        self.assertEqual(data['last_lesson_id'], self.lessons[0].pk)
+        self.assertEqual(data['next_lesson_id'], self.lessons[1].pk)
+        response = self.client.get('/cursos/python/aulas/')
+        self.assertContains(response, 'Continuar de onde parei: Aula 2')
+
+
+class LessonActivityTests(TestCase):
+    """Testes dos heartbeats de tempo de estudo e das tabelas de rollup"""
+
+    def setUp(self):
+        settings_override = override_settings(LESSON_ACTIVITY={'FLUSH_INTERVAL': 3600})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(activity.buffer.clear)
+
+        self.user = User.objects.create_user('aluno', 'aluno@example.com', 'x')
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.lesson = Lesson.objects.create(name='Aula 1', number=1, course=self.course)
+        Enrollment.objects.create(user=self.user, course=self.course, status=1)
+        other = Course.objects.create(name='Go', slug='go')
+        self.other_lesson = Lesson.objects.create(name='Aula Go', number=1, course=other)
+        self.client.force_login(self.user)
+        self.minute = int(timezone.now().timestamp()) // 60 * 60
+
+    def post(self, heartbeats):
+        return self.client.post(
+            '/cursos/atividade/', json.dumps({'heartbeats': heartbeats}), content_type='application/json'
+        )
+
+    def test_heartbeats_are_summed_in_memory_and_flushed_in_bulk(self):
+        # Sessão, usuário e a validação das aulas; nada é gravado por heartbeat
+        with self.assertNumQueries(3):
+            response = self.post([
+                {'lesson': self.lesson.pk, 'at': self.minute},
+                {'lesson': self.lesson.pk, 'at': self.minute + 15, 'seconds': 30},
+                {'lesson': self.other_lesson.pk, 'at': self.minute},
+                {'lesson': self.lesson.pk, 'at': self.minute - 86400},
+            ])
+        self.assertEqual((response.status_code, response.json()), (202, {'accepted': 2}))
+        self.assertFalse(LessonActivity.objects.exists())
+
+        self.assertEqual(activity.buffer.flush(), 1)
+        self.post([{'lesson': self.lesson.pk, 'at': self.minute + 45}] * 3)
+        activity.buffer.flush()
+
+        row = LessonActivity.objects.get()
+        self.assertEqual((row.user, row.lesson, row.minute.timestamp()), (self.user, self.lesson, self.minute))
+        # 45s da primeira gravação + 45s da segunda, somados pelo ON CONFLICT
+        # até o teto de 60s do minuto
+        self.assertEqual(row.seconds, 60)
+        daily = CourseDailyActivity.objects.get()
+        self.assertEqual((daily.course, daily.seconds, daily.heartbeats), (self.course, 90, 5))
+
+    def test_buffer_caps_a_minute_and_flushes_on_interval(self):
+        clock = [0.0]
+        buffer = activity.ActivityBuffer(clock=lambda: clock[0])
+        beats = activity.parse_heartbeats({'heartbeats': [{'lesson': self.lesson.pk, 'at': self.minute}] * 6})
+        self.assertEqual(buffer.add(self.user.pk, beats, {self.lesson.pk: self.course.pk}), 6)
+        self.assertEqual(buffer.maybe_flush(), 0)
+        clock[0] = 3600
+        self.assertEqual(buffer.maybe_flush(), 1)
+        self.assertEqual(LessonActivity.objects.get().seconds, 60)
+
+    def test_invalid_batches(self):
+        self.assertEqual(self.client.get('/cursos/atividade/').status_code, 405)
+        response = self.client.post('/cursos/atividade/', 'x', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post([{'at': self.minute}]).status_code, 400)
+        self.assertEqual(self.post([{'lesson': self.lesson.pk}] * 201).status_code, 400)
+
+
+class CourseStatsTests(TestCase):
+    """Testes das estatísticas do curso mantidas incrementalmente"""
+
+    def setUp(self):
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.lessons = [
+            Lesson.objects.create(name=f'Aula {number}', number=number, course=self.course)
+            for number in (1, 2)
+        ]
+        self.users = [
+            User.objects.create_user(f'aluno{i}', f'aluno{i}@example.com', 'x') for i in range(3)
+        ]
+        self.enrollments = [
+            Enrollment.objects.create(user=user, course=self.course, status=1) for user in self.users
+        ]
+        for enrollment in self.enrollments:
+            ProgressManager.initialize_course_progress(enrollment.user, enrollment)
+
+    def snapshot(self):
+        course_stats = CourseStats.objects.get(course=self.course)
+        return (
+            (course_stats.enrolled_count, course_stats.completed_count, course_stats.certificate_count),
+            sorted(LessonStats.objects.values_list('lesson_id', 'completed_count')),
+            sorted(CourseHistogram.objects.filter(metric=CourseHistogram.COMPLETION_TIME).values_list(
+                'metric', 'bucket', 'total'
+            )),
+        )
+
+    def test_incremental_counters_match_rebuild(self):
+        first, second = self.lessons
+        for user in self.users[:2]:
+            ProgressManager.mark_lesson_complete(user, first)
+        ProgressManager.mark_lesson_complete(self.users[0], second)
+        # Emissão em lote (bulk_create): contada sem o sinal de Certificate
+        CertificateManager.issue_certificates(CourseProgress.objects.filter(course=self.course))
+        ProgressManager.mark_lesson_complete(self.users[2], second)
+        ProgressManager.mark_lesson_incomplete(self.users[2], second)
+        self.enrollments[1].status = 2
+        self.enrollments[1].save()
+        self.enrollments[2].delete()
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental[0], (1, 1, 1))
+        self.assertEqual(incremental[1], [(first.pk, 2), (second.pk, 1)])
+        self.assertEqual(incremental[2], [('completion_time', 0, 1)])
+        self.assertEqual(stats.rebuild([self.course.pk]), 1)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_bulk_certificates_count_only_inserted_rows(self):
+        for user in self.users[:2]:
+            for lesson in self.lessons:
+                ProgressManager.mark_lesson_complete(user, lesson)
+        bulk_create = Certificate.objects.bulk_create
+
+        def concurrent_bulk_create(batch, **kwargs):
+            # Certificado emitido por outra requisição entre a leitura e o lote
+            progress = CourseProgress.objects.get(user=self.users[0], course=self.course)
+            CertificateManager.create_certificate(progress.user, self.course, progress)
+            return bulk_create(batch, **kwargs)
+
+        with mock.patch.object(Certificate.objects, 'bulk_create', concurrent_bulk_create):
+            CertificateManager.issue_certificates(CourseProgress.objects.filter(course=self.course))
+        self.assertEqual(CourseStats.objects.get(course=self.course).certificate_count, 2)
+        incremental = self.snapshot()
+        stats.rebuild([self.course.pk])
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_deleted_completion_is_discounted(self):
+        for user in self.users[:2]:
+            for lesson in self.lessons:
+                ProgressManager.mark_lesson_complete(user, lesson)
+        self.enrollments[0].delete()
+        CourseProgress.objects.get(user=self.users[1], course=self.course).delete()
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental[0][1], 0)
+        self.assertEqual(incremental[2], [])
+        stats.rebuild([self.course.pk])
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_concurrent_transitions_are_counted_once(self):
+        user = self.users[0]
+        first, second = self.lessons
+        ProgressManager.mark_lesson_complete(user, first)
+        stale_lesson = LessonProgress.objects.create(user=user, lesson=second)
+        stale_course = CourseProgress.objects.get(user=user, course=self.course)
+        ProgressManager.mark_lesson_complete(user, second)
+
+        # Segunda requisição que leu a aula e o curso antes da primeira gravar
+        with mock.patch.object(LessonProgress.objects, 'get_or_create', return_value=(stale_lesson, False)), \
+                mock.patch.object(CourseProgress.objects, 'get', return_value=stale_course):
+            ProgressManager.mark_lesson_complete(user, second)
+
+        self.assertEqual(LessonStats.objects.get(lesson=second).completed_count, 1)
+        self.assertEqual(CourseStats.objects.get(course=self.course).completed_count, 1)
+        self.assertEqual(stale_course.progress_percentage, 100)
+        self.assertIsNotNone(stale_course.completed_at)
+
+    def test_counters_never_go_negative(self):
+        stats.record_certificates({self.course.pk: -1})
+        self.assertEqual(CourseStats.objects.get(course=self.course).certificate_count, 0)
+        self.enrollments[0].status = 1
+        self.enrollments[0].save()
+        self.assertEqual(CourseStats.objects.get(course=self.course).enrolled_count, 3)
+
+    def test_analytics_page_is_staff_only(self):
+        for lesson in self.lessons:
+            ProgressManager.mark_lesson_complete(self.users[0], lesson)
+        ProgressManager.mark_lesson_complete(self.users[1], self.lessons[0])
+
+        self.client.force_login(self.users[0])
+        response = self.client.get('/cursos/python/estatisticas/')
+        self.assertEqual(response.status_code, 302)
+
+        staff = User.objects.create_user('staff', 'staff@example.com', 'x', is_staff=True)
+        self.client.force_login(staff)
+        # Sessão, usuário, curso, as três tabelas de estatísticas e o menu do painel
+        with self.assertNumQueries(7):
+            response = self.client.get('/cursos/python/estatisticas/')
+        funnel = response.context['analytics']['funnel']
+        self.assertEqual([step['completed'] for step in funnel], [2, 1])
+        self.assertEqual(round(funnel[1]['drop_off']), 50)
+        self.assertEqual(response.context['analytics']['median_completion'], 'até 1 hora')
+        self.assertContains(response, 'Concluíram: 1')
+
+
+class CourseRankingTests(TestCase):
+    """Testes do percentil de progresso e do ranking em cache"""
+
+    def setUp(self):
+        settings_override = override_settings(COURSE_RANKING={'LEADERBOARD_SIZE': 2})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+        self.course = Course.objects.create(name='Python', slug='python')
+        self.lessons = [
+            Lesson.objects.create(name=f'Aula {number}', number=number, course=self.course)
+            for number in range(1, 5)
+        ]
+        self.users = []
+        for i in range(4):
+            user = User.objects.create_user(f'aluno{i}', f'aluno{i}@example.com', 'x')
+            enrollment = Enrollment.objects.create(user=user, course=self.course, status=1)
+            ProgressManager.initialize_course_progress(user, enrollment)
+            for lesson in self.lessons[:i]:
+                ProgressManager.mark_lesson_complete(user, lesson)
+            self.users.append(user)
+
+    def histogram(self):
+        return sorted(CourseHistogram.objects.filter(
+            metric=CourseHistogram.PROGRESS, total__gt=0
+        ).values_list('bucket', 'total'))
+
+    def test_histogram_is_incremental_and_matches_rebuild(self):
+        # 0%, 25%, 50% e 75%
+        self.assertEqual(self.histogram(), [(0, 1), (5, 1), (10, 1), (15, 1)])
+        ProgressManager.mark_lesson_incomplete(self.users[3], self.lessons[0])
+        Enrollment.objects.get(user=self.users[0]).delete()
+        incremental = self.histogram()
+        self.assertEqual(incremental, [(5, 1), (10, 2)])
+        ranking.rebuild([self.course.pk])
+        self.assertEqual(self.histogram(), incremental)
+
+    def test_percentile_reads_only_the_histogram(self):
+        progress = CourseProgress.objects.get(user=self.users[2])
+        with self.assertNumQueries(1):
+            self.assertEqual(ranking.percentile(progress), 67)
+        self.assertEqual(ranking.percentile(CourseProgress.objects.get(user=self.users[0])), 0)
+
+        self.client.force_login(self.users[3])
+        response = self.client.get('/cursos/python/')
+        self.assertContains(response, 'Você está à frente de 100% dos alunos')
+
+    def test_leaderboard_is_cached_and_invalidated_by_relevant_changes(self):
+        with self.assertNumQueries(1):
+            top = ranking.leaderboard(self.course)
+        self.assertEqual([entry['user__username'] for entry in top], ['aluno3', 'aluno2'])
+        # Abaixo do último da lista: o cache continua valendo
+        ProgressManager.mark_lesson_complete(self.users[0], self.lessons[0])
+        with self.assertNumQueries(0):
+            ranking.leaderboard(self.course)
+        # Alcançou a lista: o ranking é refeito, mas só depois do COMMIT
+        with self.captureOnCommitCallbacks() as callbacks:
+            for lesson in self.lessons:
+                ProgressManager.mark_lesson_complete(self.users[1], lesson)
+        with self.assertNumQueries(0):
+            ranking.leaderboard(self.course)
+        for callback in callbacks:
+            callback()
+        top = ranking.leaderboard(self.course)
+        self.assertEqual([entry['user__username'] for entry in top], ['aluno1', 'aluno3'])
+
+        self.client.force_login(self.users[2])
+        response = self.client.get('/cursos/python/ranking/')
+        self.assertContains(response, 'aluno1')
+        self.assertContains(response, 'à frente de 33% dos alunos')
+
+    def test_lesson_changes_keep_histogram_in_step(self):
+        lesson = Lesson.objects.create(name='Aula 5', number=5, course=self.course)
+        # 0%, 20%, 40% e 60%, já gravados: ler o progresso não recalcula nada
+        self.assertEqual(self.histogram(), [(0, 1), (4, 1), (8, 1), (12, 1)])
+        with self.assertNumQueries(1):
+            progress = ProgressManager.get_course_progress(self.users[3], self.course)
+        self.assertEqual(progress.progress_percentage, 60)
+        lesson.delete()
+        incremental = self.histogram()
+        self.assertEqual(incremental, [(0, 1), (5, 1), (10, 1), (15, 1)])
+        ranking.rebuild([self.course.pk])
+        self.assertEqual(self.histogram(), incremental)
+
+    def test_cancelled_enrollments_leave_the_ranking(self):
+        self.assertEqual(
+            [entry['user__username'] for entry in ranking.leaderboard(self.course)], ['aluno3', 'aluno2']
+        )
+        enrollment = Enrollment.objects.get(user=self.users[3])
+        enrollment.status = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment.save()
+        self.assertEqual(self.histogram(), [(0, 1), (5, 1), (10, 1)])
+        self.assertEqual(
+            [entry['user__username'] for entry in ranking.leaderboard(self.course)], ['aluno2', 'aluno1']
+        )
+        self.assertEqual(ranking.percentile(CourseProgress.objects.get(user=self.users[2])), 100)
+
+        enrollment.active()
+        self.assertEqual(self.histogram(), [(0, 1), (5, 1), (10, 1), (15, 1)])
+        enrollment.status = 2
+        enrollment.save()
+        # Apagar a matrícula cancelada não tira o aluno de novo
+        enrollment.delete()
+        self.assertEqual(self.histogram(), [(0, 1), (5, 1), (10, 1)])
+        ranking.rebuild([self.course.pk])
+        self.assertEqual(self.histogram(), [(0, 1), (5, 1), (10, 1)])
@@ -0,0 +1,305 @@
+"""
+Testes de orçamento de queries com dados em escala realista.
+
+Cada view de cursos/urls.py e accounts/urls.py é executada contra um cenário
+pequeno e um cenário grande (centenas de aulas, muitas matrículas e muitos
+certificados). O número de queries precisa ser exatamente o orçamento
+definido e não pode crescer com o volume de dados.
+
+Execute com: python manage.py test cursos.tests_performance
+"""
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.urls import reverse
+
+from cursos.models import (
+    Course, Lesson, Material, Enrollment, Announcement, Comment,
+    LessonProgress, CourseProgress, Certificate
+)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+SMALL = {'lessons': 3, 'students': 2, 'announcements': 2, 'comments': 2, 'extra_courses': 1}
+LARGE = {'lessons': 300, 'students': 200, 'announcements': 50, 'comments': 300, 'extra_courses': 30}
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryBudgetTests(TestCase):
+    """Orçamentos de queries das views em escala"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.password_hash = make_password('senha123')
+        cls.small = cls.build_scenario('pequeno', **SMALL)
+        cls.large = cls.build_scenario('grande', **LARGE)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def build_scenario(cls, prefix, lessons, students, announcements, comments, extra_courses):
+        """
+        Cria um curso com aulas, materiais, alunos com progresso variado,
+        certificados, anúncios e comentários. O aluno ``viewer`` também fica
+        matriculado (e certificado) em ``extra_courses`` outros cursos.
+        """
+        scenario = type('Scenario', (), {})()
+        course = Course.objects.create(name=f'Curso {prefix}', slug=f'curso-{prefix}')
+        Lesson.objects.bulk_create([
+            Lesson(name=f'Aula {i}', number=i, course=course) for i in range(1, lessons + 1)
+        ])
+        course_lessons = list(course.lessons.all())
+        Material.objects.bulk_create([
+            Material(name=f'Vídeo {lesson.number}', embedded='<iframe></iframe>', lesson=lesson)
+            for lesson in course_lessons
+        ])
+
+        users = User.objects.bulk_create([
+            User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=cls.password_hash)
+            for i in range(students)
+        ])
+        viewer = User.objects.create(
+            username=f'viewer-{prefix}', email=f'viewer-{prefix}@example.com',
+            password=cls.password_hash
+        )
+        users.append(viewer)
+        enrollments = Enrollment.objects.bulk_create([
+            Enrollment(user=user, course=course, status=1) for user in users
+        ])
+
+        lesson_progress = []
+        course_progress = []
+        for index, (user, enrollment) in enumerate(zip(users, enrollments)):
+            completed = lessons if index % 4 == 0 and user != viewer else index % lessons
+            if user == viewer:
+                completed = lessons - 2
+            lesson_progress.extend(
+                LessonProgress(user=user, lesson=lesson, completed=True)
+                for lesson in course_lessons[:completed]
+            )
+            course_progress.append(CourseProgress(
+                user=user, course=course, enrollment=enrollment,
+                completed_lessons=completed, total_lessons=lessons,
+                progress_percentage=completed * 100 / lessons,
+            ))
+        LessonProgress.objects.bulk_create(lesson_progress, batch_size=500)
+        course_progress = CourseProgress.objects.bulk_create(course_progress)
+        Certificate.objects.bulk_create([
+            Certificate(
+                user=progress.user, course=course, course_progress=progress,
+                certificate_number=f'{prefix.upper()}{progress.user_id:012d}'
+            )
+            for progress in course_progress if progress.progress_percentage >= 100
+        ])
+
+        for number in range(extra_courses):
+            extra = Course.objects.create(name=f'Extra {prefix} {number}', slug=f'extra-{prefix}-{number}')
+            extra_lesson = Lesson.objects.create(name='Aula única', number=1, course=extra)
+            enrollment = Enrollment.objects.create(user=viewer, course=extra, status=1)
+            LessonProgress.objects.create(user=viewer, lesson=extra_lesson, completed=True)
+            progress = CourseProgress.objects.create(
+                user=viewer, course=extra, enrollment=enrollment,
+                completed_lessons=1, total_lessons=1, progress_percentage=100.0
+            )
+            certificate = Certificate.objects.create(
+                user=viewer, course=extra, course_progress=progress,
+                certificate_number=f'X{prefix.upper()}{number:010d}'
+            )
+            certificate.certificate_file.save(
+                f'certificado_{prefix}_{number}.pdf', ContentFile(b'%PDF-1.4'), save=True
+            )
+
+        Announcement.objects.bulk_create([
+            Announcement(course=course, title=f'Anúncio {i}', content='Conteúdo')
+            for i in range(announcements)
+        ])
+        announcement = course.announcements.first()
+        Comment.objects.bulk_create([
+            Comment(announcement=announcement, user=users[i % len(users)], comment='Comentário')
+            for i in range(comments)
+        ])
+
+        scenario.course = course
+        scenario.viewer = viewer
+        scenario.lesson = course_lessons[-1]
+        scenario.completed_lesson = course_lessons[0]
+        scenario.material = scenario.lesson.materials.first()
+        scenario.announcement = announcement
+        scenario.extra_slug = f'extra-{prefix}-0'
+        return scenario
+
+    def setUp(self):
+        # A listagem de aulas fica em cache; cada teste parte do cache vazio
+        cache.clear()
+
+    def count_queries(self, scenario, method, url_name, kwargs=None, data=None, login=True):
+        """Executa uma requisição e retorna (queries, resposta)."""
+        self.client.logout()
+        if login:
+            self.client.force_login(scenario.viewer)
+        url = reverse(url_name, kwargs=kwargs(scenario) if kwargs else None)
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data or {})
+        return len(context), response
+
+    def assertQueryBudget(self, budget, url_name, kwargs=None, method='get', data=None,
+                          login=True, status=200):
+        """
+        Verifica que a view usa exatamente ``budget`` queries nos dois cenários.
+        """
+        small, response = self.count_queries(self.small, method, url_name, kwargs, data, login)
+        self.assertEqual(response.status_code, status, url_name)
+        large, response = self.count_queries(self.large, method, url_name, kwargs, data, login)
+        self.assertEqual(response.status_code, status, url_name)
+        self.assertEqual(
+            small, large,
+            f'{url_name}: queries crescem com os dados ({small} -> {large})'
+        )
+        self.assertEqual(large, budget, f'{url_name}: orçamento {budget}, executou {large}')
+
+    # cursos/urls.py
+
+    def test_index(self):
+        self.assertQueryBudget(1, 'cursos:index', login=False)
+        Course.objects.bulk_create([
+            Course(name=f'Novo {i}', slug=f'novo-{i}') for i in range(50)
+        ])
+        self.assertQueryBudget(1, 'cursos:index', login=False)
+
+    def test_index_search(self):
+        self.assertQueryBudget(1, 'cursos:index', data={'q': 'Curso'}, login=False)
+
+    def test_details(self):
+        self.assertQueryBudget(
+            6, 'cursos:details', lambda s: {'slug': s.course.slug}
+        )
+
+    def test_enrollment(self):
+        self.assertQueryBudget(
+            10, 'cursos:enrollment', lambda s: {'slug': s.course.slug}, status=302
+        )
+
+    def test_undo_enrollment(self):
+        self.assertQueryBudget(
+            8, 'cursos:undo_enrollment', lambda s: {'slug': s.course.slug}, status=302
+        )
+
+    def test_announcements(self):
+        self.assertQueryBudget(
+            6, 'cursos:announcements', lambda s: {'slug': s.course.slug}
+        )
+
+    def test_show_announcement(self):
+        self.assertQueryBudget(
+            7, 'cursos:show_announcement',
+            lambda s: {'slug': s.course.slug, 'pk': s.announcement.pk}
+        )
+
+    def test_lessons(self):
+        self.assertQueryBudget(
+            7, 'cursos:lessons', lambda s: {'slug': s.course.slug}
+        )
+        # Segunda visita: a listagem de aulas vem do cache
+        self.assertQueryBudget(
+            6, 'cursos:lessons', lambda s: {'slug': s.course.slug}
+        )
+
+    def test_leaderboard(self):
+        self.assertQueryBudget(
+            8, 'cursos:leaderboard', lambda s: {'slug': s.course.slug}
+        )
+        # Segunda visita: o ranking vem do cache
+        self.assertQueryBudget(
+            7, 'cursos:leaderboard', lambda s: {'slug': s.course.slug}
+        )
+
+    def test_lesson(self):
+        self.assertQueryBudget(
+            9, 'cursos:lesson', lambda s: {'slug': s.course.slug, 'pk': s.lesson.pk}
+        )
+
+    def test_material(self):
+        self.assertQueryBudget(
+            9, 'cursos:material', lambda s: {'slug': s.course.slug, 'pk': s.material.pk}
+        )
+
+    def test_mark_lesson_complete(self):
+        self.assertQueryBudget(
+            19, 'cursos:mark_lesson_complete',
+            lambda s: {'slug': s.course.slug, 'lesson_id': s.lesson.pk}, method='post',
+        )
+
+    def test_mark_lesson_incomplete(self):
+        self.assertQueryBudget(
+            16, 'cursos:mark_lesson_incomplete',
+            lambda s: {'slug': s.course.slug, 'lesson_id': s.completed_lesson.pk}, method='post',
+        )
+
+    def test_course_progress(self):
+        self.assertQueryBudget(
+            6, 'cursos:course_progress', lambda s: {'slug': s.course.slug}
+        )
+
+    def test_download_certificate(self):
+        self.assertQueryBudget(
+            3, 'cursos:download_certificate', lambda s: {'slug': s.extra_slug}
+        )
+
+    def test_my_certificates(self):
+        self.assertQueryBudget(5, 'cursos:my_certificates')
+
+    def test_dashboard(self):
+        self.assertQueryBudget(4, 'cursos:dashboard')
+
+    def test_progress_summary(self):
+        self.assertQueryBudget(3, 'cursos:progress_summary')
+
+    # accounts/urls.py
+
+    def test_accounts_dashboard(self):
+        self.assertQueryBudget(3, 'accounts:dashboard')
+
+    def test_accounts_login(self):
+        self.assertQueryBudget(0, 'accounts:login', login=False)
+
+    def test_accounts_logout(self):
+        self.assertQueryBudget(4, 'accounts:logout', method='post', status=302)
+
+    def test_accounts_register(self):
+        self.assertQueryBudget(0, 'accounts:register', login=False)
+
+    def test_accounts_edit(self):
+        self.assertQueryBudget(3, 'accounts:edit')
+
+    def test_accounts_edit_password(self):
+        self.assertQueryBudget(3, 'accounts:edit_password')
+
+    # admin (changelists das tabelas grandes)
+
+    def assertAdminBudget(self, budget, url_name, data=None):
+        User.objects.filter(pk__in=[self.small.viewer.pk, self.large.viewer.pk]).update(
+            is_staff=True, is_superuser=True
+        )
+        self.assertQueryBudget(budget, url_name, data=data)
+
+    def test_admin_lesson_progress(self):
+        self.assertAdminBudget(6, 'admin:cursos_lessonprogress_changelist')
+
+    def test_admin_course_progress(self):
+        self.assertAdminBudget(6, 'admin:cursos_courseprogress_changelist')
+
+    def test_admin_course_progress_search(self):
+        self.assertAdminBudget(6, 'admin:cursos_courseprogress_changelist', {'q': 'viewer'})
+
+    def test_admin_certificate(self):
+        self.assertAdminBudget(6, 'admin:cursos_certificate_changelist')
@@ -1,10 +1,26 @@
+from django.conf import settings
 from django.urls import path
 from cursos import views
 
 app_name = 'cursos'
 
+# Em deploy ASGI as views de progresso rodam nativamente no event loop
+if getattr(settings, 'ASYNC_PROGRESS_VIEWS', False):
+    progress_views = (views.amark_lesson_complete, views.amark_lesson_incomplete, views.aget_course_progress)
+else:
+    progress_views = (views.mark_lesson_complete, views.mark_lesson_incomplete, views.get_course_progress)
+
 urlpatterns = [
     path('', views.index, name='index'),
+    path('meus-certificados/', views.my_certificates, name='my_certificates'),
+    path('painel/', views.dashboard, name='dashboard'),
+    path('exportar-progresso/', views.export_progress, name='export_progress'),
+    path('importar-matriculas/', views.import_enrollments, name='import_enrollments'),
+    path('exportar-catalogo/', views.export_catalog, name='export_catalog'),
+    path('anuncios/feed/', views.announcements_feed, name='announcements_feed'),
+    path('progresso/resumo/', views.progress_summary_view, name='progress_summary'),
+    path('atividade/', views.lesson_activity, name='lesson_activity'),
+    path('progresso/eventos/', views.progress_events, name='progress_events'),
     path('<slug:slug>/', views.details, name='details'),
     path('<slug:slug>/inscricao/', views.enrollment, name='enrollment'),
     path('<slug:slug>/cancelar-inscricao/', views.undo_enrollment, name='undo_enrollment'),
@@ -12,12 +28,14 @@ urlpatterns = [
     path('<slug:slug>/anuncios/<int:pk>/', views.show_announcement, name='show_announcement'),
     path('<slug:slug>/aulas/', views.lessons, name='lessons'),
     path('<slug:slug>/aulas/<int:pk>/', views.lesson, name='lesson'),
+    path('<slug:slug>/ranking/', views.leaderboard, name='leaderboard'),
+    path('<slug:slug>/estatisticas/', views.course_analytics, name='analytics'),
+    path('<slug:slug>/aulas/reordenar/', views.reorder_course_lessons, name='reorder_lessons'),
     path('<slug:slug>/materiais/<int:pk>/', views.material, name='material'),
     
     # Rotas de Progresso e Certificado
-    path('<slug:slug>/aulas/<int:lesson_id>/completar/', views.mark_lesson_complete, name='mark_lesson_complete'),
-    path('<slug:slug>/aulas/<int:lesson_id>/descompletar/', views.mark_lesson_incomplete, name='mark_lesson_incomplete'),
-    path('<slug:slug>/progresso/', views.get_course_progress, name='course_progress'),
+    path('<slug:slug>/aulas/<int:lesson_id>/completar/', progress_views[0], name='mark_lesson_complete'),
+    path('<slug:slug>/aulas/<int:lesson_id>/descompletar/', progress_views[1], name='mark_lesson_incomplete'),
+    path('<slug:slug>/progresso/', progress_views[2], name='course_progress'),
     path('<slug:slug>/certificado/download/', views.download_certificate, name='download_certificate'),
-    path('meus-certificados/', views.my_certificates, name='my_certificates'),
 ]
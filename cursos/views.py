@@ -1,17 +1,31 @@
 """
 Views para gerenciar cursos, aulas, progresso e certificados.
 """
+import csv
+import json
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, FileResponse, Http404
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, FileResponse, Http404, HttpResponseNotAllowed, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
-from django.db.models import Q
+from django.db.models import Q, Count
 from django.urls import reverse
 from django.contrib import messages
 
 from .models import Course, Lesson, Material, Enrollment, Announcement, Comment, CourseProgress, LessonProgress, Certificate
 from .progress import ProgressManager, CertificateManager
-from .forms import CommentForm
+from . import activity, catalog, events, export, ranking, stats
+from core.http import make_etag, conditional_response, set_validators
+from .comments import comments_page
+from .feed import FEED_LIMIT, MAX_FEED_LIMIT, feed_page, feed_state
+from .lessons import LessonOrderError, get_course_lessons, reorder_lessons
+from .summary import SummaryFieldError, parse_fields, progress_summary
+from .forms import CommentForm, EnrollmentImportForm
+from .enrollment_import import EnrollmentImporter, decode_upload
 
 
 def index(request):
@@ -25,6 +39,7 @@ def index(request):
     query = request.GET.get('q', '')
     if query:
         courses = Course.objects.search(query)
+    courses = courses.annotate(lessons_count=Count('lessons'))
     
     context = {
         'courses': courses,
@@ -54,6 +69,8 @@ def details(request, slug):
         'course': course,
         'enrolled': enrolled,
         'progress': progress,
+        # Lido do histograma de progresso do curso (cursos/ranking.py)
+        'percentile': ranking.percentile(progress) if enrolled and progress else None,
     }
     return render(request, template_name, context)
 
@@ -131,7 +148,7 @@ def show_announcement(request, slug, pk):
     """
     Exibe detalhes de um anúncio específico.
     """
-    template_name = 'courses/announcement_detail.html'
+    template_name = 'courses/show_announcement.html'
     course = get_object_or_404(Course, slug=slug)
     announcement = get_object_or_404(Announcement, pk=pk, course=course)
     enrolled = False
@@ -152,18 +169,51 @@ def show_announcement(request, slug, pk):
             messages.success(request, 'Comentário adicionado com sucesso!')
             return redirect('cursos:show_announcement', slug=slug, pk=pk)
     
-    comments = announcement.comments.all()
+    comments, next_cursor = comments_page(announcement, request.GET.get('depois'))
     
     context = {
         'course': course,
         'announcement': announcement,
         'comments': comments,
+        'next_cursor': next_cursor,
         'form': form,
         'enrolled': enrolled,
     }
     return render(request, template_name, context)
 
 
+@login_required
+def announcements_feed(request):
+    """
+    API JSON com os anúncios de todos os cursos do aluno, alterados depois do
+    cursor ``since``. Aceita If-None-Match/If-Modified-Since: sem novidades
+    responde 304 sem consultar a lista.
+    """
+    since = request.GET.get('since') or None
+    try:
+        limit = min(max(int(request.GET.get('limit', FEED_LIMIT)), 1), MAX_FEED_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit inválido'}, status=400)
+
+    last_modified, total, enrolled_at = feed_state(request.user)
+    etag = make_etag(
+        request.user.pk, last_modified and last_modified.isoformat(), total,
+        enrolled_at and enrolled_at.isoformat(), since, limit,
+    )
+    not_modified = conditional_response(request, etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    items, cursor, has_more, reset = feed_page(request.user, since, limit, enrolled_at)
+    response = JsonResponse({
+        'announcements': items,
+        'cursor': cursor,
+        'has_more': has_more,
+        'reset': reset,
+    })
+    return set_validators(response, etag, last_modified)
+
+
 @login_required
 def lessons(request, slug):
     """
@@ -185,7 +235,7 @@ def lessons(request, slug):
         messages.error(request, 'Você precisa estar matriculado neste curso para acessar as aulas.')
         return redirect('cursos:details', slug=slug)
     
-    lessons = course.lessons.all()
+    lessons = get_course_lessons(course)
     
     context = {
         'course': course,
@@ -195,6 +245,36 @@ def lessons(request, slug):
     return render(request, template_name, context)
 
 
+@login_required
+def leaderboard(request, slug):
+    """
+    Ranking dos alunos mais adiantados no curso (em cache) e a posição do aluno.
+    """
+    template_name = 'courses/leaderboard.html'
+    course = get_object_or_404(Course, slug=slug)
+    enrolled = False
+    progress = None
+
+    try:
+        enrollment = Enrollment.objects.get(user=request.user, course=course)
+        enrolled = enrollment.is_approved()
+        progress = ProgressManager.get_course_progress(request.user, course)
+    except Enrollment.DoesNotExist:
+        pass
+
+    if not enrolled:
+        messages.error(request, 'Você precisa estar matriculado neste curso para ver o ranking.')
+        return redirect('cursos:details', slug=slug)
+
+    context = {
+        'course': course,
+        'leaderboard': ranking.leaderboard(course),
+        'progress': progress,
+        'percentile': ranking.percentile(progress) if progress else None,
+    }
+    return render(request, template_name, context)
+
+
 @login_required
 def lesson(request, slug, pk):
     """
@@ -268,6 +348,56 @@ def material(request, slug, pk):
 # VIEWS AJAX/API para Progresso
 
 
+def _lesson_progress_data(lesson_progress):
+    return {
+        'completed': lesson_progress.completed if lesson_progress else False,
+        'completed_at': lesson_progress.completed_at.isoformat() if lesson_progress and lesson_progress.completed_at else None,
+    }
+
+
+def _course_progress_data(course_progress):
+    return {
+        'completed_lessons': course_progress.completed_lessons,
+        'total_lessons': course_progress.total_lessons,
+        'progress_percentage': course_progress.progress_percentage,
+        'completed': course_progress.completed_at is not None,
+        'last_lesson_id': course_progress.last_lesson_id,
+        'next_lesson_id': course_progress.next_lesson_id,
+    }
+
+
+def _certificate_data(certificate, course_progress):
+    if not certificate and course_progress.progress_percentage < 100:
+        return None
+    return {
+        'generated': certificate is not None,
+        'certificate_number': certificate.certificate_number if certificate else None,
+    }
+
+
+async def _auser(request):
+    """Usuário autenticado (ou ``None``) sem tocar no banco dentro do event loop."""
+    return await sync_to_async(
+        lambda: request.user if request.user.is_authenticated else None
+    )()
+
+
+async def _aenrollment_error(user, course):
+    """Resposta 403 se o aluno não tiver matrícula aprovada no curso."""
+    enrollment = await Enrollment.objects.filter(user=user, course=course).afirst()
+    if enrollment is None or not enrollment.is_approved():
+        return JsonResponse({'error': 'Não autorizado'}, status=403)
+    return None
+
+
+async def _aget_lesson(slug, lesson_id):
+    try:
+        course = await Course.objects.aget(slug=slug)
+        return await Lesson.objects.select_related('course').aget(pk=lesson_id, course=course)
+    except (Course.DoesNotExist, Lesson.DoesNotExist):
+        raise Http404
+
+
 @login_required
 @require_http_methods(["POST"])
 def mark_lesson_complete(request, slug, lesson_id):
@@ -289,10 +419,8 @@ def mark_lesson_complete(request, slug, lesson_id):
     # Marcar aula como completa
     lesson_progress = ProgressManager.mark_lesson_complete(request.user, lesson)
     
-    # Atualizar progresso do curso
+    # Progresso do curso já atualizado por ProgressManager
     course_progress = ProgressManager.get_course_progress(request.user, course)
-    course_progress.calculate_progress()
-    course_progress.save()
     
     # Verificar se curso foi completado e gerar certificado
     certificate = None
@@ -301,20 +429,40 @@ def mark_lesson_complete(request, slug, lesson_id):
     
     return JsonResponse({
         'success': True,
-        'lesson_progress': {
-            'completed': lesson_progress.completed,
-            'completed_at': lesson_progress.completed_at.isoformat() if lesson_progress.completed_at else None,
-        },
-        'course_progress': {
-            'completed_lessons': course_progress.completed_lessons,
-            'total_lessons': course_progress.total_lessons,
-            'progress_percentage': course_progress.progress_percentage,
-            'completed': course_progress.completed_at is not None,
-        },
-        'certificate': {
-            'generated': certificate is not None,
-            'certificate_number': certificate.certificate_number if certificate else None,
-        } if certificate or course_progress.progress_percentage >= 100 else None,
+        'lesson_progress': _lesson_progress_data(lesson_progress),
+        'course_progress': _course_progress_data(course_progress),
+        'certificate': _certificate_data(certificate, course_progress),
+    })
+
+
+async def amark_lesson_complete(request, slug, lesson_id):
+    """
+    Versão assíncrona de ``mark_lesson_complete`` para deploy ASGI
+    (``ASYNC_PROGRESS_VIEWS``): async ORM e PDF do certificado em um executor.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    user = await _auser(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    lesson = await _aget_lesson(slug, lesson_id)
+    error = await _aenrollment_error(user, lesson.course)
+    if error:
+        return error
+
+    lesson_progress = await ProgressManager.amark_lesson_complete(user, lesson)
+    course_progress = await ProgressManager.aupdate_course_progress(user, lesson.course, lesson)
+    if course_progress is None:
+        return JsonResponse({'error': 'Progresso não encontrado'}, status=404)
+    certificate = await CertificateManager.acheck_and_generate_certificate(
+        user, lesson.course, course_progress
+    )
+
+    return JsonResponse({
+        'success': True,
+        'lesson_progress': _lesson_progress_data(lesson_progress),
+        'course_progress': _course_progress_data(course_progress),
+        'certificate': _certificate_data(certificate, course_progress),
     })
 
 
@@ -339,32 +487,84 @@ def mark_lesson_incomplete(request, slug, lesson_id):
     # Marcar aula como não completa
     lesson_progress = ProgressManager.mark_lesson_incomplete(request.user, lesson)
     
-    # Atualizar progresso do curso
+    # Progresso do curso já atualizado por ProgressManager
     course_progress = ProgressManager.get_course_progress(request.user, course)
-    course_progress.calculate_progress()
-    course_progress.save()
     
     return JsonResponse({
         'success': True,
-        'lesson_progress': {
-            'completed': lesson_progress.completed if lesson_progress else False,
-            'completed_at': lesson_progress.completed_at.isoformat() if lesson_progress and lesson_progress.completed_at else None,
-        },
-        'course_progress': {
-            'completed_lessons': course_progress.completed_lessons,
-            'total_lessons': course_progress.total_lessons,
-            'progress_percentage': course_progress.progress_percentage,
-            'completed': course_progress.completed_at is not None,
-        },
+        'lesson_progress': _lesson_progress_data(lesson_progress),
+        'course_progress': _course_progress_data(course_progress),
+    })
+
+
+async def amark_lesson_incomplete(request, slug, lesson_id):
+    """Versão assíncrona de ``mark_lesson_incomplete`` (ver ``amark_lesson_complete``)."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    user = await _auser(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    lesson = await _aget_lesson(slug, lesson_id)
+    error = await _aenrollment_error(user, lesson.course)
+    if error:
+        return error
+
+    lesson_progress = await ProgressManager.amark_lesson_incomplete(user, lesson)
+    course_progress = await ProgressManager.aupdate_course_progress(user, lesson.course, lesson)
+    if course_progress is None:
+        return JsonResponse({'error': 'Progresso não encontrado'}, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'lesson_progress': _lesson_progress_data(lesson_progress),
+        'course_progress': _course_progress_data(course_progress),
     })
 
 
+def _progress_etag(pk, updated_at, completed_lessons, total_lessons, percentage, completed_at, lessons_version):
+    return make_etag(
+        pk, updated_at.isoformat(), completed_lessons, total_lessons, percentage,
+        completed_at and completed_at.isoformat(), lessons_version.isoformat(),
+    )
+
+
+def _progress_state_etag(state):
+    etag = _progress_etag(
+        state['pk'], state['updated_at'], state['completed_lessons'], state['total_lessons'],
+        state['progress_percentage'], state['completed_at'], state['course__updated_at'],
+    )
+    return etag, max(state['updated_at'], state['course__updated_at'])
+
+
+def _progress_response(progress, course):
+    response = JsonResponse({
+        'success': True,
+        'course_progress': dict(
+            _course_progress_data(progress),
+            completed_at=progress.completed_at.isoformat() if progress.completed_at else None,
+        ),
+    })
+    # Validadores do estado recém-gravado: a próxima consulta igual recebe 304
+    etag = _progress_etag(
+        progress.pk, progress.updated_at, progress.completed_lessons, progress.total_lessons,
+        progress.progress_percentage, progress.completed_at, course.updated_at,
+    )
+    return set_validators(response, etag, max(progress.updated_at, course.updated_at))
+
+
 @login_required
 def get_course_progress(request, slug):
     """
     API endpoint para obter o progresso atual do usuário em um curso.
-    Retorna JSON.
+    Retorna JSON. Com If-None-Match/If-Modified-Since responde 304 a partir
+    do progresso gravado, sem recalcular.
     """
+    state = ProgressManager.get_progress_state(request.user, slug)
+    if state is not None:
+        not_modified = conditional_response(request, *_progress_state_etag(state))
+        if not_modified:
+            return not_modified
+
     course = get_object_or_404(Course, slug=slug)
     
     # Verificar se usuário está inscrito
@@ -376,18 +576,89 @@ def get_course_progress(request, slug):
         return JsonResponse({'error': 'Não autorizado'}, status=403)
     
     progress = ProgressManager.get_course_progress(request.user, course)
-    progress.calculate_progress()
-    
-    return JsonResponse({
-        'success': True,
-        'course_progress': {
-            'completed_lessons': progress.completed_lessons,
-            'total_lessons': progress.total_lessons,
-            'progress_percentage': progress.progress_percentage,
-            'completed': progress.completed_at is not None,
-            'completed_at': progress.completed_at.isoformat() if progress.completed_at else None,
-        },
-    })
+    return _progress_response(progress, course)
+
+
+async def aget_course_progress(request, slug):
+    """Versão assíncrona de ``get_course_progress`` (ver ``amark_lesson_complete``)."""
+    user = await _auser(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    state = await ProgressManager.aget_progress_state(user, slug)
+    if state is not None:
+        not_modified = conditional_response(request, *_progress_state_etag(state))
+        if not_modified:
+            return not_modified
+
+    try:
+        course = await Course.objects.aget(slug=slug)
+    except Course.DoesNotExist:
+        raise Http404
+    error = await _aenrollment_error(user, course)
+    if error:
+        return error
+    progress = await ProgressManager.aget_course_progress(user, course)
+    if progress is None:
+        return JsonResponse({'error': 'Progresso não encontrado'}, status=404)
+    return _progress_response(progress, course)
+
+
+@login_required
+def progress_summary_view(request):
+    """
+    API JSON com progresso, certificado e próxima aula de todos os cursos do
+    aluno em um número fixo de queries. ``?fields=progress,next_lesson``
+    limita as chaves de cada curso.
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except SummaryFieldError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(
+        {'courses': progress_summary(request.user, fields)},
+        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False},
+    )
+
+
+async def progress_events(request):
+    """
+    Stream SSE com os eventos de progresso e de certificado pronto de todos
+    os cursos do aluno. Deve ser servido pela aplicação ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Sob WSGI o gerador assíncrono seria consumido inteiro antes da
+        # resposta sair, prendendo o worker até o timeout do stream
+        return JsonResponse({'error': 'Eventos disponíveis só na aplicação ASGI'}, status=501)
+    user = await _auser(request)
+    if user is None:
+        return JsonResponse({'error': 'Não autenticado'}, status=401)
+    response = StreamingHttpResponse(
+        events.event_stream(user.pk), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Desliga o buffer do nginx para os eventos saírem na hora
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@require_http_methods(['POST'])
+def lesson_activity(request):
+    """
+    Recebe um lote de heartbeats das páginas de aula e material. Os segundos
+    são somados em memória e gravados em lote depois (ver cursos/activity.py);
+    a resposta diz quantos heartbeats foram aceitos.
+    """
+    try:
+        beats = activity.parse_heartbeats(json.loads(request.body))
+    except ValueError as e:
+        message = str(e) if isinstance(e, activity.HeartbeatError) else 'JSON inválido'
+        return JsonResponse({'error': message}, status=400)
+
+    courses = activity.allowed_lessons(request.user, [beat[0] for beat in beats]) if beats else {}
+    accepted = activity.buffer.add(request.user.pk, beats, courses)
+    activity.buffer.maybe_flush()
+    return JsonResponse({'accepted': accepted}, status=202)
 
 
 @login_required
@@ -397,12 +668,9 @@ def dashboard(request):
     """
     template_name = 'accounts/dashboard.html'
     
+    # Certificados já vêm carregados junto com o progresso (select_related)
     user_progress = ProgressManager.get_user_courses_progress(request.user)
     
-    # Adicionar certificados
-    for progress in user_progress:
-        progress.certificate = CertificateManager.get_certificate(request.user, progress.course)
-    
     context = {
         'user_progress': user_progress,
     }
@@ -412,20 +680,44 @@ def dashboard(request):
 @login_required
 def download_certificate(request, slug):
     """
-    Download do certificado em PDF.
+    Download do certificado em PDF. O PDF não muda depois de gerado, então
+    If-None-Match/If-Modified-Since recebem 304 sem abrir o arquivo.
     """
+    state = CertificateManager.get_certificate_state(request.user, slug)
+    if state and state['certificate_file']:
+        etag = make_etag(state['certificate_number'], state['certificate_file'])
+        not_modified = conditional_response(request, etag, state['issued_at'])
+        if not_modified:
+            return not_modified
+        # PDF já gerado: serve direto do estado, sem buscar curso e certificado de novo
+        storage = Certificate._meta.get_field('certificate_file').storage
+        response = FileResponse(
+            storage.open(state['certificate_file'], 'rb'),
+            content_type='application/pdf',
+            as_attachment=True,
+            filename=f'certificado_{state["certificate_number"]}.pdf'
+        )
+        return set_validators(response, etag, state['issued_at'])
+
     course = get_object_or_404(Course, slug=slug)
     certificate = get_object_or_404(Certificate, user=request.user, course=course)
     
+    if not certificate.certificate_file:
+        # Certificados emitidos em lote (admin) têm o PDF gerado no primeiro download
+        CertificateManager.save_certificate_file(certificate)
     if not certificate.certificate_file:
         raise Http404("Certificado não disponível para download.")
     
-    return FileResponse(
+    response = FileResponse(
         certificate.certificate_file.open('rb'),
         content_type='application/pdf',
         as_attachment=True,
         filename=f'certificado_{certificate.certificate_number}.pdf'
     )
+    return set_validators(
+        response, make_etag(certificate.certificate_number, certificate.certificate_file.name),
+        certificate.issued_at
+    )
 
 
 @login_required
@@ -435,9 +727,121 @@ def my_certificates(request):
     """
     template_name = 'accounts/my_certificates.html'
     
+    state = CertificateManager.get_certificates_state(request.user)
+    etag = make_etag(request.user.pk, request.user.get_username(), *(
+        value.isoformat() if hasattr(value, 'isoformat') else value for value in state.values()
+    ))
+    not_modified = conditional_response(request, etag)
+    if not_modified:
+        return not_modified
+
     certificates = Certificate.objects.filter(user=request.user).select_related('course')
     
     context = {
         'certificates': certificates,
     }
+    return set_validators(render(request, template_name, context), etag)
+
+
+@staff_member_required
+def export_progress(request):
+    """
+    Exporta em streaming o progresso dos alunos (somente staff).
+    Parâmetros: ``tipo`` (cursos ou aulas), ``formato`` (csv ou ndjson) e
+    ``curso`` (slug, pode se repetir; sem ele exporta todos os cursos).
+    """
+    kind = request.GET.get('tipo', 'cursos')
+    fmt = request.GET.get('formato', 'csv')
+    if kind not in export.KINDS or fmt not in export.FORMATS:
+        raise Http404('Tipo ou formato de exportação inválido')
+
+    courses = None
+    slugs = request.GET.getlist('curso')
+    if slugs:
+        courses = Course.objects.filter(slug__in=slugs)
+    filename = 'progresso-%s-%s.%s' % (kind, '-'.join(slugs) or 'todos', fmt)
+    return export.streaming_response(request, kind, fmt, courses, filename=filename)
+
+
+@staff_member_required
+def import_enrollments(request):
+    """
+    Importa matrículas em lote a partir de um CSV enviado (somente staff).
+    """
+    template_name = 'courses/import_enrollments.html'
+    result = None
+    if request.method == 'POST':
+        form = EnrollmentImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            importer = EnrollmentImporter(course=form.cleaned_data['course'])
+            try:
+                result = importer.run(decode_upload(request.FILES['file']))
+            except UnicodeDecodeError:
+                form.add_error('file', 'O arquivo precisa estar em UTF-8')
+            except csv.Error as e:
+                form.add_error('file', 'CSV inválido: %s' % e)
+    else:
+        form = EnrollmentImportForm()
+
+    context = {
+        'form': form,
+        'result': result,
+    }
     return render(request, template_name, context)
+
+
+@staff_member_required
+def export_catalog(request):
+    """
+    Exporta em streaming cursos, aulas e materiais (somente staff).
+    Parâmetros: ``formato`` (json ou ndjson) e ``curso`` (slug, pode se repetir).
+    """
+    fmt = request.GET.get('formato', 'json')
+    if fmt not in catalog.FORMATS:
+        raise Http404('Formato de exportação inválido')
+    response = StreamingHttpResponse(
+        catalog.export_lines(fmt, request.GET.getlist('curso')), content_type=catalog.FORMATS[fmt]
+    )
+    response['Content-Disposition'] = 'attachment; filename="catalogo.%s"' % fmt
+    return response
+
+
+@staff_member_required
+def course_analytics(request, slug):
+    """
+    Funil de conclusão do curso para instrutores (somente staff). Lê apenas
+    as tabelas de estatísticas mantidas em cursos/stats.py.
+    """
+    template_name = 'courses/analytics.html'
+    course = get_object_or_404(Course, slug=slug)
+    context = {
+        'course': course,
+        'analytics': stats.course_analytics(course),
+    }
+    return render(request, template_name, context)
+
+
+@staff_member_required
+@require_http_methods(['POST'])
+def reorder_course_lessons(request, slug):
+    """
+    Reordena todas as aulas de um curso de uma vez (somente staff).
+    Corpo JSON ``{"order": [id, id, ...]}`` ou campo ``order`` com os ids
+    separados por vírgula, na nova ordem.
+    """
+    course = get_object_or_404(Course, slug=slug)
+    try:
+        if request.content_type == 'application/json':
+            order = json.loads(request.body)['order']
+        else:
+            order = [pk for pk in request.POST.get('order', '').split(',') if pk.strip()]
+        updated = reorder_lessons(course, order)
+    except (ValueError, KeyError, TypeError) as e:
+        message = str(e) if isinstance(e, LessonOrderError) else 'Ordem inválida'
+        return JsonResponse({'error': message}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'updated': updated,
+        'order': list(course.lessons.values_list('pk', flat=True)),
+    })
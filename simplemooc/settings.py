@@ -40,15 +40,18 @@ INSTALLED_APPS = [
 
     'core',
     'cursos',
-    'accounts'
+    'accounts',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.RequestProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -146,3 +149,112 @@ LOGIN_REDIRECT_URL = 'home'
 LOGOUT_URL = 'accounts:logout'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Grava var/ dos testes em um diretório temporário (core.test_runner)
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Instrumentação por requisição (core.middleware.RequestInstrumentationMiddleware)
+INSTRUMENTATION = {
+    'ENABLED': True,
+    'LOG_SAMPLE_RATE': 0.1,
+    'SLOWEST_QUERIES': 5,
+    'QUERY_BUDGETS': {
+        'cursos:index': 5,
+        'cursos:details': 10,
+        'cursos:lessons': 12,
+        'cursos:lesson': 15,
+        'cursos:mark_lesson_complete': 30,
+        'cursos:mark_lesson_incomplete': 25,
+        'cursos:dashboard': 8,
+    },
+    'STATS_DIR': BASE_DIR / 'var' / 'instrumentation',
+    'FLUSH_INTERVAL': 10,
+}
+
+# Perfilamento sob demanda (core.middleware.RequestProfilingMiddleware)
+# Gere um token com: python manage.py profile_token [--memory]
+PROFILING = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.0,
+    'OUTPUT_DIR': BASE_DIR / 'var' / 'profiles',
+    'TOKEN_MAX_AGE': 3600,
+    'TOP_FUNCTIONS': 30,
+}
+
+# Métricas Prometheus em /metrics (core.metrics); cada processo grava seus
+# valores em DIR e o endpoint soma todos, inclusive com vários workers
+METRICS = {
+    'ENABLED': True,
+    'DIR': BASE_DIR / 'var' / 'metrics',
+    'FLUSH_INTERVAL': 1.0,
+    # Configure o scrape com bearer_token igual a SIMPLEMOOC_METRICS_TOKEN
+    'TOKEN': os.environ.get('SIMPLEMOOC_METRICS_TOKEN'),
+    # Só libere IPs se o servidor não estiver atrás de um proxy local
+    'ALLOWED_IPS': [],
+}
+
+# Log de queries lentas com EXPLAIN (core.slowqueries)
+# Liste as piores com: python manage.py slow_queries
+SLOW_QUERIES = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 100,
+    'LOG_FILE': BASE_DIR / 'var' / 'slow_queries.jsonl',
+    'EXPLAIN': True,
+    'STACK_APPS': ['cursos', 'accounts', 'core'],
+}
+
+# Fila de e-mails (core.mail); envie com: python manage.py send_queued_mail
+MAIL_QUEUE = {
+    'ENABLED': True,
+    'BATCH_SIZE': 50,
+    'RATE_LIMIT': 10,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 60,
+}
+
+# Views de progresso assíncronas (ative só em deploy ASGI, ex.: uvicorn)
+ASYNC_PROGRESS_VIEWS = os.environ.get('SIMPLEMOOC_ASYNC_PROGRESS_VIEWS') == '1'
+# Threads que renderizam PDFs de certificado para as views assíncronas
+CERTIFICATE_PDF_WORKERS = 2
+
+# Stream SSE de progresso (cursos/events.py)
+PROGRESS_EVENTS = {
+    'QUEUE_SIZE': 100,
+    'HEARTBEAT': 15,
+    'STREAM_TIMEOUT': 300,
+    'RETRY': 3000,
+}
+
+# Tempo de estudo nas aulas (cursos.activity): heartbeats somados em memória
+# e gravados em lote a cada FLUSH_INTERVAL segundos
+LESSON_ACTIVITY = {
+    'HEARTBEAT_SECONDS': 15,
+    'MAX_BATCH': 200,
+    'MAX_AGE': 3600,
+    'FLUSH_INTERVAL': 10,
+    'MAX_PENDING': 10000,
+}
+
+# Ranking dos cursos (cursos.ranking): top-N em cache, invalidado só por
+# mudanças que podem alterá-lo
+COURSE_RANKING = {
+    'LEADERBOARD_SIZE': 10,
+    'LEADERBOARD_TIMEOUT': 60 * 60,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'simplemooc': {
+            'handlers': ['console'],
+            'level': os.environ.get('SIMPLEMOOC_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -19,16 +19,20 @@ from django.conf import settings
 from django.conf.urls.static import static
 from core import views as core_views
 from django.contrib.auth import views as auth_views
+from accounts.forms import QueuedPasswordResetForm
 
 urlpatterns = [
     path('', core_views.home, name='home'),
     path('conta/', include('accounts.urls', namespace='accounts')),
     path('contato/', core_views.contact, name= 'contato'),
+    path('instrumentacao/', core_views.request_stats, name='request_stats'),
+    path('metrics', core_views.metrics_view, name='metrics'),
     path('cursos/', include('cursos.urls', namespace='cursos')),
     
     path('password_reset/', auth_views.PasswordResetView.as_view(
         template_name='accounts/password_reset.html',
-        email_template_name='accounts/password_reset_email.html',
+        form_class=QueuedPasswordResetForm,
+        email_template_name='accounts/password_reset_mail.html',
         subject_template_name='accounts/password_reset_subject.txt'
     ), name='password_reset'),
     path('password_reset_done/', auth_views.PasswordResetDoneView.as_view(